@@ -1,9 +1,22 @@
-import getopt, sys, sqlite3, re, datetime, os, argparse
-
-
-from src.pronoun import PronounCollection
-from src.constants import DEFAULT_DATABASE_FILE, OUTPUT_DIRECTORY, SOCIAL_PRONOUNS
-from src.regexes import NEGATION_REGEX, AFFIRMATION_REGEX, PROFANITY_REGEX, EMOJI_REGEX
+import getopt, sys, sqlite3, re, datetime, os, argparse, io
+
+
+from src.approx import DEFAULT_SAMPLE_SIZE, DEFAULT_SKETCH_SIZE, Preview
+from src.cache import ResultCache
+from src.client import RemoteCollection, ServiceClient
+from src.database import connect_read_only
+from src.incremental import IncrementalStore
+from src.pronoun import PronounCollection, scan_pronouns
+from src.profiler import Profiler, get_sidecar_file
+from src.query import RowFilter, parse_date
+from src.series import BUCKETS, SeriesStore
+from src.service import DEFAULT_ADDRESS
+from src.shards import ShardedCollection, expand_databases
+from src.snapshot import export_snapshot, load_snapshot
+from src.constants import DEFAULT_DATABASE_FILE, OUTPUT_DIRECTORY, SOCIAL_PRONOUNS, DEFAULT_BATCH_SIZE, DEFAULT_CACHE_SIZE
+from src.regexes import NEGATION_REGEX, AFFIRMATION_REGEX, PROFANITY_REGEX, EMOJI_REGEX, PERSONAL_PRONOUN_REGEX
+from src.report import TableWriter
+from src.scanner import CATEGORY_PATTERNS
 
 def get_cleaned_message(message):
     """
@@ -27,11 +40,13 @@ def get_highlighted_message(message, pattern):
     Args:
         message (str): The input message string to search for matches.
         pattern (str or Pattern): The regular expression pattern to search for in the message.
+            A string is compiled with re.VERBOSE and re.IGNORECASE; a compiled pattern is used as it is.
 
     Returns:
         str: The message with all matches wrapped in <mark> tags for highlighting.
     """
-    pattern = re.compile(pattern, flags= re.VERBOSE | re.IGNORECASE)
+    if not isinstance(pattern, re.Pattern):
+        pattern = re.compile(pattern, flags= re.VERBOSE | re.IGNORECASE)
 
     def wrap_in_mark(match):
         value = match.group()
@@ -77,112 +92,473 @@ def get_table_columns(column_names):
 
     return table_headers + table_body_start
 
+def write_usage_table(file, rows, title, regex):
+    """Writes a table of the date and highlighted message of each row, one row at a time
+
+    Args:
+        file (TextIOWrapper): file to write to
+        rows (iterable): rows from the database; a generator is read as it goes
+        title (str): the table's heading
+        regex (str or Pattern): the pattern to highlight
+
+    Returns:
+        int: how many rows were written
+    """
+    pattern = regex
+    if not isinstance(pattern, re.Pattern):
+        pattern = re.compile(regex, flags= re.VERBOSE | re.IGNORECASE)
+
+    with TableWriter(file) as writer:
+        writer.write(f"\n## {title} \n")
+        writer.write(get_table_columns(["date", "message"]))
+
+        for row in rows:
+            date = row[2]
+            message = row[3]
+            msg_cleaned = get_cleaned_message(message)
+            msg_highlighted = get_highlighted_message(msg_cleaned, pattern)
+            writer.write_row([get_friendly_date(date), msg_highlighted])
+
+    return writer.rows_written
+
+def write_frequency_table(file, rows, title):
+    """Writes a table of each term and how often it occurs, one row at a time
+
+    Args:
+        file (TextIOWrapper): file to write to
+        rows (dict): term to count
+        title (str): the table's heading
+
+    Returns:
+        int: how many rows were written
+    """
+    with TableWriter(file) as writer:
+        writer.write(f"\n## {title}\n")
+        writer.write(get_table_columns(["Term", "Occurences"]))
+
+        for key, value in rows.items():
+            writer.write_row([str(key), str(value)])
+
+    return writer.rows_written
+
+def write_cooccurrence_table(file, cooccurrence, title):
+    """Writes a matrix of how many posts match each pair of categories
+
+    Args:
+        file (TextIOWrapper): file to write to
+        cooccurrence (dict): category to category to count, see PronounCollection.get_cooccurrence
+        title (str): the table's heading
+
+    Returns:
+        int: how many rows were written
+    """
+    categories = list(cooccurrence)
+
+    with TableWriter(file) as writer:
+        writer.write(f"\n## {title}\n")
+        writer.write(get_table_columns(["Category", *categories]))
+
+        for category in categories:
+            writer.write_row([category, *(str(cooccurrence[category][other]) for other in categories)])
+
+    return writer.rows_written
+
 def get_usage_table(rows, title, regex):
-    title = f"\n## {title} \n"
-    table_columns = get_table_columns(["date", "message"])
-    table_body = ""
-    
-    for row in rows:
-        date = row[2]
-        message = row[3]
-        msg_cleaned = get_cleaned_message(message)
-        msg_highlighted = get_highlighted_message(msg_cleaned, regex)
-        table_body = f"{table_body}|{get_friendly_date(date)}|{msg_highlighted}|\n"
+    table = io.StringIO()
+    write_usage_table(table, rows, title, regex)
 
-    return f"{title}{table_columns}{table_body}"
+    return table.getvalue()
 
 def get_frequency_table(rows, title):
-    title = f"\n## {title}\n"
-    table_columns = get_table_columns(["Term", "Occurences"])
-    table_body = ""
-    
-    for key, value in rows.items():
-        table_body = f"{table_body}|{key}|{value}|\n"
+    table = io.StringIO()
+    write_frequency_table(table, rows, title)
+
+    return table.getvalue()
+
+def get_categories(args):
+    """Gets the categories the arguments ask for
+
+    Args:
+        args (Namespace): the parsed arguments
+
+    Returns:
+        [str]: the category names
+    """
+    category_flags = {
+        "profanity": args.profanities,
+        "negation": args.negations,
+        "affirmation": args.affirmations,
+        "emoji": args.emojis,
+        "personal_pronoun": args.personalPronouns,
+    }
+
+    return [category for category, enabled in category_flags.items() if enabled]
+
+def get_keep_rows(args):
+    """Decides whether a scan keeps the rows that match
+
+    Args:
+        args (Namespace): the parsed arguments
+
+    Returns:
+        bool: True if the usage tables are read from rows kept by the scan
+    """
+    # when streaming, usage rows are read back from the stream as they're written instead of kept
+    return args.usage and not args.stream
+
+def get_collection(pronoun, connection, args, cache, incremental, profiler, row_filter, shards=None, client=None):
+    """Reads a pronoun's posts the way the arguments ask for
+
+    Args:
+        pronoun (str): the pronoun
+        connection (Connection): connection to the database
+        args (Namespace): the parsed arguments
+        cache (ResultCache): where scan results are cached, if anywhere
+        incremental (IncrementalStore): where scan results are kept up to date, if anywhere
+        profiler (Profiler): where to record each stage
+        row_filter (RowFilter): which of the pronoun's posts to read
+        shards (dict, optional): connection to each database, by file, when there's more than one. Defaults to None.
+        client (ServiceClient, optional): a running serve.py to ask instead of reading the database. Defaults to None.
+
+    Returns:
+        PronounCollection: the pronoun's posts
+    """
+    if client:
+        return RemoteCollection(pronoun, client, profiler=profiler)
+
+    if shards:
+        return ShardedCollection(pronoun, shards, batch_size=args.batchSize, cache=cache, profiler=profiler, row_filter=row_filter)
+
+    # workers and incremental scans read the database themselves, so there's no need to load the rows here
+    stream = args.stream or args.workers > 1 or args.incremental
+    snapshot = None
+
+    if args.snapshot:
+        with profiler.stage("snapshot") as stage:
+            snapshot = load_snapshot(connection, pronoun)
+            if snapshot is None:
+                print(f"Writing a snapshot of {pronoun}")
+                export_snapshot(connection, pronoun)
+                snapshot = load_snapshot(connection, pronoun)
+            stage.rows = len(snapshot)
+
+    return PronounCollection(pronoun, connection, stream=stream, batch_size=args.batchSize, cache=cache, incremental=incremental, profiler=profiler, snapshot=snapshot, row_filter=row_filter)
+
+def write_report(file, collection, args, profiler):
+    """Writes a pronoun's report, scanning any category that hasn't been scanned yet
+
+    Args:
+        file (TextIOWrapper): file to write to
+        collection (PronounCollection): the pronoun's posts
+        args (Namespace): the parsed arguments
+        profiler (Profiler): where to record each table
+    """
+    file.write(f"# {collection.pronoun}\n")
+    all_rows = collection.rows     
+    file.write(f"{len(collection.rows)} total rows")
+
+    # scan every requested category in one pass over the rows
+    categories = get_categories(args)
+    keep_rows = get_keep_rows(args)
+    if categories:
+        collection.scan(categories, keep_rows=keep_rows, workers=args.workers)
+
+    get_usage_rows = collection.get_category_rows if keep_rows else collection.iter_category_rows
+
+    if args.profanities:
+        profanity_frequencies = collection.get_profanity_frequencies()
+        with profiler.stage("render profanity frequencies") as stage:
+            stage.rows = write_frequency_table(file, profanity_frequencies, "Associated Profanities")
+
+        if args.usage:
+            profanity_rows = get_usage_rows("profanity")
+            with profiler.stage("render profanity usage") as stage:
+                stage.rows = write_usage_table(file, profanity_rows, "All use of profanity", r"((fuck|dick|ass)\w+)" )
+
+    if args.negations:
+        negation_frequencies = collection.get_negation_frequencies()
+        with profiler.stage("render negation frequencies") as stage:
+            stage.rows = write_frequency_table(file, negation_frequencies, "Associated Negations")
+
+        if args.usage:
+            negation_rows = get_usage_rows("negation")
+            with profiler.stage("render negation usage") as stage:
+                stage.rows = write_usage_table(file, negation_rows, "All use of negation", NEGATION_REGEX )
+
+    if args.affirmations:
+        affirmation_frequencies = collection.get_affirmation_frequencies()
+        with profiler.stage("render affirmation frequencies") as stage:
+            stage.rows = write_frequency_table(file, affirmation_frequencies, "Associated Affirmations")
+
+        if args.usage:
+            affirmation_rows = get_usage_rows("affirmation")
+            with profiler.stage("render affirmation usage") as stage:
+                stage.rows = write_usage_table(file, affirmation_rows, "All use of affirmations", AFFIRMATION_REGEX )
+
+    if args.emojis:
+        emoji_frequencies = collection.get_emoji_frequencies()
+        with profiler.stage("render emoji frequencies") as stage:
+            stage.rows = write_frequency_table(file, emoji_frequencies, "Associated emojis")
+
+        if args.usage:
+            emoji_rows = get_usage_rows("emoji")
+            with profiler.stage("render emoji usage") as stage:
+                stage.rows = write_usage_table(file, emoji_rows, "All use of affirmations", AFFIRMATION_REGEX )
+
+    if args.personalPronouns:
+        personal_pronoun_frequencies = collection.get_personal_pronoun_frequencies()
+        with profiler.stage("render personal pronoun frequencies") as stage:
+            stage.rows = write_frequency_table(file, personal_pronoun_frequencies, "Associated Personal Pronouns")
+
+        if args.usage:
+            personal_pronoun_rows = get_usage_rows("personal_pronoun")
+            with profiler.stage("render personal pronoun usage") as stage:
+                stage.rows = write_usage_table(file, personal_pronoun_rows, "All use of personal pronouns", PERSONAL_PRONOUN_REGEX )
+
+    if args.cooccurrence:
+        # the matrix of the requested categories, or of every category if fewer than two were asked for
+        matrix_categories = categories if len(categories) > 1 else list(CATEGORY_PATTERNS)
+        with profiler.stage("render co-occurrence") as stage:
+            cooccurrence = collection.get_cooccurrence(matrix_categories)
+            stage.rows = write_cooccurrence_table(file, cooccurrence, "Co-occurrence of categories")
+
+    # DANGER! This will make the file huge! 
+    if args.allRows:  
+        with profiler.stage("render all rows") as stage:
+            stage.rows = write_usage_table(file, all_rows, f"All use of {collection.pronoun}", collection.pronoun)
+
+
+def write_estimate_table(file, estimates, title):
+    """Writes a table of each term, its estimated occurrences and their margin of error
+
+    Args:
+        file (TextIOWrapper): file to write to
+        estimates ([(str, float, float)]): each term, its estimate and margin
+        title (str): the table's heading
+
+    Returns:
+        int: how many rows were written
+    """
+    with TableWriter(file) as writer:
+        writer.write(f"\n## {title}\n")
+        writer.write(get_table_columns(["Term", "Occurences", "±"]))
+
+        for term, estimate, margin in estimates:
+            writer.write_row([str(term), str(round(estimate)), str(round(margin))])
+
+    return writer.rows_written
+
+def write_preview(file, preview, args, profiler):
+    """Writes a pronoun's approximate report from a sample of its posts
+
+    Args:
+        file (TextIOWrapper): file to write to
+        preview (Preview): the pronoun's sampled results
+        args (Namespace): the parsed arguments
+        profiler (Profiler): where to record each table
+    """
+    file.write(f"# {preview.pronoun}\n")
+    file.write(f"{preview.population} total rows, previewed from a sample of {len(preview.rows)}. Figures are estimates ± their 95% margin of error.\n")
+
+    if preview.authors is not None:
+        file.write(get_table_columns(["Distinct authors in the sample", "±"]))
+        estimate = preview.authors.get_estimate()
+        file.write(f"|{estimate}|{round(estimate * preview.authors.get_error())}|\n")
+
+    titles = {
+        "profanity": ("Associated Profanities", "profanity", r"((fuck|dick|ass)\w+)"),
+        "negation": ("Associated Negations", "negation", NEGATION_REGEX),
+        "affirmation": ("Associated Affirmations", "affirmations", AFFIRMATION_REGEX),
+        "emoji": ("Associated emojis", "emojis", EMOJI_REGEX),
+        "personal_pronoun": ("Associated Personal Pronouns", "personal pronouns", PERSONAL_PRONOUN_REGEX),
+    }
+
+    for category in get_categories(args):
+        title, noun, regex = titles[category]
+        posts, margin = preview.get_matching_posts(category)
+
+        with profiler.stage(f"render {category} estimates") as stage:
+            stage.rows = write_estimate_table(file, preview.get_term_estimates(category), f"{title} (approximate)")
+            file.write(f"\n{round(posts)} ± {round(margin)} posts use {noun}\n")
+
+        if args.usage:
+            with profiler.stage(f"render {category} usage") as stage:
+                stage.rows = write_usage_table(file, preview.get_rows(category), f"Sampled use of {noun}", regex)
+
+def write_series_tables(file, store, connection, pronoun, args, profiler):
+    """Writes how many of the pronoun's posts there are in each hour, day or week, and how many match each category
+
+    Args:
+        file (TextIOWrapper): file to write to
+        store (SeriesStore): where the hourly counts are kept
+        connection (Connection): connection to the database
+        pronoun (str): the pronoun
+        args (Namespace): the parsed arguments
+        profiler (Profiler): where to record each stage
+    """
+    categories = get_categories(args)
+
+    with profiler.stage("series update") as stage:
+        stage.rows = store.update(connection, pronoun, categories)
+
+    bucket = args.series
+
+    with profiler.stage(f"render {bucket} series") as stage:
+        if not categories:
+            series = store.get_series(connection, pronoun, bucket=bucket, since=args.since, until=args.until)
+            with TableWriter(file) as writer:
+                writer.write(f"\n## Posts per {bucket}\n")
+                writer.write(get_table_columns([bucket.capitalize(), "Posts"]))
+
+                for start, posts, _, _ in series:
+                    writer.write_row([start, str(posts)])
+
+            stage.rows = writer.rows_written
+
+        for category in categories:
+            series = store.get_series(connection, pronoun, category, bucket, since=args.since, until=args.until)
+            with TableWriter(file) as writer:
+                writer.write(f"\n## {category.capitalize()} per {bucket}\n")
+                writer.write(get_table_columns([bucket.capitalize(), "Posts", f"Posts with {category}", "Occurences"]))
+
+                for start, posts, matching, occurrences in series:
+                    writer.write_row([start, str(posts), str(matching), str(occurrences)])
+
+            stage.rows = (stage.rows or 0) + writer.rows_written
 
-    return f"{title}{table_columns}{table_body}"
 
 def main(argv):
     parser = argparse.ArgumentParser()
-    parser.add_argument("-d", "--database", help="relative path to a sqlite database", default=DEFAULT_DATABASE_FILE, type=str)
+    parser.add_argument("-d", "--database", help="relative path to a sqlite database. Give several, or a glob, to analyse shards as one.", default=[DEFAULT_DATABASE_FILE], nargs="+", type=str)
     parser.add_argument("-o", "--outputFile", help="Name of the output file. (If none is given, it will be the pronoun you provided)",)
-    parser.add_argument("-p", "--pronoun", help="The social pronoun to analyze", default="bro", choices=SOCIAL_PRONOUNS, type=str)
+    parser.add_argument("-p", "--pronoun", help="The social pronoun to analyze, or all of them", default="bro", choices=[*SOCIAL_PRONOUNS, "all"], type=str)
     parser.add_argument("-s", "--profanities", help="Show all profanities using this pronoun.", action="store_true")
     parser.add_argument("-n", "--negations", help="Show all negations using this pronoun.", action="store_true")
     parser.add_argument("-a","--affirmations", help="Show all affirmations using this pronoun.", action="store_true")
-    parser.add_argument("-e","--emojis", help="Show all emojis using this pronoun.", action="store_true")
+    parser.add_argument("-e","--emojis", help="Show all emojis using this pronoun. A flag, a skin tone or a ZWJ sequence is counted as one emoji.", action="store_true")
+    parser.add_argument("-r","--personalPronouns", help="Show all personal pronouns (I, you, he, she, we, they) using this pronoun.", action="store_true")
+    parser.add_argument("-c","--cooccurrence", help="Show how many posts match each pair of the categories you provided (or of every category, if you provided fewer than two).", action="store_true")
     parser.add_argument("-u","--usage", help="Show usages for any of your provided parameters.", action="store_true")
     parser.add_argument("--allRows", help="Show all usages using this pronoun. (THIS WILL BE A VERY LARGE FILE)", action="store_true")
+    parser.add_argument("--stream", help="Read the posts in batches instead of loading them all into memory.", action="store_true")
+    parser.add_argument("--batchSize", help="How many posts to read at a time when streaming.", default=DEFAULT_BATCH_SIZE, type=int)
+    parser.add_argument("--workers", help="How many processes to scan the posts with.", default=1, type=int)
+    parser.add_argument("--no-cache", help="Scan the posts even if the results are cached.", action="store_true")
+    parser.add_argument("--incremental", help="Keep the results up to date between runs, scanning only posts added since the last run.", action="store_true")
+    parser.add_argument("--snapshot", help="Read the posts from a memory-mapped snapshot, writing it first if it's missing or the database has changed.", action="store_true")
+    parser.add_argument("--since", help="Only analyse posts from this date on: an ISO 8601 date or time, or a span back from now like 7d, 12h or 2w.", type=parse_date)
+    parser.add_argument("--until", help="Only analyse posts from before this date, given like --since.", type=parse_date)
+    parser.add_argument("--limit", help="Only analyse the first this many posts of each pronoun.", type=int)
+    parser.add_argument("--fromRowid", help="Only analyse posts with at least this rowid.", type=int)
+    parser.add_argument("--toRowid", help="Only analyse posts with at most this rowid.", type=int)
+    parser.add_argument("--approx", help="Preview the report from a sample of the posts, with every figure given as an estimate and its margin of error.", action="store_true")
+    parser.add_argument("--sampleSize", help="How many posts of each pronoun an --approx preview samples.", default=DEFAULT_SAMPLE_SIZE, type=int)
+    parser.add_argument("--sketchSize", help="How many terms of each category an --approx preview counts.", default=DEFAULT_SKETCH_SIZE, type=int)
+    parser.add_argument("--seed", help="Seed the --approx sample, to repeat it.", type=int)
+    parser.add_argument("--series", help="Add how many posts there are in each hour, day or week, and how many match each category. The hourly counts are kept between runs and only new posts are counted.", choices=list(BUCKETS))
+    parser.add_argument("--server", help=f"Ask a running serve.py for the results instead of reading the database (default address {DEFAULT_ADDRESS}). If none is running, the database is read as usual.", nargs="?", const=DEFAULT_ADDRESS, type=str)
+    parser.add_argument("--profile", help="Time each stage and write the measurements to a .profile.json file next to the output file.", action="store_true")
+    parser.add_argument("--cacheSize", help="How many megabytes of results to keep cached.", default=DEFAULT_CACHE_SIZE // (1024 * 1024), type=int)
     args = parser.parse_args()
+
+    row_filter = RowFilter(since=args.since, until=args.until, limit=args.limit, min_rowid=args.fromRowid, max_rowid=args.toRowid)
+    if not row_filter.is_empty() and (args.incremental or args.snapshot):
+        parser.error("--since, --until, --limit, --fromRowid and --toRowid can't be combined with --incremental or --snapshot")
+    if args.approx and (args.cooccurrence or args.allRows or args.incremental or args.snapshot or args.workers > 1 or args.series or not row_filter.is_empty()):
+        parser.error("--approx can't be combined with --cooccurrence, --allRows, --incremental, --snapshot, --workers, --series or a filter")
+    if args.series and (args.limit is not None or args.fromRowid is not None or args.toRowid is not None):
+        parser.error("--series only takes --since and --until, as the counts are kept by the hour")
     
-    social_pronoun = args.pronoun
-    database_file = args.database
+    try:
+        database_files = expand_databases(args.database)
+    except FileNotFoundError as error:
+        parser.error(str(error))
+
+    sharded = len(database_files) > 1
+    if sharded and (args.incremental or args.snapshot or args.series or args.approx or args.limit is not None or args.fromRowid is not None or args.toRowid is not None):
+        parser.error("several databases can't be combined with --incremental, --snapshot, --series, --approx, --limit, --fromRowid or --toRowid")
+    if args.server and (sharded or args.incremental or args.snapshot or args.series or args.approx or args.workers > 1 or not row_filter.is_empty()):
+        parser.error("--server can't be combined with several databases, --incremental, --snapshot, --series, --approx, --workers or a filter")
+
+    client = None
+    if args.server:
+        client = ServiceClient(args.server)
+        status = client.get_status()
+        if status is None:
+            print(f"No server at {args.server}, reading the database")
+            client = None
+        elif status["database"] != os.path.realpath(database_files[0]):
+            parser.error(f"the server at {args.server} serves {status['database']}")
+
+    pronouns = SOCIAL_PRONOUNS if args.pronoun == "all" else [args.pronoun]
+    database_file = database_files[0]
     
-    output_file = f"{OUTPUT_DIRECTORY}/{social_pronoun}.md"
+    output_name = args.outputFile or args.pronoun
+    output_files = {pronoun: f"{OUTPUT_DIRECTORY}/{pronoun}.md" for pronoun in pronouns}
     
     if args.outputFile:
-        output_file = f"{OUTPUT_DIRECTORY}/{args.outputFile}.md"
+        output_files = {pronoun: f"{OUTPUT_DIRECTORY}/{args.outputFile}.md" for pronoun in pronouns}
+        if len(pronouns) > 1:
+            output_files = {pronoun: f"{OUTPUT_DIRECTORY}/{args.outputFile}_{pronoun}.md" for pronoun in pronouns}
 
     if  not os.path.exists(OUTPUT_DIRECTORY):
         os.makedirs(OUTPUT_DIRECTORY)
 
+    sqlite_connection = None
+    shards = {}
+
     try:
-        sqlite_connection = sqlite3.connect(database_file)
-        collection = PronounCollection(social_pronoun, sqlite_connection )
-    
-        with open(output_file, 'w', encoding="utf-8") as file:
-            file.write(f"# {social_pronoun}\n")
-            all_rows = collection.rows     
-            file.write(f"{len(collection.rows)} total rows")        
-
-            if args.profanities:
-                profanity_frequencies = collection.get_profanity_frequencies()
-                profanity_frequency_table = get_frequency_table(profanity_frequencies, "Associated Profanities")
-                file.write(profanity_frequency_table)
-                
-                if args.usage:
-                    profanity_rows = collection.get_profanity_rows()
-                    profanity_usage_table = get_usage_table(profanity_rows, "All use of profanity", r"((fuck|dick|ass)\w+)" )
-                    file.write(profanity_usage_table)
-            
-            if args.negations:
-                negation_frequencies = collection.get_negation_frequencies()
-                negation_frequency_table = get_frequency_table(negation_frequencies, "Associated Negations")
-                file.write(negation_frequency_table)
-                
-                if args.usage:
-                    negation_rows = collection.get_negation_rows()
-                    negation_usage_table = get_usage_table(negation_rows, "All use of negation", NEGATION_REGEX )
-                    file.write(negation_usage_table)
-
-            if args.affirmations:
-                affirmation_frequencies = collection.get_affirmation_frequencies()
-                affirmations_table = get_frequency_table(affirmation_frequencies, "Associated Affirmations")
-                file.write(affirmations_table)
-
-                if args.usage:
-                    affirmation_rows = collection.get_affirmation_rows()
-                    affirmation_usage_table = get_usage_table(affirmation_rows, "All use of affirmations", AFFIRMATION_REGEX )
-                    file.write(affirmation_usage_table)
-            
-            if args.emojis:
-                emoji_frequencies = collection.get_emoji_frequencies()
-                emoji_table = get_frequency_table(emoji_frequencies, "Associated emojis")
-                file.write(emoji_table)
-                
-                if args.usage:
-                    emoji_rows = collection.get_emoji_rows()
-                    affirmation_usage_table = get_usage_table(emoji_rows, "All use of affirmations", AFFIRMATION_REGEX )
-                    file.write(affirmation_usage_table)
-            
-            # DANGER! This will make the file huge! 
-            if args.allRows:  
-                usage_table = get_usage_table(all_rows, f"All use of {social_pronoun}", social_pronoun)
-                file.write(usage_table)
-            
+        sqlite_connection = connect_read_only(database_file)
+        if sharded:
+            shards = {database_file: sqlite_connection}
+            shards.update({shard_file: connect_read_only(shard_file) for shard_file in database_files[1:]})
+
+        cache = None if args.no_cache or client else ResultCache(max_bytes=args.cacheSize * 1024 * 1024)
+        incremental = IncrementalStore() if args.incremental else None
+        profiler = Profiler(enabled=args.profile)
+        series = SeriesStore() if args.series else None
+        collections = {}
+
+        # every pronoun is scanned in one pass over the table, unless each is read on its own anyway
+        if len(pronouns) > 1 and not (client or sharded or args.approx or args.snapshot or args.workers > 1 or args.incremental or args.limit is not None):
+            collections = scan_pronouns(sqlite_connection, pronouns, get_categories(args), keep_rows=get_keep_rows(args), stream=args.stream, batch_size=args.batchSize, cache=cache, profiler=profiler, row_filter=row_filter)
+
+        for pronoun in pronouns:
+            if args.approx:
+                preview = Preview(sqlite_connection, pronoun, get_categories(args), args.sampleSize, args.sketchSize, keep_rows=args.usage, seed=args.seed, profiler=profiler)
+
+                with open(output_files[pronoun], 'w', encoding="utf-8") as file:
+                    write_preview(file, preview, args, profiler)
+
+                continue
+
+            collection = collections.get(pronoun) or get_collection(pronoun, sqlite_connection, args, cache, incremental, profiler, row_filter, shards, client)
+
+            with open(output_files[pronoun], 'w', encoding="utf-8") as file:
+                write_report(file, collection, args, profiler)
+
+                if series:
+                    write_series_tables(file, series, sqlite_connection, pronoun, args, profiler)
+
+        if series:
+            series.close()
+
+        if cache:
+            stats = cache.get_stats()
+            print(f"Result cache: {stats['hits']} hits, {stats['misses']} misses")
+
+        if args.profile:
+            profile_file = get_sidecar_file(f"{OUTPUT_DIRECTORY}/{output_name}.md")
+            profiler.write(profile_file, command="analyse", arguments=vars(args), output_files=list(output_files.values()))
+            print(f"Profile written to {profile_file}")
+
     except sqlite3.Error as connection_error:
         print('some DB error happened: ', connection_error)
     
     finally:
+        for shard_connection in list(shards.values())[1:]:
+            shard_connection.close()
+
         if sqlite_connection:
             sqlite_connection.close()
             print("SQLite connection closed")
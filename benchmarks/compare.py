@@ -0,0 +1,74 @@
+import sys, json, argparse
+
+DEFAULT_THRESHOLD = 0.1
+
+
+def load_results(results_file):
+    """Loads a results file written by benchmarks.run
+
+    Args:
+        results_file (str): path to the file
+
+    Returns:
+        (dict, dict): the whole report, and benchmark name to its result
+    """
+    with open(results_file, encoding="utf-8") as file:
+        report = json.load(file)
+
+    return report, {result["name"]: result for result in report["results"]}
+
+
+def get_change(old, new):
+    """Gets the relative change in seconds from one result to another
+
+    Args:
+        old (dict): the baseline result
+        new (dict): the result to compare
+
+    Returns:
+        float: positive if the new result is slower, or None if the baseline took no measurable time
+    """
+    if not old["seconds"]:
+        return None
+
+    return (new["seconds"] - old["seconds"]) / old["seconds"]
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("baseline", help="results file to compare against", type=str)
+    parser.add_argument("candidate", help="results file to compare", type=str)
+    parser.add_argument("-t", "--threshold", help="How much slower a benchmark can get before it's a regression (0.1 is 10%%)", default=DEFAULT_THRESHOLD, type=float)
+    args = parser.parse_args()
+
+    baseline_report, baseline = load_results(args.baseline)
+    candidate_report, candidate = load_results(args.candidate)
+
+    if baseline_report["database"]["rows"] != candidate_report["database"]["rows"]:
+        print("Warning: the results were measured on databases with different row counts")
+
+    print(f"{baseline_report['commit'][:12]} -> {candidate_report['commit'][:12]}")
+    regressions = []
+
+    for name, new in candidate.items():
+        old = baseline.get(name)
+        if old is None:
+            print(f"{name:45} {'':>10} {new['seconds']:>10.3f}s   new")
+            continue
+
+        change = get_change(old, new)
+        flag = ""
+        if change is not None and change > args.threshold:
+            flag = "REGRESSION"
+            regressions.append(name)
+
+        change_text = f"{change:+.1%}" if change is not None else "n/a"
+        print(f"{name:45} {old['seconds']:>10.3f}s {new['seconds']:>10.3f}s {change_text:>9} {flag}")
+
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) slower by more than {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
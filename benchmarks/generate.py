@@ -0,0 +1,147 @@
+import sys, sqlite3, argparse, random, datetime, string, os
+
+SIZES = {
+    "small": 10_000,
+    "medium": 1_000_000,
+    "large": 10_000_000,
+}
+
+# share of posts for each pronoun, roughly what the feed generator collects
+PRONOUN_WEIGHTS = {"dude": 0.22, "bro": 0.34, "bruh": 0.18, "sis": 0.1, "chat": 0.1, "fam": 0.06}
+
+WORDS = (
+    "the a an and with for to from before of in on at is are was be it this that what so just "
+    "like really got get go going know think see look love good bad new day time people back "
+    "i you he she we they me my your his her our their him them us lol lmao omg ok okay "
+    "game post today night man wait why how when where who right now never always still"
+).split()
+PROFANITIES = ["fuck", "fucking", "shit", "damn", "ass", "asshole", "wtf", "stfu", "motherfucker", "dickhead", "lmfao"]
+NEGATIONS = ["no", "nah", "nope", "naw", "nooo", "nuh"]
+AFFIRMATIONS = ["yes", "yeah", "yep", "yeh", "yup", "yasss"]
+EMOJIS = [
+    "😂", "🤣", "💀", "🔥", "😭", "🙏", "✨", "👀", "😎", "🤡", "❤️", "✌️",
+    "👍🏽", "💪🏿", "🤦‍♂️", "👨‍👩‍👧", "🏳️‍🌈", "🇺🇸", "🇧🇷", "😮‍💨",
+]
+
+# how often a post contains each kind of term
+PROFANITY_RATE = 0.12
+NEGATION_RATE = 0.1
+AFFIRMATION_RATE = 0.08
+EMOJI_RATE = 0.3
+
+BASE32 = "abcdefghijklmnopqrstuvwxyz234567"
+START_DATE = datetime.datetime(2024, 11, 1, tzinfo=datetime.timezone.utc)
+
+
+def get_pronoun_variant(rng, pronoun):
+    """Spells a pronoun the way people type it: capitalized, shouted, or with letters drawn out"""
+    roll = rng.random()
+    if roll < 0.6:
+        return pronoun
+    if roll < 0.75:
+        return pronoun.capitalize()
+    if roll < 0.85:
+        return pronoun.upper()
+
+    return pronoun + pronoun[-1] * rng.randint(1, 4)
+
+
+def get_message(rng, pronoun):
+    """Writes a synthetic post that uses the pronoun"""
+    length = min(60, max(0, int(rng.lognormvariate(2.2, 0.7))))
+    words = [rng.choice(WORDS) for _ in range(length)]
+
+    for rate, terms in ((PROFANITY_RATE, PROFANITIES), (NEGATION_RATE, NEGATIONS), (AFFIRMATION_RATE, AFFIRMATIONS)):
+        if rng.random() < rate:
+            words.insert(rng.randint(0, len(words)), rng.choice(terms))
+
+    words.insert(rng.randint(0, len(words)), get_pronoun_variant(rng, pronoun))
+
+    if rng.random() < EMOJI_RATE:
+        for _ in range(rng.randint(1, 3)):
+            words.insert(rng.randint(0, len(words)), rng.choice(EMOJIS))
+
+    message = " ".join(words)
+
+    if rng.random() < 0.05:
+        message = message.replace(" ", "\n", 1)
+
+    return message[:300]
+
+
+def get_rows(rng, count):
+    """Yields (uri, cid, indexedAt, text, pronoun) rows"""
+    pronouns = list(PRONOUN_WEIGHTS)
+    weights = [PRONOUN_WEIGHTS[pronoun] for pronoun in pronouns]
+    authors = ["did:plc:" + "".join(rng.choice(BASE32) for _ in range(24)) for _ in range(max(1, count // 20))]
+    seconds = 0
+
+    for index in range(count):
+        pronoun = rng.choices(pronouns, weights)[0]
+        # a few authors write most of the posts
+        author = authors[min(len(authors) - 1, int(rng.paretovariate(1.2)) - 1)] if rng.random() < 0.3 else rng.choice(authors)
+        seconds += rng.expovariate(1 / 8)
+        indexed_at = (START_DATE + datetime.timedelta(seconds=seconds)).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+        rkey = "".join(rng.choice(BASE32) for _ in range(13))
+
+        yield (
+            f"at://{author}/app.bsky.feed.post/{rkey}",
+            "bafyrei" + "".join(rng.choice(string.ascii_lowercase + "234567") for _ in range(52)),
+            indexed_at,
+            get_message(rng, pronoun),
+            pronoun,
+        )
+
+
+def generate(database_file, count, seed=0, batch_size=10000):
+    """Creates a database with a synthetic post table
+
+    The post table has the columns the analysis reads, in the positions it reads them:
+    uri, cid, indexedAt (the date), text (the message), then pronoun.
+
+    Args:
+        database_file (str): path of the database to create; an existing file is replaced
+        count (int): how many posts to generate
+        seed (int, optional): random seed, so the same arguments make the same database. Defaults to 0.
+        batch_size (int, optional): how many posts to insert at a time. Defaults to 10000.
+    """
+    if os.path.exists(database_file):
+        os.remove(database_file)
+
+    rng = random.Random(seed)
+    connection = sqlite3.connect(database_file)
+    connection.execute("PRAGMA journal_mode=OFF")
+    connection.execute("PRAGMA synchronous=OFF")
+    connection.execute(
+        "CREATE TABLE post (uri varchar PRIMARY KEY, cid varchar NOT NULL, indexedAt varchar NOT NULL, text varchar, pronoun varchar)"
+    )
+
+    batch = []
+    for row in get_rows(rng, count):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            connection.executemany("INSERT INTO post VALUES (?, ?, ?, ?, ?)", batch)
+            batch = []
+
+    if batch:
+        connection.executemany("INSERT INTO post VALUES (?, ?, ?, ?, ?)", batch)
+
+    connection.commit()
+    connection.close()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--database", help="path of the database to create", default="benchmarks/bench.sqlite", type=str)
+    parser.add_argument("-s", "--size", help="how many posts to generate", default="small", choices=list(SIZES), type=str)
+    parser.add_argument("-r", "--rows", help="generate exactly this many posts instead of a preset size", type=int)
+    parser.add_argument("--seed", help="random seed", default=0, type=int)
+    args = parser.parse_args()
+
+    count = args.rows or SIZES[args.size]
+    generate(args.database, count, args.seed)
+    print(f"Generated {count} posts in {args.database}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
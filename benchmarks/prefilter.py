@@ -0,0 +1,83 @@
+import sys, argparse, re, time
+
+from src.database import connect_read_only
+from src.regexp import RegexpFunction
+from src.rows import get_rows_query
+from src.scanner import CATEGORY_PATTERNS, CategoryScanner
+
+# texts the prefilter could get wrong: letters re.IGNORECASE folds from outside ASCII, case, and no text at all
+TRICKY_TEXTS = [
+    "FUCK", "ſhit", "ſtfu", "dİck", "dıck", "KOCK", "cocK", "ASS", "nah", "NAH", "Naw", "nuh",
+    "yes", "YEAH", "yuP", "Yaſ", "ﬀuck", "straße", "İ", "", "   no   ", "nȯ", "nö",
+]
+
+
+def get_texts(connection, pronoun):
+    rows = connection.execute(get_rows_query(connection), (pronoun,)).fetchall()
+    extra = [(None, None, None, text, -index) for index, text in enumerate(TRICKY_TEXTS, start=1)]
+
+    return rows + extra
+
+
+def check_scanner(rows):
+    """Scans the rows with and without the prefilters and compares every category's results"""
+    prefiltered = CategoryScanner(keep_rows=False)
+    plain = CategoryScanner(keep_rows=False)
+    plain.prefilters = {}
+
+    start = time.perf_counter()
+    plain.scan(rows)
+    plain_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    prefiltered.scan(rows)
+    prefiltered_seconds = time.perf_counter() - start
+
+    same = prefiltered.frequencies == plain.frequencies and prefiltered.rowids == plain.rowids
+    print(f"{'scanner':20} {plain_seconds:>8.3f}s -> {prefiltered_seconds:>8.3f}s {'same' if same else 'DIFFERENT'}")
+
+    return same
+
+
+def check_regexp(texts):
+    """Runs each category pattern through REGEXP and a plain re.search and compares them"""
+    function = RegexpFunction()
+    same = True
+
+    for category, (pattern, flags) in CATEGORY_PATTERNS.items():
+        if isinstance(pattern, re.Pattern):
+            continue
+
+        compiled = re.compile(pattern, flags)
+        expected = [None if text is None else int(bool(compiled.search(text))) for text in texts]
+        search = function.search_ignore_case if flags & re.IGNORECASE else function
+        found = [search(pattern, text) for text in texts]
+
+        if found != expected:
+            print(f"{'regexp ' + category:20} DIFFERENT")
+            same = False
+
+    print(f"{'regexp':20} {function.rejected:,} of {function.calls:,} calls rejected by the prefilter {'same' if same else 'DIFFERENT'}")
+
+    return same
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--database", help="path to a database made with benchmarks.generate", default="benchmarks/bench.sqlite", type=str)
+    parser.add_argument("-p", "--pronoun", help="The social pronoun to check", default="bro", type=str)
+    args = parser.parse_args()
+
+    connection = connect_read_only(args.database)
+    rows = get_texts(connection, args.pronoun)
+    texts = [row[3] for row in rows] + [None]
+    connection.close()
+
+    results = [check_scanner(rows), check_regexp(texts)]
+
+    if not all(results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,326 @@
+import sys, sqlite3, argparse, io, os, json, time, platform, subprocess, datetime
+import multiprocessing, contextlib
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import analyse
+import summarize
+from src.approx import Preview
+from src.database import connect_read_only
+from src.emoji import find_emoji_sequences, find_emojis
+from src.notebook_helpers import Highlighter, format_times, get_frequency_dict, get_instance_dict, make_links
+from src.pronoun import PronounCollection
+from src.regexes import EMOJI_REGEX, PROFANITY_REGEX
+from src.scanner import CATEGORY_PATTERNS
+from src.service import QueryService
+from src.snapshot import Snapshot, export_snapshot
+from benchmarks.generate import WORDS
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Registers a benchmark. It gets the database file and pronoun, and returns (seconds, rows processed)"""
+    def register(function):
+        BENCHMARKS[name] = function
+        return function
+
+    return register
+
+
+def count_rows(connection, pronoun):
+    return connection.execute("SELECT COUNT(*) FROM post WHERE pronoun=?", (pronoun,)).fetchone()[0]
+
+
+def get_notebook_rows(connection, pronoun):
+    """Rows shaped the way the notebooks select them, with the message third"""
+    return connection.execute("SELECT uri, indexedAt, text FROM post WHERE pronoun=?", (pronoun,)).fetchall()
+
+
+@benchmark("collection.init")
+def bench_collection_init(database_file, pronoun):
+    connection = connect_read_only(database_file)
+    start = time.perf_counter()
+    collection = PronounCollection(pronoun, connection)
+    seconds = time.perf_counter() - start
+
+    return seconds, len(collection.rows)
+
+
+@benchmark("collection.stream")
+def bench_collection_stream(database_file, pronoun):
+    connection = connect_read_only(database_file)
+    collection = PronounCollection(pronoun, connection, stream=True)
+    start = time.perf_counter()
+    rows = sum(1 for _ in collection.rows)
+
+    return time.perf_counter() - start, rows
+
+
+@benchmark("collection.snapshot")
+def bench_collection_snapshot(database_file, pronoun):
+    connection = connect_read_only(database_file)
+    snapshot_file = f"{database_file}.{pronoun}.snapshot"
+    export_snapshot(connection, pronoun, snapshot_file)
+    start = time.perf_counter()
+    snapshot = Snapshot(snapshot_file)
+    rows = sum(1 for _ in snapshot)
+    seconds = time.perf_counter() - start
+    snapshot.close()
+    os.remove(snapshot_file)
+
+    return seconds, rows
+
+
+@benchmark("collection.scan")
+def bench_collection_scan(database_file, pronoun):
+    connection = connect_read_only(database_file)
+    collection = PronounCollection(pronoun, connection)
+    start = time.perf_counter()
+    collection.scan()
+
+    return time.perf_counter() - start, len(collection.rows)
+
+
+@benchmark("collection.approx")
+def bench_collection_approx(database_file, pronoun):
+    connection = connect_read_only(database_file)
+    start = time.perf_counter()
+    preview = Preview(connection, pronoun, list(CATEGORY_PATTERNS), seed=0)
+
+    return time.perf_counter() - start, len(preview.rows)
+
+
+@benchmark("service.queries")
+def bench_service_queries(database_file, pronoun):
+    # the pronoun is loaded before timing, as serve.py does before it starts serving
+    service = QueryService(database_file, [pronoun])
+    start = time.perf_counter()
+
+    for category in CATEGORY_PATTERNS:
+        service.answer("/frequencies", {"pronoun": pronoun, "category": category})
+        service.answer("/rows", {"pronoun": pronoun, "categories": category})
+    service.answer("/cooccurrence", {"pronoun": pronoun})
+    service.answer("/tally", {"pronoun": pronoun, "prepositions": ",".join(summarize.preposition_and_conjunction_list), "personalPronouns": ",".join(summarize.personal_pronoun_list)})
+    seconds = time.perf_counter() - start
+    rows = len(service.pronouns[pronoun].collection.rows)
+    service.close()
+
+    return seconds, rows
+
+
+def add_category_benchmarks(category):
+    @benchmark(f"collection.get_{category}_frequencies")
+    def bench_frequencies(database_file, pronoun):
+        connection = connect_read_only(database_file)
+        collection = PronounCollection(pronoun, connection)
+        start = time.perf_counter()
+        getattr(collection, f"get_{category}_frequencies")()
+
+        return time.perf_counter() - start, len(collection.rows)
+
+    @benchmark(f"collection.get_{category}_rows")
+    def bench_rows(database_file, pronoun):
+        connection = connect_read_only(database_file)
+        collection = PronounCollection(pronoun, connection)
+        start = time.perf_counter()
+        getattr(collection, f"get_{category}_rows")()
+
+        return time.perf_counter() - start, len(collection.rows)
+
+
+for category in CATEGORY_PATTERNS:
+    add_category_benchmarks(category)
+
+
+def add_emoji_benchmark(name, find):
+    @benchmark(f"emoji.{name}")
+    def bench_emoji(database_file, pronoun):
+        connection = connect_read_only(database_file)
+        texts = [text.strip() for (text,) in connection.execute("SELECT text FROM post WHERE pronoun=?", (pronoun,))]
+        start = time.perf_counter()
+        for text in texts:
+            find(text)
+
+        return time.perf_counter() - start, len(texts)
+
+
+# the regex the emoji category used to run, against the table-backed finders
+add_emoji_benchmark("regex", EMOJI_REGEX.findall)
+add_emoji_benchmark("find_emojis", find_emojis)
+add_emoji_benchmark("find_emoji_sequences", find_emoji_sequences)
+
+
+@benchmark("summarize.pronoun_count_summary")
+def bench_pronoun_count_summary(database_file, pronoun):
+    connection = connect_read_only(database_file)
+    # it prints the pronoun list as well as writing the table
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        summarize.print_pronoun_count_summary(summarize.pronoun_list, connection, io.StringIO())
+        seconds = time.perf_counter() - start
+
+    return seconds, connection.execute("SELECT COUNT(*) FROM post").fetchone()[0]
+
+
+def add_summary_benchmark(name, function):
+    @benchmark(f"summarize.{name}")
+    def bench_summary(database_file, pronoun):
+        connection = connect_read_only(database_file)
+        start = time.perf_counter()
+        function(pronoun, connection, io.StringIO())
+
+        return time.perf_counter() - start, count_rows(connection, pronoun)
+
+
+add_summary_benchmark("preps_and_conjunctions", summarize.print_preps_and_conjunctions)
+add_summary_benchmark("positions", summarize.print_positions)
+add_summary_benchmark("associated_pronouns", summarize.print_associated_pronouns)
+
+
+@benchmark("notebook.get_frequency_dict")
+def bench_get_frequency_dict(database_file, pronoun):
+    connection = connect_read_only(database_file)
+    rows = get_notebook_rows(connection, pronoun)
+    start = time.perf_counter()
+    get_frequency_dict(rows, PROFANITY_REGEX)
+
+    return time.perf_counter() - start, len(rows)
+
+
+@benchmark("notebook.get_instance_dict")
+def bench_get_instance_dict(database_file, pronoun):
+    connection = connect_read_only(database_file)
+    rows = get_notebook_rows(connection, pronoun)
+    start = time.perf_counter()
+    get_instance_dict(WORDS, rows)
+
+    return time.perf_counter() - start, len(rows)
+
+
+@benchmark("notebook.format_columns")
+def bench_format_columns(database_file, pronoun):
+    connection = connect_read_only(database_file)
+    rows = get_notebook_rows(connection, pronoun)
+    uris, dates, texts = zip(*rows) if rows else ((), (), ())
+    start = time.perf_counter()
+    make_links(uris)
+    format_times(dates)
+    Highlighter(f"({pronoun})").mark_all(texts)
+
+    return time.perf_counter() - start, len(rows)
+
+
+@benchmark("analyse.frequency_table")
+def bench_frequency_table(database_file, pronoun):
+    connection = connect_read_only(database_file)
+    collection = PronounCollection(pronoun, connection)
+    frequencies = collection.get_emoji_frequencies()
+
+    with open(os.devnull, "w", encoding="utf-8") as file:
+        start = time.perf_counter()
+        analyse.write_frequency_table(file, frequencies, "Associated emojis")
+        seconds = time.perf_counter() - start
+
+    return seconds, len(frequencies)
+
+
+@benchmark("analyse.usage_table")
+def bench_usage_table(database_file, pronoun):
+    connection = connect_read_only(database_file)
+    collection = PronounCollection(pronoun, connection)
+
+    with open(os.devnull, "w", encoding="utf-8") as file:
+        start = time.perf_counter()
+        analyse.write_usage_table(file, collection.rows, f"All use of {pronoun}", pronoun)
+        seconds = time.perf_counter() - start
+
+    return seconds, len(collection.rows)
+
+
+def get_peak_rss():
+    """Gets the peak resident set size of this process in kilobytes, or None where it can't be read"""
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # macOS reports bytes, Linux kilobytes
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def run_benchmark(name, database_file, pronoun):
+    """Runs one benchmark. Called in a fresh process, so the peak RSS is the benchmark's own."""
+    seconds, rows = BENCHMARKS[name](database_file, pronoun)
+
+    return {
+        "name": name,
+        "seconds": round(seconds, 6),
+        "rows": rows,
+        "rows_per_sec": round(rows / seconds, 1) if seconds else None,
+        "peak_rss_kb": get_peak_rss(),
+    }
+
+
+def get_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--database", help="path to a database made with benchmarks.generate", default="benchmarks/bench.sqlite", type=str)
+    parser.add_argument("-p", "--pronoun", help="The social pronoun to benchmark", default="bro", type=str)
+    parser.add_argument("-o", "--outputFile", help="Where to write the results (default is benchmarks/results/<commit>.json)", type=str)
+    parser.add_argument("-k", "--only", help="Only run benchmarks whose name contains this", default="", type=str)
+    parser.add_argument("-r", "--repeat", help="Run each benchmark this many times and keep the fastest", default=1, type=int)
+    args = parser.parse_args()
+
+    commit = get_commit()
+    output_file = args.outputFile or f"benchmarks/results/{commit[:12]}.json"
+    connection = sqlite3.connect(args.database)
+    total_rows = connection.execute("SELECT COUNT(*) FROM post").fetchone()[0]
+    connection.close()
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+
+    for name in BENCHMARKS:
+        if args.only not in name:
+            continue
+
+        runs = []
+        for _ in range(args.repeat):
+            with context.Pool(1, maxtasksperchild=1) as pool:
+                runs.append(pool.apply(run_benchmark, (name, args.database, args.pronoun)))
+
+        result = min(runs, key=lambda run: run["seconds"])
+        result["peak_rss_kb"] = max((run["peak_rss_kb"] or 0) for run in runs) or None
+        results.append(result)
+        print(f"{name:45} {result['seconds']:>10.3f}s {result['rows_per_sec'] or 0:>14,.0f} rows/s {result['peak_rss_kb'] or 0:>10,} KB")
+
+    report = {
+        "commit": commit,
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "database": {"file": args.database, "rows": total_rows},
+        "pronoun": args.pronoun,
+        "results": results,
+    }
+
+    os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+    with open(output_file, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+
+    print(f"Results written to {output_file}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
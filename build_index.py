@@ -0,0 +1,31 @@
+import sys, sqlite3, argparse
+
+from src.constants import DEFAULT_DATABASE_FILE
+from src.fts import build_index
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--database", help="relative path to a sqlite database", default=DEFAULT_DATABASE_FILE, type=str)
+    parser.add_argument("--rebuild", help="Index every post again instead of only the posts added since the last refresh.", action="store_true")
+    args = parser.parse_args()
+
+    sqlite_connection = None
+
+    try:
+        sqlite_connection = sqlite3.connect(args.database)
+        indexed = build_index(sqlite_connection, rebuild=args.rebuild)
+        print(f"Indexed {indexed} posts")
+
+    except (sqlite3.Error, RuntimeError) as index_error:
+        print('The index could not be built -', index_error)
+        sys.exit(2)
+
+    finally:
+        if sqlite_connection:
+            sqlite_connection.close()
+            print("SQLite connection closed")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
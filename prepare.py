@@ -0,0 +1,63 @@
+import sys, sqlite3, argparse
+
+from src.constants import DEFAULT_DATABASE_FILE
+from src.database import connect_read_only
+from src.indexes import create_indexes, explain_queries, get_missing_indexes
+
+
+def print_check(connection):
+    """Prints the missing indexes and the plan of every query the CLIs run
+
+    Args:
+        connection (Connection): connection to the database
+
+    Returns:
+        bool: True if no index is missing and no query reads the whole table when it isn't meant to
+    """
+    missing = get_missing_indexes(connection)
+
+    for name, columns in missing.items():
+        print(f"Missing index {name} on post({', '.join(columns)})")
+
+    plans = explain_queries(connection)
+
+    for plan in plans:
+        flag = "FULL SCAN " if plan["full_scan"] else ""
+        print(f"\n{flag}{plan['description']}\n  {plan['query']}")
+        for step in plan["plan"]:
+            print(f"    {step}")
+
+    return not missing and not any(plan["full_scan"] for plan in plans)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--database", help="relative path to a sqlite database", default=DEFAULT_DATABASE_FILE, type=str)
+    parser.add_argument("--check", help="Only report missing indexes and the query plans, without changing the database.", action="store_true")
+    args = parser.parse_args()
+
+    sqlite_connection = None
+
+    try:
+        if args.check:
+            sqlite_connection = connect_read_only(args.database)
+        else:
+            sqlite_connection = sqlite3.connect(args.database)
+            created = create_indexes(sqlite_connection)
+            print(f"Created {len(created)} indexes{': ' + ', '.join(created) if created else ''}, and updated the statistics")
+
+        if not print_check(sqlite_connection):
+            sys.exit(1)
+
+    except sqlite3.Error as prepare_error:
+        print('The database could not be prepared -', prepare_error)
+        sys.exit(2)
+
+    finally:
+        if sqlite_connection:
+            sqlite_connection.close()
+            print("SQLite connection closed")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
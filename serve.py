@@ -0,0 +1,59 @@
+import sys, sqlite3, argparse, os, time, signal
+
+from src.constants import DEFAULT_DATABASE_FILE, SOCIAL_PRONOUNS
+from src.service import DEFAULT_ADDRESS, QueryService, make_server, parse_address
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--database", help="relative path to a sqlite database", default=DEFAULT_DATABASE_FILE, type=str)
+    parser.add_argument("-a", "--address", help="Where to listen: http://host:port, or unix:/path/to/socket.", default=DEFAULT_ADDRESS, type=str)
+    parser.add_argument("-p", "--pronoun", help="The social pronoun to load before serving, or all of them. Others are loaded the first time they're asked for.", default="all", choices=[*SOCIAL_PRONOUNS, "all"], type=str)
+    parser.add_argument("--verbose", help="Log every request.", action="store_true")
+    args = parser.parse_args()
+
+    try:
+        parse_address(args.address)
+    except ValueError as error:
+        parser.error(str(error))
+
+    service = None
+    server = None
+
+    def stop(signal_number, frame):
+        raise KeyboardInterrupt
+
+    # stopping with kill closes the server the same way Ctrl+C does
+    signal.signal(signal.SIGTERM, stop)
+
+    try:
+        start = time.perf_counter()
+        service = QueryService(args.database, SOCIAL_PRONOUNS if args.pronoun == "all" else [args.pronoun])
+        loaded = sum(len(warm.collection.rows) for warm in service.pronouns.values())
+        print(f"Loaded {loaded} posts of {len(service.pronouns)} pronouns in {time.perf_counter() - start:.1f}s")
+
+        server = make_server(service, args.address, verbose=args.verbose)
+        print(f"Serving {service.database_file} at {args.address}")
+        server.serve_forever()
+
+    except KeyboardInterrupt:
+        print("Stopped")
+
+    except (sqlite3.Error, OSError) as serve_error:
+        print('The server could not run -', serve_error)
+        sys.exit(2)
+
+    finally:
+        if server:
+            server.server_close()
+            host, port = parse_address(args.address)
+            if port is None and os.path.exists(host):
+                os.remove(host)
+
+        if service:
+            service.close()
+            print("SQLite connection closed")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
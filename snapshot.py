@@ -0,0 +1,36 @@
+import sys, sqlite3, argparse
+
+from src.constants import DEFAULT_DATABASE_FILE, SOCIAL_PRONOUNS
+from src.snapshot import SNAPSHOT_DIRECTORY, export_snapshot, get_snapshot_file
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--database", help="relative path to a sqlite database", default=DEFAULT_DATABASE_FILE, type=str)
+    parser.add_argument("-p", "--pronoun", help="The social pronoun to snapshot (every pronoun if none is given)", choices=SOCIAL_PRONOUNS, type=str)
+    parser.add_argument("--directory", help="Where to write the snapshots.", default=SNAPSHOT_DIRECTORY, type=str)
+    args = parser.parse_args()
+
+    pronouns = [args.pronoun] if args.pronoun else SOCIAL_PRONOUNS
+    sqlite_connection = None
+
+    try:
+        sqlite_connection = sqlite3.connect(args.database)
+
+        for pronoun in pronouns:
+            snapshot_file = get_snapshot_file(pronoun, args.directory)
+            exported = export_snapshot(sqlite_connection, pronoun, snapshot_file)
+            print(f"Wrote {exported} {pronoun} posts to {snapshot_file}")
+
+    except (sqlite3.Error, ValueError) as snapshot_error:
+        print('The snapshot could not be written -', snapshot_error)
+        sys.exit(2)
+
+    finally:
+        if sqlite_connection:
+            sqlite_connection.close()
+            print("SQLite connection closed")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,587 @@
+import hashlib
+import heapq
+import math
+import random
+
+from src.profiler import Profiler
+from src.rows import ROWID_INDEX, get_row_columns
+from src.scanner import CategoryScanner, sort_frequencies
+
+DEFAULT_SAMPLE_SIZE = 5000
+DEFAULT_STRATA = 100
+DEFAULT_SKETCH_SIZE = 200
+DEFAULT_PRECISION = 14
+
+# a 95% confidence interval is this many standard errors either side of the estimate
+Z_95 = 1.96
+
+
+def get_did(uri):
+    """Gets the DID of the account that made a post from its URI
+
+    Args:
+        uri (str): e.g. at://did:plc:abc/app.bsky.feed.post/xyz
+
+    Returns:
+        str: e.g. did:plc:abc, or None if the URI isn't an at:// URI
+    """
+    if not uri or not uri.startswith("at://"):
+        return None
+
+    return uri[5:].partition("/")[0] or None
+
+
+def get_rate_bounds(matches, sample_size, population):
+    """Scales the share of a sample that matched up to the population, with a 95% margin of error
+
+    The margin is the normal approximation of the binomial, with the finite population
+    correction, so a sample of the whole population has no error.
+
+    Args:
+        matches (int): how many sampled posts matched
+        sample_size (int): how many posts were sampled
+        population (int): how many posts there are
+
+    Returns:
+        (float, float): the estimated number of matching posts, and the margin either side of it
+    """
+    if not sample_size:
+        return 0.0, float(population)
+
+    rate = matches / sample_size
+    correction = math.sqrt((population - sample_size) / (population - 1)) if population > 1 else 0.0
+    margin = Z_95 * math.sqrt(rate * (1 - rate) / sample_size) * correction
+
+    return rate * population, margin * population
+
+
+class SpaceSaving:
+    """
+    Finds the most frequent terms in a stream with a fixed number of counters (Metwally,
+    Agrawal and El Abbadi's Space-Saving). When every counter is taken, a new term takes the
+    smallest counter over and inherits its count as its error.
+
+    Each count is at most `error` above the term's true count, and any term that makes up
+    more than 1 / capacity of the stream is always kept.
+
+    The smallest counter is found with a heap holding one entry per term. Counts only go up,
+    so an entry can only be lower than its term's count; a stale entry is pushed back with the
+    current count when it comes to the top, and adding to a term never touches the heap.
+
+    Attributes:
+        capacity (int): How many terms are counted at once.
+        counts (dict): Term to [count, error].
+        total (int): How many terms have been added.
+    """
+
+    def __init__(self, capacity=DEFAULT_SKETCH_SIZE):
+        """
+        Initializes an empty sketch.
+
+        Args:
+            capacity (int, optional): How many terms to count at once. Defaults to DEFAULT_SKETCH_SIZE.
+        """
+        self.capacity = capacity
+        self.counts = {}
+        self.heap = []
+        self.total = 0
+
+    def add(self, term, count=1):
+        """
+        Counts a term.
+
+        Args:
+            term (str): the term
+            count (int, optional): how many times it occurred. Defaults to 1.
+        """
+        self.total += count
+        counter = self.counts.get(term)
+
+        if counter is not None:
+            counter[0] += count
+            return
+
+        if len(self.counts) < self.capacity:
+            self.counts[term] = [count, 0]
+            heapq.heappush(self.heap, (count, term))
+            return
+
+        while True:
+            floor, smallest = heapq.heappop(self.heap)
+            current = self.counts[smallest][0]
+            if current == floor:
+                break
+            heapq.heappush(self.heap, (current, smallest))
+
+        del self.counts[smallest]
+        self.counts[term] = [floor + count, floor]
+        heapq.heappush(self.heap, (floor + count, term))
+
+    def merge(self, other):
+        """
+        Adds the counts of another sketch. The errors add up, so the bounds still hold.
+
+        Args:
+            other (SpaceSaving): a sketch of the rest of the stream
+
+        Returns:
+            SpaceSaving: the sketch, so calls can be chained
+        """
+        for term, (count, error) in other.counts.items():
+            self.add(term, count)
+            self.counts[term][1] += error
+
+        self.total += other.total - sum(count for count, _ in other.counts.values())
+
+        return self
+
+    def get_top(self, k=None):
+        """
+        Gets the most frequent terms.
+
+        Args:
+            k (int, optional): how many terms. Defaults to every term counted.
+
+        Returns:
+            [(str, int, int)]: each term, its count and the most the count can be over, most frequent first
+        """
+        top = sorted(self.counts.items(), key=lambda item: item[1][0], reverse=True)[:k]
+
+        return [(term, count, error) for term, (count, error) in top]
+
+
+class HyperLogLog:
+    """
+    Estimates how many distinct values a stream has in a fixed amount of memory (Flajolet
+    et al.). Each value is hashed into one of 2**precision registers, which keeps the
+    longest run of leading zeros seen.
+
+    Attributes:
+        precision (int): How many bits of the hash pick the register.
+        registers (bytearray): The longest run of each register, plus one.
+    """
+
+    def __init__(self, precision=DEFAULT_PRECISION):
+        """
+        Initializes an empty estimator.
+
+        Args:
+            precision (int, optional): 4 to 18. Each extra bit doubles the memory and takes the error down by
+                a factor of about 1.4. Defaults to DEFAULT_PRECISION (16 KiB, about 0.8% error).
+        """
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, value):
+        """
+        Counts a value.
+
+        Args:
+            value (str): the value
+        """
+        hashed = int.from_bytes(hashlib.blake2b(value.encode("utf-8", "surrogatepass"), digest_size=8).digest(), "big")
+        index = hashed >> (64 - self.precision)
+        rest = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        """
+        Adds the values another estimator of the same precision has counted.
+
+        Args:
+            other (HyperLogLog): the other estimator
+
+        Returns:
+            HyperLogLog: the estimator, so calls can be chained
+        """
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+        return self
+
+    def get_estimate(self):
+        """
+        Estimates how many distinct values have been counted.
+
+        Returns:
+            int: the estimate
+        """
+        size = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+
+        # small counts are estimated from how many registers are still empty
+        if estimate <= 2.5 * size and zeros:
+            estimate = size * math.log(size / zeros)
+
+        return round(estimate)
+
+    def get_error(self):
+        """
+        Gets the relative margin of error of the estimate.
+
+        Returns:
+            float: 95% of estimates are within this share of the true count
+        """
+        return Z_95 * 1.04 / math.sqrt(len(self.registers))
+
+
+class SketchScanner(CategoryScanner):
+    """
+    A CategoryScanner that counts each category's terms in a SpaceSaving sketch instead of
+    a dictionary, so its memory stays fixed however many distinct terms there are.
+
+    Attributes:
+        sketches (dict): The SpaceSaving sketch of each category.
+    """
+
+    def __init__(self, categories=None, keep_rows=True, capacity=DEFAULT_SKETCH_SIZE, **kwargs):
+        """
+        Initializes the scanner.
+
+        Args:
+            categories ([str], optional): Categories to scan. Defaults to every category in CATEGORY_PATTERNS.
+            keep_rows (bool, optional): Keep the matching rows as well as the frequencies. Defaults to True.
+            capacity (int, optional): How many terms each sketch counts at once. Defaults to DEFAULT_SKETCH_SIZE.
+            **kwargs: passed on to CategoryScanner
+        """
+        super().__init__(categories, keep_rows, **kwargs)
+        self.sketches = {category: SpaceSaving(capacity) for category in self.categories}
+
+    def count_term(self, category, term):
+        """
+        Counts one occurrence of a category's term in its sketch.
+
+        Args:
+            category (str): the category name
+            term (str): the term, lowercased
+        """
+        self.sketches[category].add(term)
+
+    def get_frequencies(self, category):
+        """
+        Gets the counted terms of a category, most frequent first.
+
+        Args:
+            category (str): the category name
+
+        Returns:
+            dict: each term to its count, which may be over by up to its error (see SpaceSaving)
+        """
+        return sort_frequencies({term: count for term, count, _ in self.sketches[category].get_top()})
+
+
+def get_strata(connection, pronoun, strata):
+    """Cuts the range of a pronoun's rowids into strata of the same width, and counts its posts in each
+
+    Args:
+        connection (Connection): connection to the database
+        pronoun (str): the pronoun
+        strata (int): how many strata, at most
+
+    Returns:
+        [(int, int, int)]: the first and last rowid of each stratum and how many of the pronoun's posts it holds
+    """
+    lowest, highest = connection.execute(
+        "SELECT (SELECT MIN(rowid) FROM post WHERE pronoun=?), (SELECT MAX(rowid) FROM post WHERE pronoun=?)",
+        (pronoun, pronoun),
+    ).fetchone()
+
+    if lowest is None:
+        return []
+
+    span = highest - lowest + 1
+    strata = min(strata, span)
+    # the rowid lowest + offset is in stratum offset * strata // span, so stratum s starts at the offset ceil(s * span / strata)
+    starts = [lowest + (stratum * span + strata - 1) // strata for stratum in range(strata + 1)]
+    counts = dict(connection.execute(
+        "SELECT (rowid - ?) * ? / ?, COUNT(*) FROM post WHERE pronoun=? GROUP BY 1",
+        (lowest, strata, span, pronoun),
+    ).fetchall())
+
+    return [(starts[stratum], starts[stratum + 1] - 1, counts.get(stratum, 0)) for stratum in range(strata)]
+
+
+def allocate_sample(counts, sample_size):
+    """Shares a sample out between strata in proportion to their posts
+
+    Each stratum gets the whole part of its share, and the posts left over go to the strata
+    with the largest fractions (the largest remainder method), so the shares add up to the
+    sample size exactly. A share is never more than the stratum's posts.
+
+    Args:
+        counts ([int]): how many posts each stratum holds
+        sample_size (int): how many posts to sample, at most the total of counts
+
+    Returns:
+        [int]: how many posts to sample from each stratum
+    """
+    population = sum(counts)
+
+    if not population:
+        return [0] * len(counts)
+
+    sizes = [count * sample_size // population for count in counts]
+    left_over = sample_size - sum(sizes)
+    by_fraction = sorted(range(len(counts)), key=lambda stratum: (counts[stratum] * sample_size) % population, reverse=True)
+
+    for stratum in by_fraction[:left_over]:
+        sizes[stratum] += 1
+
+    return sizes
+
+
+def sample_stratum(connection, pronoun, columns, stratum, size, generator, batch_size=500):
+    """Picks posts of a pronoun uniformly at random from a range of rowids
+
+    Rowids are drawn from the range without replacement and looked up in batches, keeping
+    the ones that are the pronoun's posts until there are enough, so only about size times
+    the range's width over its posts rows are sought. When that would be more than reading
+    the range, the range is read instead.
+
+    Args:
+        connection (Connection): connection to the database
+        pronoun (str): the pronoun
+        columns (str): the quoted columns of a row
+        stratum ((int, int, int)): the first and last rowid of the range and how many of the pronoun's posts it holds
+        size (int): how many posts to pick
+        generator (random.Random): makes the picks
+        batch_size (int, optional): how many rowids to look up per query. Defaults to 500.
+
+    Returns:
+        list: the picked rows
+    """
+    low, high, count = stratum
+    width = high - low + 1
+
+    if not size:
+        return []
+
+    if size * width >= count * count:
+        rows = connection.execute(f"SELECT {columns}, rowid FROM post WHERE pronoun=? AND rowid BETWEEN ? AND ?", (pronoun, low, high)).fetchall()
+        return generator.sample(rows, min(size, len(rows)))
+
+    tried = set()
+    picked = []
+
+    while len(picked) < size and len(tried) < width:
+        # enough draws to find the posts still needed at the range's density, with a margin
+        wanted = min(batch_size, width - len(tried), (size - len(picked)) * width // count + 8)
+        batch = []
+        while len(batch) < wanted:
+            rowid = generator.randint(low, high)
+            if rowid not in tried:
+                tried.add(rowid)
+                batch.append(rowid)
+
+        placeholders = ", ".join("?" * len(batch))
+        found = {row[ROWID_INDEX]: row for row in connection.execute(f"SELECT {columns}, rowid FROM post WHERE pronoun=? AND rowid IN ({placeholders})", (pronoun, *batch))}
+        # the posts are kept in the order their rowids were drawn, so the first size of them are a uniform pick
+        picked.extend(found[rowid] for rowid in batch if rowid in found)
+
+    return picked[:size]
+
+
+def sample_rows(connection, pronoun, sample_size=DEFAULT_SAMPLE_SIZE, seed=None, strata=DEFAULT_STRATA):
+    """Samples a pronoun's posts, stratified by rowid
+
+    The range of the pronoun's rowids (which is roughly the order its posts were collected
+    in) is cut into strata of the same width. The sample is shared out between them in
+    proportion to their posts, and each stratum's share is picked uniformly at random from
+    its posts, so every post is as likely to be sampled as any other. Finding the strata
+    counts the pronoun's posts in its index; only the picked posts are read.
+
+    Args:
+        connection (Connection): connection to the database
+        pronoun (str): the pronoun
+        sample_size (int, optional): how many posts to sample. Defaults to DEFAULT_SAMPLE_SIZE.
+        seed (int, optional): seeds the random picks, to repeat a sample. Defaults to None.
+        strata (int, optional): how many strata to cut the rowids into, at most. Defaults to DEFAULT_STRATA.
+
+    Returns:
+        (list, int): the sampled rows in rowid order, and how many posts the pronoun has
+    """
+    columns = ", ".join(f'"{column}"' for column in get_row_columns(connection))
+    ranges = get_strata(connection, pronoun, min(strata, sample_size))
+    population = sum(count for _, _, count in ranges)
+
+    if not population:
+        return [], 0
+
+    # a sample as big as the pronoun is the whole pronoun
+    if population <= sample_size:
+        rows = connection.execute(f"SELECT {columns}, rowid FROM post WHERE pronoun=? ORDER BY rowid", (pronoun,)).fetchall()
+        return rows, population
+
+    generator = random.Random(seed)
+    sizes = allocate_sample([count for _, _, count in ranges], sample_size)
+    rows = []
+
+    for stratum, size in zip(ranges, sizes):
+        rows.extend(sample_stratum(connection, pronoun, columns, stratum, size, generator))
+
+    rows.sort(key=lambda row: row[ROWID_INDEX])
+
+    return rows, population
+
+
+def count_distinct_authors(rows, precision=DEFAULT_PRECISION):
+    """Estimates how many accounts made some posts from the DIDs in their URIs
+
+    Args:
+        rows (iterable): the posts' rows
+        precision (int, optional): the HyperLogLog precision. Defaults to DEFAULT_PRECISION.
+
+    Returns:
+        HyperLogLog: the estimator
+    """
+    authors = HyperLogLog(precision)
+
+    for row in rows:
+        did = get_did(row[0])
+        if did:
+            authors.add(did)
+
+    return authors
+
+
+class Preview:
+    """
+    A quick, approximate look at a pronoun's posts: the category rates and top terms of a
+    sample, scaled up to every post, and the number of distinct authors in the sample. Every
+    figure comes with a 95% margin of error.
+
+    Attributes:
+        pronoun (str): The pronoun.
+        population (int): How many posts the pronoun has.
+        rows (list): The sampled rows, in rowid order.
+        scanner (SketchScanner): The results of scanning the sample.
+        authors (HyperLogLog): The distinct authors of the sampled posts, if they were counted.
+    """
+
+    def __init__(self, connection, pronoun, categories, sample_size=DEFAULT_SAMPLE_SIZE, capacity=DEFAULT_SKETCH_SIZE, keep_rows=False, seed=None, authors=True, profiler=None):
+        """
+        Samples and scans the pronoun's posts.
+
+        Args:
+            connection (sqlite3.Connection): The SQLite database connection.
+            pronoun (str): The pronoun.
+            categories ([str]): The categories to scan the sample for.
+            sample_size (int, optional): How many posts to sample. Defaults to DEFAULT_SAMPLE_SIZE.
+            capacity (int, optional): How many terms each category's sketch counts. Defaults to DEFAULT_SKETCH_SIZE.
+            keep_rows (bool, optional): Keep the sampled rows that match each category. Defaults to False.
+            seed (int, optional): Seeds the sample, to repeat it. Defaults to None.
+            authors (bool, optional): Count the distinct authors of the sampled posts too. Defaults to True.
+            profiler (Profiler, optional): Record the sample, scan and authors stages here. Defaults to None.
+        """
+        profiler = profiler or Profiler(enabled=False)
+        self.pronoun = pronoun
+
+        with profiler.stage("sample") as stage:
+            self.rows, self.population = sample_rows(connection, pronoun, sample_size, seed)
+            stage.rows = len(self.rows)
+
+        with profiler.stage(f"sketch {' '.join(categories)}") as stage:
+            self.scanner = SketchScanner(categories, keep_rows=keep_rows, capacity=capacity).scan(self.rows)
+            stage.rows = len(self.rows)
+            stage.regex_searches = self.scanner.searches
+
+        self.authors = None
+        if authors:
+            with profiler.stage("authors") as stage:
+                self.authors = count_distinct_authors(self.rows)
+                stage.rows = len(self.rows)
+
+    def get_scale(self):
+        """
+        Gets how many posts each sampled post stands for.
+
+        Returns:
+            float: the population over the sample size
+        """
+        return self.population / len(self.rows) if self.rows else 0.0
+
+    def get_matching_posts(self, category):
+        """
+        Estimates how many posts match a category.
+
+        Args:
+            category (str): the category name
+
+        Returns:
+            (float, float): the estimate and its margin of error
+        """
+        return get_rate_bounds(len(self.scanner.rowids[category]), len(self.rows), self.population)
+
+    def get_term_estimates(self, category, k=None):
+        """
+        Estimates how often the most frequent terms of a category occur in every post.
+
+        A term's margin adds the sketch's error to a Poisson sampling error of its count in the
+        sample, both scaled up to the population. With the whole population sampled, only the
+        sketch's error is left.
+
+        Args:
+            category (str): the category name
+            k (int, optional): how many terms. Defaults to every term counted.
+
+        Returns:
+            [(str, float, float)]: each term, its estimated occurrences and the margin either side, most frequent first
+        """
+        scale = self.get_scale()
+        sampled = len(self.rows) < self.population
+        estimates = []
+
+        for term, count, error in self.scanner.sketches[category].get_top(k):
+            sampling_error = Z_95 * math.sqrt(count) if sampled else 0.0
+            estimates.append((term, count * scale, (sampling_error + error) * scale))
+
+        return estimates
+
+    def get_rows(self, category):
+        """
+        Gets the sampled rows that matched a category.
+
+        Args:
+            category (str): the category name
+
+        Returns:
+            list: the rows, in rowid order
+        """
+        return self.scanner.get_rows(category)
+
+    def to_dict(self, k=None):
+        """
+        Gets the preview's figures in a form that can be stored as JSON.
+
+        Args:
+            k (int, optional): how many terms of each category. Defaults to every term counted.
+
+        Returns:
+            dict: the population, sample size, distinct authors of the sample and each category's estimates
+        """
+        categories = {}
+
+        for category in self.scanner.categories:
+            posts, margin = self.get_matching_posts(category)
+            categories[category] = {
+                "posts": posts,
+                "margin": margin,
+                "terms": [{"term": term, "occurrences": occurrences, "margin": term_margin} for term, occurrences, term_margin in self.get_term_estimates(category, k)],
+            }
+
+        authors = None
+        if self.authors is not None:
+            estimate = self.authors.get_estimate()
+            authors = {"estimate": estimate, "margin": estimate * self.authors.get_error(), "relative_margin": self.authors.get_error()}
+
+        return {
+            "pronoun": self.pronoun,
+            "population": self.population,
+            "sample_size": len(self.rows),
+            "authors": authors,
+            "categories": categories,
+        }
@@ -0,0 +1,246 @@
+import hashlib
+import json
+import os
+import re
+
+from src.constants import CACHE_DIRECTORY, DEFAULT_CACHE_SIZE
+from src.database import get_database_file
+from src.indexes import has_pronoun_index
+from src.scanner import CATEGORY_FINDERS, CATEGORY_PATTERNS
+
+
+def get_hash(value):
+    """Hashes a value that can be written as JSON
+
+    Args:
+        value: any JSON-serializable value
+
+    Returns:
+        str: a hex sha256 digest
+    """
+    serialized = json.dumps(value, sort_keys=True)
+
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+def get_pattern_hash(category):
+    """Hashes the pattern and flags of a category, and the finder used in its place if there's one,
+    so changing how a category is found invalidates its results
+
+    Args:
+        category (str): the category name
+
+    Returns:
+        str: a hex sha256 digest
+    """
+    pattern, flags = CATEGORY_PATTERNS[category]
+
+    if isinstance(pattern, re.Pattern):
+        pattern, flags = pattern.pattern, flags | pattern.flags
+
+    finder = CATEGORY_FINDERS.get(category)
+
+    if finder is not None:
+        return get_hash([pattern, int(flags), finder.to_dict()])
+
+    return get_hash([pattern, int(flags)])
+
+
+def get_file_stat(path):
+    """Gets the size and modification time of a file
+
+    Args:
+        path (str): the file
+
+    Returns:
+        [int]: its size and modification time in nanoseconds, or None if there's no such file
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def get_database_fingerprint(connection, pronoun=None):
+    """Fingerprints a database by its file's size and modification time, and its schema.
+    In WAL mode a commit only reaches the main file at a checkpoint, so the -wal file's size
+    and modification time are part of it too, and a pronoun's post count and highest rowid
+    catch rows appended or deleted between checkpoints. Without an index on the pronoun,
+    counting its posts would read the whole table, so the table's highest rowid, which is
+    one seek, is taken instead and still catches appends.
+
+    Args:
+        connection (Connection): connection to the database
+        pronoun (str, optional): the pronoun whose posts the fingerprint is for. Defaults to None.
+
+    Returns:
+        dict: the fingerprint, or None for a database that isn't a file
+    """
+    database_file = get_database_file(connection)
+
+    if not database_file:
+        return None
+
+    stat = os.stat(database_file)
+    schema = connection.execute("SELECT type, name, sql FROM sqlite_master ORDER BY type, name").fetchall()
+    fingerprint = {
+        "file": os.path.abspath(database_file),
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "wal": get_file_stat(f"{database_file}-wal"),
+        "schema": get_hash(schema),
+    }
+
+    if pronoun is None:
+        return fingerprint
+
+    if has_pronoun_index(connection):
+        count, high_water = connection.execute("SELECT COUNT(*), MAX(rowid) FROM post WHERE pronoun=?", (pronoun,)).fetchone()
+        fingerprint["rows"] = count
+    else:
+        (high_water,) = connection.execute("SELECT MAX(rowid) FROM post").fetchone()
+
+    fingerprint["high_water"] = high_water or 0
+
+    return fingerprint
+
+
+class ResultCache:
+    """
+    An on-disk cache of scan results, one JSON file per entry. When the files add up to
+    more than max_bytes, the least recently used ones are deleted.
+
+    Attributes:
+        directory (str): Where the entries are written.
+        max_bytes (int): How large the entries may get in total.
+        hits (int): Lookups that found a stored entry.
+        misses (int): Lookups that didn't.
+    """
+
+    def __init__(self, directory=f"{CACHE_DIRECTORY}/results", max_bytes=DEFAULT_CACHE_SIZE):
+        """
+        Initializes the cache, creating its directory if needed.
+
+        Args:
+            directory (str, optional): Where the entries are written. Defaults to .cache/results.
+            max_bytes (int, optional): How large the entries may get in total. Defaults to DEFAULT_CACHE_SIZE.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def get_key(self, fingerprint, pronoun, category, row_filter=None):
+        """
+        Builds the key of a pronoun's results for a category.
+
+        Args:
+            fingerprint (dict): the database fingerprint
+            pronoun (str): the pronoun
+            category (str): the category name
+            row_filter (RowFilter, optional): the filter the rows were read with. Defaults to None.
+
+        Returns:
+            str: the key
+        """
+        parts = [fingerprint, pronoun, category, get_pattern_hash(category)]
+
+        # unfiltered results keep the keys they had before filters existed
+        if row_filter and not row_filter.is_empty():
+            parts.append(row_filter.to_dict())
+
+        return get_hash(parts)
+
+    def get_path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        """
+        Looks up an entry, marking it as recently used.
+
+        Args:
+            key (str): the key
+
+        Returns:
+            dict: the stored value, or None
+        """
+        path = self.get_path(key)
+
+        try:
+            with open(path, encoding="utf-8") as file:
+                value = json.load(file)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        # another process may have evicted it since
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+        self.hits += 1
+
+        return value
+
+    def put(self, key, value):
+        """
+        Stores an entry, then evicts old entries if the cache is over its size.
+
+        Args:
+            key (str): the key
+            value (dict): a JSON-serializable value
+        """
+        path = self.get_path(key)
+        # one per process, so shard workers storing the same key don't replace each other's
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump(value, file)
+
+        os.replace(temporary_path, path)
+        self.evict()
+
+    def evict(self):
+        """
+        Deletes the least recently used entries until the cache fits in max_bytes.
+        Shard workers share the cache and evict at the same time, so an entry another
+        process deleted first is skipped.
+        """
+        entries = []
+
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+
+                entries.append((stat.st_mtime_ns, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+            total -= size
+
+    def get_stats(self):
+        """
+        Gets the lookup counters.
+
+        Returns:
+            dict: hits and misses
+        """
+        return {"hits": self.hits, "misses": self.misses}
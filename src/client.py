@@ -0,0 +1,230 @@
+import http.client
+import json
+import socket
+from urllib.parse import urlencode
+
+from src.discourse import DiscourseTally
+from src.profiler import Profiler
+from src.pronoun import PronounCollection
+from src.query import RowFilter
+from src.scanner import CATEGORY_PATTERNS
+from src.service import DEFAULT_ADDRESS, DEFAULT_PAGE_SIZE, parse_address
+
+DEFAULT_TIMEOUT = 600
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """An HTTPConnection to a server listening on a Unix socket"""
+
+    def __init__(self, path, timeout=DEFAULT_TIMEOUT):
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+class ServiceClient:
+    """
+    Asks a running serve.py for answers instead of reading the database.
+
+    Attributes:
+        address (str): Where the server listens (see src.service.parse_address).
+        timeout (float): How many seconds to wait for an answer.
+    """
+
+    def __init__(self, address=DEFAULT_ADDRESS, timeout=DEFAULT_TIMEOUT):
+        """
+        Initializes the client. Nothing is sent until a query is made.
+
+        Args:
+            address (str, optional): Where the server listens. Defaults to DEFAULT_ADDRESS.
+            timeout (float, optional): How many seconds to wait for an answer. Defaults to DEFAULT_TIMEOUT.
+        """
+        self.address = address
+        self.timeout = timeout
+
+    def get_connection(self):
+        host, port = parse_address(self.address)
+
+        if port is None:
+            return UnixHTTPConnection(host, self.timeout)
+
+        return http.client.HTTPConnection(host, port, timeout=self.timeout)
+
+    def get(self, path, **parameters):
+        """
+        Makes a query.
+
+        Args:
+            path (str): the query, e.g. /frequencies
+            **parameters: its parameters. Lists are joined with commas and None is left out.
+
+        Raises:
+            OSError: if the server can't be reached
+            ValueError: if the server couldn't answer
+
+        Returns:
+            dict: the answer
+        """
+        query = urlencode({
+            name: ",".join(value) if isinstance(value, (list, tuple)) else value
+            for name, value in parameters.items()
+            if value is not None
+        })
+        connection = self.get_connection()
+
+        try:
+            connection.request("GET", f"{path}?{query}" if query else path)
+            response = connection.getresponse()
+            answer = json.loads(response.read().decode("utf-8"))
+        finally:
+            connection.close()
+
+        if response.status != 200:
+            raise ValueError(answer.get("error", f"The server answered {response.status}"))
+
+        return answer
+
+    def get_status(self):
+        """
+        Asks the server which database it serves and what it has loaded.
+
+        Returns:
+            dict: the database, its highest rowid, the row count of each loaded pronoun and the uptime in seconds,
+                or None if no server is running at the address
+        """
+        try:
+            return self.get("/status")
+        except OSError:
+            return None
+
+    def get_pronoun_counts(self):
+        return self.get("/counts")["counts"]
+
+    def get_tally(self, pronoun, prepositions, personal_pronouns):
+        """
+        Gets a pronoun's discourse tally.
+
+        Args:
+            pronoun (str): the pronoun
+            prepositions ([str]): prepositions / conjunctions to look for before the pronoun
+            personal_pronouns ([str]): personal pronouns to look for
+
+        Returns:
+            DiscourseTally: the tally
+        """
+        data = self.get("/tally", pronoun=pronoun, prepositions=prepositions, personalPronouns=personal_pronouns)["tally"]
+
+        return DiscourseTally.from_dict(pronoun, prepositions, personal_pronouns, data)
+
+
+class RemoteRows:
+    """
+    A re-iterable source of a pronoun's rows, or of the rows matching some categories, read
+    from the server a page at a time.
+
+    Attributes:
+        client (ServiceClient): The server.
+        pronoun (str): The pronoun.
+        categories ([str]): Only the rows matching every one of these categories.
+        without ([str]): Only the rows matching none of these categories.
+        page_size (int): How many rows are fetched at a time.
+    """
+
+    def __init__(self, client, pronoun, categories=(), without=(), page_size=DEFAULT_PAGE_SIZE):
+        """
+        Initializes the rows. Nothing is fetched until they're iterated.
+
+        Args:
+            client (ServiceClient): The server.
+            pronoun (str): The pronoun.
+            categories ([str], optional): Only the rows matching every one of these categories. Defaults to every row.
+            without ([str], optional): Only the rows matching none of these categories. Defaults to none.
+            page_size (int, optional): How many rows are fetched at a time. Defaults to DEFAULT_PAGE_SIZE.
+        """
+        self.client = client
+        self.pronoun = pronoun
+        self.categories = list(categories)
+        self.without = list(without)
+        self.page_size = page_size
+
+    def get_page(self, offset, limit):
+        return self.client.get("/rows", pronoun=self.pronoun, categories=self.categories or None, without=self.without or None, offset=offset, limit=limit)
+
+    def __iter__(self):
+        offset = 0
+
+        while True:
+            page = self.get_page(offset, self.page_size)
+            yield from page["rows"]
+
+            offset += len(page["rows"])
+            if not page["rows"] or offset >= page["total"]:
+                break
+
+    def __len__(self):
+        return self.get_page(0, 0)["total"]
+
+
+class RemoteCollection(PronounCollection):
+    """
+    A PronounCollection whose posts are held by a running serve.py. Every category was
+    scanned there when the pronoun was loaded, so frequencies, rows and co-occurrences are
+    asked for instead of computed, and nothing is read from the database here.
+
+    Attributes:
+        client (ServiceClient): The server.
+        page_size (int): How many rows are fetched at a time.
+    """
+
+    def __init__(self, pronoun_name, client, page_size=DEFAULT_PAGE_SIZE, profiler=None):
+        """
+        Initializes the collection. Nothing is asked for until it's needed.
+
+        Args:
+            pronoun_name (str): The pronoun.
+            client (ServiceClient): The server.
+            page_size (int, optional): How many rows are fetched at a time. Defaults to DEFAULT_PAGE_SIZE.
+            profiler (Profiler, optional): Record each query here. Defaults to None.
+        """
+        self.pronoun = pronoun_name
+        self.client = client
+        self.page_size = page_size
+        self.connection = None
+        self.scanners = {}
+        self.cache = None
+        self.fingerprint = None
+        self.incremental = None
+        self.profiler = profiler or Profiler(enabled=False)
+        self.row_filter = RowFilter()
+        self.masks = None
+        self.rows = RemoteRows(client, pronoun_name, page_size=page_size)
+
+    def scan(self, categories=None, keep_rows=True, workers=1):
+        """
+        Does nothing: the server has scanned every category already.
+
+        Returns:
+            dict: no scanners
+        """
+        return self.scanners
+
+    def get_category_frequencies(self, category):
+        with self.profiler.stage(f"query {category} frequencies"):
+            return self.client.get("/frequencies", pronoun=self.pronoun, category=category)["frequencies"]
+
+    def get_category_rows(self, category):
+        return list(self.iter_category_rows(category))
+
+    def iter_category_rows(self, category):
+        yield from RemoteRows(self.client, self.pronoun, [category], page_size=self.page_size)
+
+    def get_rows_with(self, categories, without=()):
+        return list(RemoteRows(self.client, self.pronoun, categories, without, self.page_size))
+
+    def get_cooccurrence(self, categories=None):
+        with self.profiler.stage("query co-occurrence"):
+            return self.client.get("/cooccurrence", pronoun=self.pronoun, categories=categories or list(CATEGORY_PATTERNS))["cooccurrence"]
@@ -0,0 +1,164 @@
+from collections import Counter
+
+from src.approx import SpaceSaving
+from src.discourse import POSITIONS
+from src.matcher import TOKEN, fold_case
+
+DEFAULT_WINDOW = 2
+DEFAULT_CAPACITY = 1000
+DEFAULT_TOP_K = 20
+
+# how many terms are collected before they're counted into the sketches
+PENDING_SIZE = 100_000
+
+KINDS = ["left", "right", "bigrams", "trigrams"]
+
+
+class CollocationTally:
+    """
+    Finds the words used around a pronoun. Each post is split into words once, and every
+    time the pronoun occurs the words within `window` on either side are counted as its left
+    and right collocates, along with the bigrams and trigrams that include it. The position
+    of the pronoun among the words is tallied in the same pass.
+
+    Words are compared the way re.IGNORECASE compares them (see fold_case). The collocates
+    and n-grams are counted in SpaceSaving sketches, so memory stays fixed however many
+    distinct words there are, and the most frequent ones are kept. Terms are collected in
+    batches and counted with Counter before they go into the sketches, so each distinct term
+    of a batch is added once.
+
+    Attributes:
+        pronoun (str): The pronoun, lowercased.
+        window (int): How many words either side of the pronoun are its collocates.
+        sketches (dict): The SpaceSaving sketch of each kind of term: words before the pronoun ("left"),
+            words after it ("right"), and the "bigrams" and "trigrams" that include it, as tuples of words.
+        pending (dict): Terms of each kind not yet counted into the sketches.
+        position_counts (dict): Posts with the pronoun as the first word, a middle word, the last word, or the only word.
+        total (int): How many posts have been tallied.
+    """
+
+    def __init__(self, pronoun, window=DEFAULT_WINDOW, capacity=DEFAULT_CAPACITY):
+        """
+        Initializes an empty tally.
+
+        Args:
+            pronoun (str): The pronoun.
+            window (int, optional): How many words either side of the pronoun to count. Defaults to DEFAULT_WINDOW.
+            capacity (int, optional): How many terms each sketch keeps. Defaults to DEFAULT_CAPACITY.
+        """
+        self.pronoun = fold_case(pronoun)
+        self.window = window
+        self.sketches = {kind: SpaceSaving(capacity) for kind in KINDS}
+        self.pending = {kind: [] for kind in KINDS}
+        self.position_counts = dict.fromkeys(POSITIONS, 0)
+        self.total = 0
+
+    def add(self, text):
+        """
+        Tallies a single post.
+
+        Args:
+            text (str): the text of the post
+        """
+        self.total += 1
+
+        if text is None:
+            return
+
+        tokens = TOKEN.findall(fold_case(text))
+        pronoun = self.pronoun
+        indexes = [index for index, token in enumerate(tokens) if token == pronoun]
+
+        if not indexes:
+            return
+
+        last = len(tokens) - 1
+        window = self.window
+        left = self.pending["left"]
+        right = self.pending["right"]
+
+        for index in indexes:
+            left.extend(tokens[max(0, index - window):index])
+            right.extend(tokens[index + 1:index + 1 + window])
+
+        # each n-gram is counted once however many times the pronoun is in it, in the order
+        # it's found so ties between counts fall the same way on every run
+        self.pending["bigrams"].extend(dict.fromkeys(tuple(tokens[start:start + 2]) for index in indexes for start in range(max(0, index - 1), min(index, last - 1) + 1)))
+        self.pending["trigrams"].extend(dict.fromkeys(tuple(tokens[start:start + 3]) for index in indexes for start in range(max(0, index - 2), min(index, last - 2) + 1)))
+
+        if indexes[0] == 0:
+            self.position_counts["start"] += 1
+        if indexes[-1] == last:
+            self.position_counts["end"] += 1
+        if any(0 < index < last for index in indexes):
+            self.position_counts["middle"] += 1
+        if last == 0:
+            self.position_counts["only"] += 1
+
+        if len(left) + len(right) > PENDING_SIZE:
+            self.flush()
+
+    def flush(self):
+        """
+        Counts the pending terms into the sketches.
+        """
+        for kind, terms in self.pending.items():
+            sketch = self.sketches[kind]
+
+            for term, count in Counter(terms).items():
+                sketch.add(term, count)
+
+            terms.clear()
+
+    def get_top(self, kind, k=None):
+        """
+        Gets the most frequent terms of a kind.
+
+        Args:
+            kind (str): "left", "right", "bigrams" or "trigrams"
+            k (int, optional): how many terms. Defaults to every term kept.
+
+        Returns:
+            [(str, int, int)]: each term (n-grams joined by spaces), its count and the most the count can be over, most frequent first
+        """
+        self.flush()
+
+        return [(term if isinstance(term, str) else " ".join(term), count, error) for term, count, error in self.sketches[kind].get_top(k)]
+
+    def tally(self, texts):
+        """
+        Tallies every post.
+
+        Args:
+            texts (iterable): the text of each post
+
+        Returns:
+            CollocationTally: the tally, so calls can be chained
+        """
+        for text in texts:
+            self.add(text)
+
+        return self
+
+    def merge(self, other):
+        """
+        Adds the counts of another tally of the same pronoun.
+
+        Args:
+            other (CollocationTally): a tally of other posts
+
+        Returns:
+            CollocationTally: the tally, so calls can be chained
+        """
+        self.flush()
+        other.flush()
+
+        for kind in KINDS:
+            self.sketches[kind].merge(other.sketches[kind])
+
+        for position, count in other.position_counts.items():
+            self.position_counts[position] += count
+
+        self.total += other.total
+
+        return self
@@ -1,3 +1,8 @@
 DEFAULT_DATABASE_FILE = "../db.pronouns.sqlite"
 OUTPUT_DIRECTORY = "results"
-SOCIAL_PRONOUNS = ["dude", "bro", "bruh", "sis", "chat", "fam"]
\ No newline at end of file
+CACHE_DIRECTORY = ".cache"
+SOCIAL_PRONOUNS = ["dude", "bro", "bruh", "sis", "chat", "fam"]
+DEFAULT_BATCH_SIZE = 10000
+DEFAULT_CACHE_SIZE = 256 * 1024 * 1024
+DEFAULT_MMAP_SIZE = 1024 * 1024 * 1024
+DEFAULT_PAGE_CACHE_SIZE = 64 * 1024 * 1024
@@ -0,0 +1,54 @@
+import sqlite3
+from pathlib import Path
+
+from src.constants import DEFAULT_MMAP_SIZE, DEFAULT_PAGE_CACHE_SIZE
+
+
+def get_database_file(connection):
+    """Gets the path of the file a connection has open
+
+    Args:
+        connection (Connection): connection to the database
+
+    Returns:
+        str: path to the main database file ('' for an in-memory database)
+    """
+    for _, name, file in connection.execute("PRAGMA database_list"):
+        if name == "main":
+            return file
+
+    return ""
+
+
+def tune_connection(connection, mmap_size=DEFAULT_MMAP_SIZE, cache_size=DEFAULT_PAGE_CACHE_SIZE):
+    """Sets the pragmas that make long reads fast
+
+    Args:
+        connection (Connection): connection to the database
+        mmap_size (int, optional): how many bytes of the file to memory-map. Defaults to DEFAULT_MMAP_SIZE.
+        cache_size (int, optional): how many bytes of pages to cache. Defaults to DEFAULT_PAGE_CACHE_SIZE.
+    """
+    # pragmas can't take bound parameters, so the values are forced to integers
+    connection.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+    # a negative cache_size is in kibibytes rather than pages
+    connection.execute(f"PRAGMA cache_size={-int(cache_size) // 1024}")
+    connection.execute("PRAGMA temp_store=MEMORY")
+
+
+def connect_read_only(database_file, tune=True):
+    """Opens a read-only connection to a database
+
+    Args:
+        database_file (str): path to a sqlite database
+        tune (bool, optional): Set the pragmas in tune_connection. Defaults to True.
+
+    Returns:
+        Connection: a connection that can't write to the database
+    """
+    uri = f"{Path(database_file).resolve().as_uri()}?mode=ro"
+    connection = sqlite3.connect(uri, uri=True)
+
+    if tune:
+        tune_connection(connection)
+
+    return connection
@@ -0,0 +1,240 @@
+import re
+import string
+
+POSITIONS = ["start", "middle", "end", "only"]
+
+# SQLite's built-in LOWER() only folds ASCII letters
+ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def sqlite_lower(text):
+    """Lowercases text the way SQLite's LOWER() does
+
+    Args:
+        text (str): text to lowercase
+
+    Returns:
+        str: the text with only ASCII letters lowercased
+    """
+    if text.isascii():
+        return text.lower()
+
+    return text.translate(ASCII_LOWER)
+
+
+def get_any_word_pattern(words, suffix):
+    """Builds one pattern that finds every word of a list, overlapping or not
+
+    The alternation sits in a lookahead so findall tries it at every position.
+    For a list of single words this finds exactly the words that `\\b(word)<suffix>`
+    would find when searched one at a time.
+
+    Args:
+        words ([str]): words to find
+        suffix (str): pattern that must follow the word
+
+    Returns:
+        Pattern: a compiled pattern whose first group is the word, or None for no words
+    """
+    if not words:
+        return None
+
+    return re.compile(f"(?=\\b({'|'.join(words)}){suffix})")
+
+
+def escape_like(text):
+    """Escapes the characters LIKE gives a meaning to, for `LIKE ... ESCAPE '\\'`
+
+    Args:
+        text (str): text to match literally
+
+    Returns:
+        str: the text with %, _ and the backslash escaped
+    """
+    return re.sub(r"([%_\\])", r"\\\1", text)
+
+
+def get_position_counts(connection, pronoun):
+    """Counts the pronoun's posts in each position with one aggregate query
+
+    LIKE ignores the case of ASCII letters only, like LOWER() does, so the LIKE patterns find the
+    same posts as DiscourseTally's position patterns do in the lowercased text, `$` matching
+    before a newline that ends the text as well as at the end. SQLite counts them without
+    calling back into Python for each post. A post where the pronoun follows a ^ or comes before
+    a $, which the middle pattern doesn't count, is checked with GLOB.
+
+    Args:
+        connection (Connection): connection to the database
+        pronoun (str): the pronoun
+
+    Returns:
+        dict: posts with the pronoun in each position
+    """
+    like = escape_like(pronoun)
+    glob = "".join(f"[{character}]" if character in "*?[" else character for character in pronoun)
+    query = (
+        "SELECT "
+        "TOTAL(text LIKE :start ESCAPE '\\'), "
+        "TOTAL(text LIKE :middle ESCAPE '\\' AND (NOT (text LIKE :caret ESCAPE '\\' OR text LIKE :dollar ESCAPE '\\') OR LOWER(text) GLOB :glob)), "
+        "TOTAL(text LIKE :end ESCAPE '\\' OR text LIKE :end || char(10) ESCAPE '\\'), "
+        "TOTAL(text LIKE :only ESCAPE '\\' OR text LIKE :only || char(10) ESCAPE '\\') "
+        "FROM post WHERE pronoun = :pronoun"
+    )
+    counts = connection.execute(query, {
+        "start": f"{like}%",
+        "middle": f"%_{like}_%",
+        "caret": f"%^{like}%",
+        "dollar": f"%{like}$%",
+        "glob": f"*[^^]{glob}[^$]*",
+        "end": f"%{like}",
+        "only": like,
+        "pronoun": pronoun,
+    }).fetchone()
+
+    return {position: int(count) for position, count in zip(POSITIONS, counts)}
+
+
+class DiscourseTally:
+    """
+    Counts how a pronoun is used in the discourse: which prepositions / conjunctions come
+    right before it, which personal pronouns occur with it, and where it sits in the post.
+    Every count is gathered in one pass over the posts, with the same matching rules as the
+    per-term REGEXP queries summarize.py used to run.
+
+    Attributes:
+        pronoun (str): The pronoun being tallied.
+        prepositions ([str]): Prepositions / conjunctions to look for before the pronoun.
+        personal_pronouns ([str]): Personal pronouns to look for in the post.
+        preposition_counts (dict): Posts with each preposition / conjunction before the pronoun.
+        personal_pronoun_counts (dict): Posts with each personal pronoun.
+        position_counts (dict): Posts with the pronoun in each position.
+        total (int): How many posts have been tallied.
+    """
+
+    def __init__(self, pronoun, prepositions, personal_pronouns, positions=True):
+        """
+        Initializes an empty tally.
+
+        Args:
+            pronoun (str): The pronoun being tallied.
+            prepositions ([str]): Prepositions / conjunctions to look for before the pronoun.
+            personal_pronouns ([str]): Personal pronouns to look for in the post.
+            positions (bool, optional): Tally the positions too. Defaults to True.
+        """
+        self.pronoun = pronoun
+        self.prepositions = list(prepositions)
+        self.personal_pronouns = list(personal_pronouns)
+
+        self.preposition_pattern = get_any_word_pattern(self.prepositions, f"\\s({pronoun})")
+        self.personal_pronoun_pattern = get_any_word_pattern(self.personal_pronouns, "\\b")
+        self.position_patterns = {
+            "start": re.compile(f"^{pronoun}"),
+            "middle": re.compile(f"([^^]({pronoun})[^$])"),
+            "end": re.compile(f"{pronoun}$"),
+            "only": re.compile(f"^{pronoun}$"),
+        } if positions else {}
+
+        self.preposition_counts = dict.fromkeys(self.prepositions, 0)
+        self.personal_pronoun_counts = dict.fromkeys(self.personal_pronouns, 0)
+        self.position_counts = dict.fromkeys(POSITIONS, 0)
+        self.total = 0
+
+    def add(self, text):
+        """
+        Tallies a single post.
+
+        Args:
+            text (str): the text of the post
+        """
+        self.total += 1
+
+        if text is None:
+            return
+
+        if self.preposition_pattern:
+            for word in {match[0] for match in self.preposition_pattern.findall(text)}:
+                self.preposition_counts[word] += 1
+
+        # the personal pronoun and position queries matched against LOWER(text)
+        lowered = sqlite_lower(text)
+
+        if self.personal_pronoun_pattern:
+            for word in set(self.personal_pronoun_pattern.findall(lowered)):
+                self.personal_pronoun_counts[word] += 1
+
+        for position, pattern in self.position_patterns.items():
+            if pattern.search(lowered):
+                self.position_counts[position] += 1
+
+    def tally(self, texts):
+        """
+        Tallies every post.
+
+        Args:
+            texts (iterable): the text of each post
+
+        Returns:
+            DiscourseTally: the tally, so calls can be chained
+        """
+        for text in texts:
+            self.add(text)
+
+        return self
+
+    def merge(self, other):
+        """
+        Adds the counts of another tally of the same pronoun and terms.
+
+        Args:
+            other (DiscourseTally): a tally of other posts
+
+        Returns:
+            DiscourseTally: the tally, so calls can be chained
+        """
+        for counts, other_counts in (
+            (self.preposition_counts, other.preposition_counts),
+            (self.personal_pronoun_counts, other.personal_pronoun_counts),
+            (self.position_counts, other.position_counts),
+        ):
+            for key, count in other_counts.items():
+                counts[key] += count
+
+        self.total += other.total
+
+        return self
+
+    def to_dict(self):
+        """
+        Gets the counts in a form that can be stored as JSON.
+
+        Returns:
+            dict: every count and the total
+        """
+        return {
+            "preposition_counts": self.preposition_counts,
+            "personal_pronoun_counts": self.personal_pronoun_counts,
+            "position_counts": self.position_counts,
+            "total": self.total,
+        }
+
+    @classmethod
+    def from_dict(cls, pronoun, prepositions, personal_pronouns, data):
+        """
+        Rebuilds a tally from stored counts.
+
+        Args:
+            pronoun (str): The pronoun being tallied.
+            prepositions ([str]): Prepositions / conjunctions to look for before the pronoun.
+            personal_pronouns ([str]): Personal pronouns to look for in the post.
+            data (dict): counts from to_dict
+
+        Returns:
+            DiscourseTally: a tally holding the stored counts
+        """
+        tally = cls(pronoun, prepositions, personal_pronouns)
+        tally.preposition_counts.update(data["preposition_counts"])
+        tally.personal_pronoun_counts.update(data["personal_pronoun_counts"])
+        tally.position_counts.update(data["position_counts"])
+        tally.total = data["total"]
+
+        return tally
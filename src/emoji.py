@@ -0,0 +1,215 @@
+import re
+
+from src.regexes import EMOJI_RANGES, EMOJI_REGEX
+
+# what each codepoint is to an emoji sequence
+NONE = 0
+PICTOGRAPH = 1  # an emoji on its own: every codepoint of EMOJI_RANGES not listed below
+REGIONAL_INDICATOR = 2  # half of a flag
+MODIFIER = 3  # a skin tone, which joins the emoji before it
+ZWJ = 4  # the zero width joiner, which joins two emojis into one
+VARIATION_SELECTOR = 5  # text or emoji presentation of the codepoint before it
+KEYCAP = 6  # the combining keycap, which makes a digit, # or * an emoji
+SYMBOL = 7  # a pictographic symbol outside EMOJI_RANGES, an emoji only with the emoji variation selector or in a ZWJ sequence
+TAG = 8  # tags spell out a subdivision flag after a black flag
+
+# every codepoint a sequence needs to know about is below this, except the tags
+TABLE_SIZE = 0x20000
+TAG_START = 0xE0020
+TAG_END = 0xE007F
+
+REGIONAL_INDICATOR_RANGE = (0x1F1E6, 0x1F1FF)
+MODIFIER_RANGE = (0x1F3FB, 0x1F3FF)
+EMOJI_PRESENTATION = "\ufe0f"
+KEYCAP_BASES = "0123456789#*"
+
+# Extended_Pictographic codepoints outside EMOJI_RANGES that are drawn as emojis in sequences
+SYMBOL_RANGES = [
+    (0x00A9, 0x00A9), (0x00AE, 0x00AE), (0x203C, 0x203C), (0x2049, 0x2049),
+    (0x2122, 0x2122), (0x2139, 0x2139), (0x2194, 0x21AA), (0x231A, 0x23FF),
+    (0x24C2, 0x24C2), (0x25AA, 0x25FE), (0x2600, 0x2701), (0x27B1, 0x27BF),
+    (0x2934, 0x2935), (0x2B05, 0x2B55), (0x3030, 0x3030), (0x303D, 0x303D),
+    (0x3297, 0x3297), (0x3299, 0x3299), (0x1F000, 0x1F0FF), (0x1F10D, 0x1F1AD),
+]
+
+
+def build_table():
+    """Builds the table of what each codepoint below TABLE_SIZE is to an emoji sequence
+
+    Returns:
+        bytearray: one kind (NONE, PICTOGRAPH, ...) per codepoint
+    """
+    table = bytearray(TABLE_SIZE)
+
+    for kind, ranges in (
+        (SYMBOL, SYMBOL_RANGES),
+        (PICTOGRAPH, EMOJI_RANGES),
+        (REGIONAL_INDICATOR, [REGIONAL_INDICATOR_RANGE]),
+        (MODIFIER, [MODIFIER_RANGE]),
+        (ZWJ, [(0x200D, 0x200D)]),
+        (VARIATION_SELECTOR, [(0xFE0E, 0xFE0F)]),
+        (KEYCAP, [(0x20E3, 0x20E3)]),
+    ):
+        for start, end in ranges:
+            table[start:end + 1] = bytes([kind]) * (end - start + 1)
+
+    return table
+
+
+EMOJI_TABLE = build_table()
+
+
+def get_ranges(kinds):
+    """Gets the ranges of codepoints in the table of any of some kinds
+
+    Args:
+        kinds ([int]): the kinds
+
+    Returns:
+        [(int, int)]: the inclusive ranges, in order
+    """
+    # the runs of those kinds are found in the table itself, as bytes
+    runs = re.compile(b"[" + re.escape(bytes(sorted(kinds))) + b"]+")
+
+    return [(match.start(), match.end() - 1) for match in runs.finditer(EMOJI_TABLE)]
+
+
+def get_class(ranges):
+    """Makes a character class of codepoint ranges
+
+    Args:
+        ranges ([(int, int)]): inclusive ranges
+
+    Returns:
+        str: the class
+    """
+    return "[" + "".join(f"{re.escape(chr(start))}-{re.escape(chr(end))}" for start, end in ranges) + "]"
+
+
+# a text without any emoji codepoint has nothing to find, and every sequence has an emoji,
+# half of a flag, a skin tone, a joiner, a variation selector or a keycap in it (a symbol needs
+# one of them after it). The regex engine checks for them in one pass over a bitmap of the
+# table's ranges, much faster than a search with groups, so texts without them are skipped.
+EMOJI_MARK = re.compile(get_class(get_ranges({PICTOGRAPH, REGIONAL_INDICATOR, MODIFIER})))
+SEQUENCE_MARK = re.compile(get_class(get_ranges({PICTOGRAPH, REGIONAL_INDICATOR, MODIFIER, ZWJ, VARIATION_SELECTOR, KEYCAP})))
+
+
+def build_sequence_pattern():
+    """Builds the pattern of one emoji sequence, a grapheme cluster, from the table's ranges
+
+    A pair of regional indicators is one flag, and an emoji takes its variation selector,
+    skin tone and tags, then any emoji joined to it with a zero width joiner. A symbol is
+    only an emoji with the emoji variation selector, a skin tone, or a joiner after it.
+    A digit, # or * is an emoji with the keycap after it.
+
+    Returns:
+        str: the pattern
+    """
+    pictograph = get_class(get_ranges({PICTOGRAPH}))
+    regional_indicator = get_class(get_ranges({REGIONAL_INDICATOR}))
+    modifier = get_class(get_ranges({MODIFIER}))
+    symbol = get_class(get_ranges({SYMBOL}))
+    selector = get_class(get_ranges({VARIATION_SELECTOR}))
+    joiner = get_class(get_ranges({ZWJ}))
+    keycap = get_class(get_ranges({KEYCAP}))
+    tags = get_class([(TAG_START, TAG_END)])
+
+    emoji = f"(?:{pictograph}|{modifier}|{symbol})"
+    modifiers = f"{selector}?{modifier}?{tags}*"
+    symbol_emoji = f"{symbol}(?={EMOJI_PRESENTATION}|{modifier}|{joiner}{emoji})"
+
+    return (
+        f"{regional_indicator}{regional_indicator}?"
+        f"|(?:{pictograph}|{modifier}|{symbol_emoji}){modifiers}(?:{joiner}{emoji}{modifiers})*"
+        f"|[{re.escape(KEYCAP_BASES)}]{EMOJI_PRESENTATION}?{keycap}"
+    )
+
+
+# the sequences are walked by the regex engine, which reads each codepoint's kind from the
+# table's ranges compiled into bitmaps, instead of codepoint by codepoint in Python
+EMOJI_SEQUENCE = re.compile(build_sequence_pattern())
+
+
+def find_emojis(text):
+    """Finds every emoji codepoint in a text, exactly as EMOJI_REGEX.findall does
+
+    An ASCII text can't have one, and Python knows whether a string is ASCII without reading
+    it. Any other text without an emoji codepoint (see EMOJI_MARK) is skipped before the regex.
+
+    Args:
+        text (str): the text
+
+    Returns:
+        [str]: each emoji codepoint, in order
+    """
+    if text.isascii() or not EMOJI_MARK.search(text):
+        return []
+
+    return EMOJI_REGEX.findall(text)
+
+
+def find_emoji_sequences(text):
+    """Finds every emoji in a text, counting a whole sequence (a flag, a skin tone, a ZWJ
+    family, a keycap) as one emoji, the way it's drawn. A text that is ASCII or has no codepoint
+    every sequence needs (see SEQUENCE_MARK) is skipped before any sequence is looked for.
+
+    Args:
+        text (str): the text
+
+    Returns:
+        [str]: each emoji, in order
+    """
+    if text.isascii() or not SEQUENCE_MARK.search(text):
+        return []
+
+    return EMOJI_SEQUENCE.findall(text)
+
+
+class EmojiFinder:
+    """
+    Finds emojis with the codepoint table in place of a compiled EMOJI_REGEX. Its findall
+    gives each emoji sequence, or each emoji codepoint as the regex does, and its search
+    finds whether a text has any.
+
+    Attributes:
+        sequences (bool): Find whole emoji sequences (see find_emoji_sequences) instead of codepoints.
+    """
+
+    def __init__(self, sequences=True):
+        """
+        Initializes the finder.
+
+        Args:
+            sequences (bool, optional): Find whole emoji sequences instead of codepoints. Defaults to True.
+        """
+        self.sequences = sequences
+
+    def findall(self, text):
+        return find_emoji_sequences(text) if self.sequences else find_emojis(text)
+
+    def search(self, text):
+        """
+        Finds the first emoji in a text.
+
+        Args:
+            text (str): the text
+
+        Returns:
+            str: the emoji, or None if there's none
+        """
+        found = self.findall(text)
+
+        return found[0] if found else None
+
+    def to_dict(self):
+        """
+        Describes what the finder finds, so results found with it can be told apart from others.
+
+        Returns:
+            dict: whether it finds sequences, and the codepoint ranges of its table
+        """
+        return {
+            "sequences": self.sequences,
+            "emoji_ranges": EMOJI_RANGES,
+            "symbol_ranges": SYMBOL_RANGES,
+        }
@@ -0,0 +1,292 @@
+import re
+import sqlite3
+
+from src.matcher import ASCII_WORD
+
+FTS_TABLE = "post_fts"
+FTS_META_TABLE = "post_fts_meta"
+# the rowids of the indexed posts the index might count differently from a regex
+FTS_RECHECK_TABLE = "post_fts_recheck"
+
+# only letters, numbers and the underscore are token characters, which on ASCII text are
+# exactly the regex word characters, so there a whole word that `\b(word)\b` finds is one of the
+# index's tokens and the other way round. Outside ASCII the two disagree on a few characters
+FTS_TOKENIZER = "unicode61 remove_diacritics 0 categories 'L* N*' tokenchars '_'"
+
+# characters the index or re.IGNORECASE fold to an ASCII letter, which SQLite's LOWER() leaves as they are
+ASCII_FOLDS = frozenset("ſ\u212aİı")
+
+WORD_CHARACTER = re.compile(r"\w")
+
+
+def has_fts5(connection):
+    """Checks whether the SQLite library was built with FTS5
+
+    Args:
+        connection (Connection): connection to the database
+
+    Returns:
+        bool: True if FTS5 tables can be created
+    """
+    return bool(connection.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')").fetchone()[0])
+
+
+class RecheckFinder:
+    """
+    Tells whether the index might count a text differently from a regex. That can only happen
+    if the text has a character the tokenizer and `\\w` don't agree on, one splitting words at
+    it and the other not (combining marks, for instance, or characters newer than SQLite's
+    Unicode tables), or a character in ASCII_FOLDS. Each character is asked about once, by
+    indexing it between two letters in an in-memory table with the same tokenizer.
+
+    Attributes:
+        connection (Connection): The in-memory database holding the probe table.
+        agreed (dict): Character to whether the tokenizer and the regex treat it alike.
+    """
+
+    def __init__(self):
+        """
+        Creates the probe table.
+        """
+        self.connection = sqlite3.connect(":memory:")
+        self.connection.execute(f"CREATE VIRTUAL TABLE probe USING fts5(text, tokenize=\"{FTS_TOKENIZER}\")")
+        self.agreed = {}
+
+    def agrees(self, character):
+        """
+        Checks whether the tokenizer and the regex treat a character alike.
+
+        Args:
+            character (str): one character outside ASCII
+
+        Returns:
+            bool: True if both or neither split words at it, and it doesn't fold to an ASCII letter
+        """
+        agreed = self.agreed.get(character)
+
+        if agreed is None:
+            self.connection.execute("INSERT INTO probe(rowid, text) VALUES (1, ?)", (f"a{character}a",))
+            splits = self.connection.execute("SELECT COUNT(*) FROM probe WHERE probe MATCH 'a'").fetchone()[0] == 1
+            self.connection.execute("DELETE FROM probe")
+            agreed = splits != bool(WORD_CHARACTER.match(character)) and character not in ASCII_FOLDS
+            self.agreed[character] = agreed
+
+        return agreed
+
+    def __call__(self, text):
+        """
+        Checks a text, as an SQL function.
+
+        Args:
+            text (str): the text of a post
+
+        Returns:
+            int: 1 if the index might count it differently, 0 if not, None when the text is NULL
+        """
+        if text is None:
+            return None
+
+        if text.isascii():
+            return 1 if "\0" in text else 0
+
+        return 0 if all(character.isascii() and character != "\0" or self.agrees(character) for character in set(text)) else 1
+
+    def close(self):
+        """
+        Closes the in-memory database.
+        """
+        self.connection.close()
+
+
+def get_index_sql(connection):
+    """Gets the statement the full-text index was created with
+
+    Args:
+        connection (Connection): connection to the database
+
+    Returns:
+        str: the CREATE VIRTUAL TABLE statement, or None if there is no index
+    """
+    row = connection.execute("SELECT sql FROM sqlite_master WHERE name = ?", (FTS_TABLE,)).fetchone()
+
+    return row[0] if row else None
+
+
+def has_index(connection):
+    """Checks whether the full-text index has been built, with the tokenizer the counts rely on
+
+    Args:
+        connection (Connection): connection to the database
+
+    Returns:
+        bool: True if the index exists and is current
+    """
+    sql = get_index_sql(connection)
+
+    if sql is None or FTS_TOKENIZER not in sql:
+        return False
+
+    query = "SELECT COUNT(*) FROM sqlite_master WHERE name IN (?, ?)"
+
+    return connection.execute(query, (FTS_META_TABLE, FTS_RECHECK_TABLE)).fetchone()[0] == 2
+
+
+def get_indexed_rowid(connection):
+    """Gets the highest rowid the full-text index covers
+
+    Args:
+        connection (Connection): connection to the database
+
+    Returns:
+        int: the highest indexed rowid, or 0 if nothing is indexed
+    """
+    row = connection.execute(f"SELECT value FROM {FTS_META_TABLE} WHERE key='high_water'").fetchone()
+
+    return row[0] if row else 0
+
+
+def build_index(connection, rebuild=False):
+    """Creates the full-text index over post.text, or adds the posts appended since it was last refreshed
+
+    The index is an external-content FTS5 table, so it stores tokens but not a second copy of the text.
+    Alongside it, the rowids of the posts the index might count differently from a regex are
+    kept (see RecheckFinder). An index made with an older tokenizer is dropped and built again.
+
+    Args:
+        connection (Connection): a writable connection to the database
+        rebuild (bool, optional): Index every post again. Defaults to False.
+
+    Returns:
+        int: how many posts were indexed
+    """
+    if not has_fts5(connection):
+        raise RuntimeError("This SQLite library was built without FTS5")
+
+    sql = get_index_sql(connection)
+    if sql is not None and FTS_TOKENIZER not in sql:
+        for table in (FTS_TABLE, FTS_META_TABLE, FTS_RECHECK_TABLE):
+            connection.execute(f"DROP TABLE IF EXISTS {table}")
+        rebuild = True
+
+    connection.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+        f"USING fts5(text, content='post', content_rowid='rowid', tokenize=\"{FTS_TOKENIZER}\")"
+    )
+    connection.execute(f"CREATE TABLE IF NOT EXISTS {FTS_META_TABLE} (key TEXT PRIMARY KEY, value INTEGER)")
+    connection.execute(f"CREATE TABLE IF NOT EXISTS {FTS_RECHECK_TABLE} (rowid INTEGER PRIMARY KEY)")
+
+    high_water = connection.execute("SELECT MAX(rowid) FROM post").fetchone()[0] or 0
+    indexed_rowid = 0 if rebuild else get_indexed_rowid(connection)
+
+    if rebuild:
+        connection.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('rebuild')")
+        connection.execute(f"DELETE FROM {FTS_RECHECK_TABLE}")
+        indexed = connection.execute("SELECT COUNT(*) FROM post").fetchone()[0]
+    else:
+        cursor = connection.execute(
+            f"INSERT INTO {FTS_TABLE}(rowid, text) SELECT rowid, text FROM post WHERE rowid > ? AND rowid <= ?",
+            (indexed_rowid, high_water),
+        )
+        indexed = cursor.rowcount
+
+    finder = RecheckFinder()
+    connection.create_function("fts_recheck", 1, finder)
+    connection.execute(
+        f"INSERT OR IGNORE INTO {FTS_RECHECK_TABLE}(rowid) SELECT rowid FROM post "
+        "WHERE rowid > ? AND rowid <= ? AND fts_recheck(text)",
+        (indexed_rowid, high_water),
+    )
+    finder.close()
+    connection.execute(f"INSERT OR REPLACE INTO {FTS_META_TABLE} (key, value) VALUES ('high_water', ?)", (high_water,))
+    connection.commit()
+
+    return indexed
+
+
+def get_word_query(word):
+    """Builds the MATCH expression for a whole word, matched whatever its case
+
+    Args:
+        word (str): a single word
+
+    Returns:
+        str: the expression, or None if the index can't express the word
+    """
+    if not ASCII_WORD.match(word):
+        return None
+
+    return f'"{word}"'
+
+
+def get_phrase_query(word, following_word):
+    """Builds the MATCH expression for a word followed by one that starts with following_word
+
+    Args:
+        word (str): the first word
+        following_word (str): the start of the word after it
+
+    Returns:
+        str: the expression, or None if the index can't express the words
+    """
+    if not (ASCII_WORD.match(word) and ASCII_WORD.match(following_word)):
+        return None
+
+    return f'"{word} {following_word}"*'
+
+
+def count_matches(connection, pronoun, match_query, condition=None, arguments=()):
+    """Counts a pronoun's indexed posts that match a MATCH expression, leaving out the ones to recheck
+
+    On those posts the index finds a whole word exactly where `\\b(word)\\b` does, ignoring
+    case, so they are counted straight from the index. A pattern the index can only
+    narrow down, such as a case-sensitive phrase, is given as condition, which SQLite checks
+    on each of the index's candidates. The other posts, the ones get_unindexed_texts reads,
+    have to be counted with the regex.
+
+    Args:
+        connection (Connection): connection to the database
+        pronoun (str): the pronoun
+        match_query (str): MATCH expression
+        condition (str, optional): SQL condition on post.text that every counted post must meet too,
+            e.g. `post.text REGEXP ?` (see src.regexp). Defaults to None.
+        arguments (tuple, optional): the parameters of condition. Defaults to ().
+
+    Returns:
+        int: how many posts match
+    """
+    query = (
+        f"SELECT COUNT(*) FROM {FTS_TABLE} JOIN post ON post.rowid = {FTS_TABLE}.rowid "
+        f"WHERE {FTS_TABLE} MATCH ? AND post.pronoun = ? AND post.rowid <= ? "
+        f"AND post.rowid NOT IN (SELECT rowid FROM {FTS_RECHECK_TABLE})"
+    )
+
+    if condition:
+        query += f" AND {condition}"
+
+    return connection.execute(query, (match_query, pronoun, get_indexed_rowid(connection), *arguments)).fetchone()[0]
+
+
+def get_unindexed_texts(connection, pronoun):
+    """Reads the texts of a pronoun's posts that count_matches leaves out
+
+    These are the posts the index might count differently from a regex (see RecheckFinder),
+    and the posts added after the index was last refreshed.
+
+    Args:
+        connection (Connection): connection to the database
+        pronoun (str): the pronoun
+
+    Yields:
+        str: the text of each post
+    """
+    indexed_rowid = get_indexed_rowid(connection)
+
+    for query in (
+        f"SELECT post.text FROM {FTS_RECHECK_TABLE} JOIN post ON post.rowid = {FTS_RECHECK_TABLE}.rowid "
+        "WHERE post.pronoun = ? AND post.rowid <= ?",
+        "SELECT text FROM post WHERE pronoun = ? AND rowid > ?",
+    ):
+        cursor = connection.execute(query, (pronoun, indexed_rowid))
+        for (text,) in cursor:
+            yield text
+        cursor.close()
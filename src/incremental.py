@@ -0,0 +1,201 @@
+import json
+import os
+
+from src.cache import get_hash, get_pattern_hash
+from src.constants import CACHE_DIRECTORY
+from src.database import get_database_file
+from src.discourse import DiscourseTally
+from src.rows import get_rows_by_rowid, get_rows_query
+from src.scanner import CategoryScanner
+
+
+def get_high_water_mark(connection):
+    """Gets the highest rowid in the post table
+
+    Args:
+        connection (Connection): connection to the database
+
+    Returns:
+        int: the highest rowid, or 0 for an empty table
+    """
+    return connection.execute("SELECT MAX(rowid) FROM post").fetchone()[0] or 0
+
+
+def count_rows_up_to(connection, pronoun, rowid):
+    """Counts a pronoun's posts up to and including a rowid
+
+    Args:
+        connection (Connection): connection to the database
+        pronoun (str): the pronoun
+        rowid (int): the highest rowid to count
+
+    Returns:
+        int: how many posts there are
+    """
+    query = "SELECT COUNT(*) FROM post WHERE pronoun=? AND rowid <= ?"
+
+    return connection.execute(query, (pronoun, rowid)).fetchone()[0]
+
+
+class IncrementalStore:
+    """
+    Stores aggregates on disk with the rowid they were computed up to (the high-water mark),
+    so the next run only has to read posts that were appended after it.
+
+    Posts are only ever expected to be appended. If the number of posts up to the mark has
+    changed since the aggregates were stored, they are thrown away and recomputed.
+
+    Attributes:
+        directory (str): Where the aggregates are written.
+    """
+
+    def __init__(self, directory=f"{CACHE_DIRECTORY}/incremental"):
+        """
+        Initializes the store, creating its directory if needed.
+
+        Args:
+            directory (str, optional): Where the aggregates are written. Defaults to .cache/incremental.
+        """
+        self.directory = directory
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def get_key(self, connection, *parts):
+        """
+        Builds the key of an aggregate of a database.
+
+        Args:
+            connection (Connection): connection to the database
+            parts: anything else that identifies the aggregate
+
+        Returns:
+            str: the key
+        """
+        return get_hash([os.path.abspath(get_database_file(connection)), *parts])
+
+    def load(self, connection, key, pronoun):
+        """
+        Loads an aggregate, if it is stored and still describes the posts up to its mark.
+
+        Args:
+            connection (Connection): connection to the database
+            key (str): the key
+            pronoun (str): the pronoun the aggregate counts
+
+        Returns:
+            dict: the state (high_water, rows, results), or None
+        """
+        try:
+            with open(os.path.join(self.directory, f"{key}.json"), encoding="utf-8") as file:
+                state = json.load(file)
+        except (OSError, ValueError):
+            return None
+
+        if count_rows_up_to(connection, pronoun, state["high_water"]) != state["rows"]:
+            return None
+
+        return state
+
+    def save(self, key, high_water, rows, results):
+        """
+        Stores an aggregate.
+
+        Args:
+            key (str): the key
+            high_water (int): the highest rowid the aggregate has read
+            rows (int): how many of the pronoun's posts are at or below high_water
+            results (dict): the aggregate, as JSON-serializable values
+        """
+        path = os.path.join(self.directory, f"{key}.json")
+        temporary_path = f"{path}.tmp"
+
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump({"high_water": high_water, "rows": rows, "results": results}, file)
+
+        os.replace(temporary_path, path)
+
+
+def update_scanners(connection, pronoun, categories, store, keep_rows=True):
+    """Brings the stored scan results of a pronoun's categories up to date
+
+    Only posts past each category's high-water mark are scanned. Their results are
+    merged after the stored ones, so everything stays in rowid order.
+
+    Args:
+        connection (Connection): connection to the database
+        pronoun (str): the pronoun
+        categories ([str]): categories to update
+        store (IncrementalStore): where the results are stored
+        keep_rows (bool, optional): Keep the matching rows as well as the frequencies. Defaults to True.
+
+    Returns:
+        dict: the up-to-date CategoryScanner of each category
+    """
+    high_water = get_high_water_mark(connection)
+    keys = {category: store.get_key(connection, "scan", pronoun, category, get_pattern_hash(category)) for category in categories}
+    scanners = {}
+    marks = {}
+
+    for category in categories:
+        state = store.load(connection, keys[category], pronoun)
+
+        if state is None:
+            scanners[category] = CategoryScanner([category], keep_rows=keep_rows)
+            marks[category] = 0
+            continue
+
+        stored = state["results"]
+        rows = get_rows_by_rowid(connection, stored["rowids"]) if keep_rows else None
+        scanners[category] = CategoryScanner.from_dict(category, stored, rows)
+        marks[category] = state["high_water"]
+
+    # categories stored up to the same mark share one scan of the new posts
+    for mark in set(marks.values()):
+        marked = [category for category in categories if marks[category] == mark]
+        query = get_rows_query(connection, rowid_range=True)
+        cursor = connection.execute(query, (pronoun, mark + 1, high_water))
+        new_scanner = CategoryScanner(marked, keep_rows=keep_rows).scan(cursor)
+
+        for category in marked:
+            scanners[category].merge(new_scanner)
+
+    rows = count_rows_up_to(connection, pronoun, high_water)
+
+    for category in categories:
+        store.save(keys[category], high_water, rows, scanners[category].to_dict(category))
+
+    return scanners
+
+
+def update_tally(connection, pronoun, prepositions, personal_pronouns, store):
+    """Brings the stored discourse tally of a pronoun up to date, reading only posts past its high-water mark
+
+    Args:
+        connection (Connection): connection to the database
+        pronoun (str): the pronoun
+        prepositions ([str]): prepositions / conjunctions to look for
+        personal_pronouns ([str]): personal pronouns to look for
+        store (IncrementalStore): where the tally is stored
+
+    Returns:
+        DiscourseTally: the up-to-date tally
+    """
+    high_water = get_high_water_mark(connection)
+    key = store.get_key(connection, "discourse", pronoun, prepositions, personal_pronouns)
+    state = store.load(connection, key, pronoun)
+    mark = 0
+
+    if state is None:
+        tally = DiscourseTally(pronoun, prepositions, personal_pronouns)
+    else:
+        tally = DiscourseTally.from_dict(pronoun, prepositions, personal_pronouns, state["results"])
+        mark = state["high_water"]
+
+    query = "SELECT text FROM post WHERE pronoun=? AND rowid BETWEEN ? AND ?"
+    cursor = connection.execute(query, (pronoun, mark + 1, high_water))
+    tally.tally(text for (text,) in cursor)
+
+    store.save(key, high_water, count_rows_up_to(connection, pronoun, high_water), tally.to_dict())
+
+    return tally
@@ -0,0 +1,145 @@
+import re
+
+from src.constants import SOCIAL_PRONOUNS
+from src.query import RowFilter
+from src.rows import DATE_INDEX, get_pronouns_rows_query, get_row_columns, get_rows_query
+
+# a plan step that reads the whole table, rather than searching it or scanning an index
+FULL_SCAN = re.compile(r"^SCAN (post|\w+ AS post)$")
+
+
+def get_wanted_indexes(connection):
+    """Gets the indexes the CLIs' queries need
+
+    Args:
+        connection (Connection): connection to the database
+
+    Returns:
+        dict: index name to the columns it covers
+    """
+    date_column = get_row_columns(connection)[DATE_INDEX]
+
+    return {
+        "post_pronoun_index": ["pronoun"],
+        "post_pronoun_date_index": ["pronoun", date_column],
+    }
+
+
+def get_existing_indexes(connection):
+    """Gets the indexes on the post table
+
+    Args:
+        connection (Connection): connection to the database
+
+    Returns:
+        dict: index name to the columns it covers, in order
+    """
+    indexes = {}
+
+    for index in connection.execute("PRAGMA index_list(post)").fetchall():
+        name = index[1]
+        indexes[name] = [column[2] for column in connection.execute(f'PRAGMA index_info("{name}")')]
+
+    return indexes
+
+
+def has_pronoun_index(connection):
+    """Checks whether an index can find a pronoun's posts without reading the whole table
+
+    Args:
+        connection (Connection): connection to the database
+
+    Returns:
+        bool: True if an index on the post table starts with the pronoun
+    """
+    return any(columns[:1] == ["pronoun"] for columns in get_existing_indexes(connection).values())
+
+
+def get_missing_indexes(connection):
+    """Gets the wanted indexes that don't exist, under any name
+
+    Args:
+        connection (Connection): connection to the database
+
+    Returns:
+        dict: index name to the columns it should cover
+    """
+    existing = list(get_existing_indexes(connection).values())
+
+    return {name: columns for name, columns in get_wanted_indexes(connection).items() if columns not in existing}
+
+
+def create_indexes(connection):
+    """Creates the missing indexes and updates the statistics the query planner chooses them with
+
+    Args:
+        connection (Connection): a writable connection to the database
+
+    Returns:
+        [str]: the names of the indexes that were created
+    """
+    missing = get_missing_indexes(connection)
+
+    for name, columns in missing.items():
+        column_list = ", ".join(f'"{column}"' for column in columns)
+        connection.execute(f'CREATE INDEX IF NOT EXISTS "{name}" ON post ({column_list})')
+
+    connection.execute("ANALYZE")
+    connection.commit()
+
+    return list(missing)
+
+
+def get_cli_queries(connection):
+    """Gets every query analyse.py and summarize.py run against the post table, with sample parameters
+
+    Args:
+        connection (Connection): connection to the database
+
+    Returns:
+        [(str, str, tuple, bool)]: a description, the query, its parameters, and whether it's meant to read the whole table
+    """
+    pronoun = SOCIAL_PRONOUNS[0]
+    columns = ", ".join(f'"{column}"' for column in get_row_columns(connection))
+    dated = RowFilter(since="2024-01-01T00:00:00", until="2025-01-01T00:00:00")
+    highest = 2 ** 62
+
+    return [
+        ("a pronoun's rows", get_rows_query(connection), (pronoun,), False),
+        ("a pronoun's rows between two dates", get_rows_query(connection, row_filter=dated), (pronoun, *dated.get_parameters()), False),
+        ("a pronoun's rows in a rowid range", get_rows_query(connection, rowid_range=True), (pronoun, 0, highest), False),
+        ("a pronoun's row count", "SELECT COUNT(*) FROM post WHERE post.pronoun=?", (pronoun,), False),
+        ("a pronoun's rowid bounds", "SELECT MIN(rowid), MAX(rowid) FROM post WHERE pronoun=?", (pronoun,), False),
+        ("a pronoun's rows up to a rowid", "SELECT COUNT(*) FROM post WHERE pronoun=? AND rowid <= ?", (pronoun, highest), False),
+        ("rows by rowid", f"SELECT {columns}, rowid FROM post WHERE rowid IN (?, ?)", (1, 2), False),
+        ("a pronoun's texts", "SELECT text FROM post WHERE pronoun=?", (pronoun,), False),
+        ("a pronoun's texts in a rowid range", "SELECT text FROM post WHERE pronoun=? AND rowid BETWEEN ? AND ?", (pronoun, 0, highest), False),
+        ("post count of every pronoun", "SELECT pronoun, COUNT(*) FROM post GROUP BY pronoun", (), False),
+        # every pronoun is most of the table, so reading it in order beats searching the index
+        ("every pronoun's rows (--pronoun all)", get_pronouns_rows_query(connection, len(SOCIAL_PRONOUNS)), tuple(SOCIAL_PRONOUNS), True),
+    ]
+
+
+def explain_queries(connection):
+    """Gets the query plan of every query the CLIs run
+
+    Args:
+        connection (Connection): connection to the database
+
+    Returns:
+        [dict]: the description, query, plan steps, and whether it reads the whole table when it isn't meant to
+    """
+    plans = []
+
+    for description, query, parameters, full_scan_expected in get_cli_queries(connection):
+        steps = [row[3] for row in connection.execute(f"EXPLAIN QUERY PLAN {query}", parameters)]
+        full_scan = any(FULL_SCAN.match(step) for step in steps)
+
+        plans.append({
+            "description": description,
+            "query": query,
+            "plan": steps,
+            "full_scan": full_scan and not full_scan_expected,
+        })
+
+    return plans
@@ -0,0 +1,108 @@
+import re
+from collections import Counter
+
+TOKEN = re.compile(r"\w+")
+ASCII_WORD = re.compile(r"^[A-Za-z0-9_]+$")
+
+# the only characters that an ignore-case regex matches to an ASCII letter but str.lower() doesn't
+# turn into it. Translating them first makes lowercased tokens compare exactly like re.IGNORECASE
+IGNORECASE_FOLDS = str.maketrans({"İ": "i", "ı": "i", "ſ": "s"})
+
+
+def fold_case(text):
+    """Lowercases text so its ASCII words compare the way re.IGNORECASE compares them
+
+    Args:
+        text (str): text to lowercase
+
+    Returns:
+        str: the lowercased text, with the same word boundaries
+    """
+    if text.isascii():
+        return text.lower()
+
+    return text.translate(IGNORECASE_FOLDS).lower()
+
+
+class TermMatcher:
+    """
+    Finds whole-word, case-insensitive instances of a list of words, built once and reused
+    for every message. Each message is split into words once, and plain ASCII words are looked
+    up in a dictionary, so the cost per message doesn't grow with the number of words. Any
+    other word (a phrase, a regex, non-ASCII) is matched with its own precompiled pattern.
+
+    The results are the same as running `\\b(word)\\b` with re.IGNORECASE for every word.
+
+    Attributes:
+        words ([str]): The words to find.
+        token_words (dict): Lowercased ASCII word to the words it stands for.
+        patterns (dict): Compiled pattern of every other word.
+    """
+
+    def __init__(self, words):
+        """
+        Initializes the matcher.
+
+        Args:
+            words ([str]): the words to find
+        """
+        self.words = list(words)
+        self.token_words = {}
+        self.patterns = {}
+
+        for word in dict.fromkeys(self.words):
+            if ASCII_WORD.match(word):
+                self.token_words.setdefault(word.lower(), []).append(word)
+            else:
+                self.patterns[word] = re.compile(f"\\b({word})\\b", flags=re.IGNORECASE)
+
+    def find(self, text):
+        """
+        Counts every instance of every word in one message.
+
+        Args:
+            text (str): the message
+
+        Returns:
+            Counter: word to how many times it occurs
+        """
+        occurrences = Counter()
+
+        if self.token_words:
+            for token in TOKEN.findall(fold_case(text)):
+                for word in self.token_words.get(token, ()):
+                    occurrences[word] += 1
+
+        for word, pattern in self.patterns.items():
+            found = len(pattern.findall(text))
+            if found:
+                occurrences[word] = found
+
+        return occurrences
+
+    def count(self, texts):
+        """
+        Counts the words across many messages.
+
+        Args:
+            texts (iterable): the messages
+
+        Returns:
+            (Counter, Counter): how many messages contain each word at least once, and how many times each word occurs in total
+        """
+        instances = Counter()
+        totals = Counter()
+        # a word listed twice is counted twice per message, as it always has been
+        multiplicity = Counter(self.words)
+
+        for text in texts:
+            if text is None:
+                continue
+
+            occurrences = self.find(text)
+
+            for word, found in occurrences.items():
+                instances[word] += multiplicity[word]
+                totals[word] += found
+
+        return instances, totals
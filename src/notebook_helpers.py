@@ -1,30 +1,45 @@
 import re
-from datetime import datetime
+import functools
+import warnings
+from array import array
+from datetime import datetime, date as date_type, time as time_type, timedelta, timezone
 from collections import Counter
 
+from src.fts import get_word_query, count_matches, get_unindexed_texts
+from src.matcher import TermMatcher
+from src.snapshot import EPOCH, NULL_TIMESTAMP, Snapshot
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+AT_URI_REGEX = re.compile("^at://([^/]+)/([^/]+)/([^/]+)$", re.IGNORECASE)
+MICROSECOND = timedelta(microseconds=1)
+
 def uriToUrl(atUri: str) -> str:
     """converts Bluesky URI to bluesky URL
 
+    A URI that isn't a post's at:// URI is returned as it is.
+
     Args:
-        atUri (str): raw URI
+        atUri (str): raw URI, e.g. at://did:plc:abc/app.bsky.feed.post/xyz
 
     Raises:
         Exception: An error if it isn't sent a string
 
     Returns:
-        str: an https string
+        str: an https string, e.g. https://bsky.app/profile/did:plc:abc/post/xyz
     """
-    regex = re.compile("^at://([^/]+)/([^/]+)/([^/]+)$", re.IGNORECASE)
-    match = regex.findall(atUri)
-
     if not isinstance(atUri, str):
         raise Exception('this only converts strings')
-    
+
+    match = AT_URI_REGEX.match(atUri)
+
     if match is None:
         return atUri
 
-
-    did, collection, rkey = match[0]
+    did, collection, rkey = match.groups()
 
     if collection == 'app.bsky.feed.post':
         return f"https://bsky.app/profile/{did}/post/{rkey}"
@@ -61,29 +76,284 @@ def format_time(text: str) -> str:
 
 prettify_time = lambda s: f'{format_time(s)}'
 
+def uris_to_urls(uris):
+    """Converts a column of Bluesky URIs to URLs, like uriToUrl on each
+
+    A URI that isn't a post's at:// URI is returned as it is.
+
+    Args:
+        uris (iterable): raw URIs, e.g. a DataFrame column
+
+    Returns:
+        [str]: the https strings, in order
+    """
+    urls = []
+    match = AT_URI_REGEX.match
+
+    for uri in uris:
+        found = match(uri)
+
+        if found and found.group(2) == 'app.bsky.feed.post':
+            urls.append(f"https://bsky.app/profile/{found.group(1)}/post/{found.group(3)}")
+        else:
+            urls.append(uri)
+
+    return urls
+
+def make_links(uris):
+    """Makes a column of links to posts, like make_link on each
+
+    Args:
+        uris (iterable): raw URIs
+
+    Returns:
+        [str]: the <a> tags, in order
+    """
+    return [f'<a href="{url}">Post</a>' for url in uris_to_urls(uris)]
+
+class Highlighter:
+    """
+    Wraps instances of a term with <mark>, like mark, with the regex compiled once for
+    every text it's used on.
+
+    Attributes:
+        regex (Pattern): the compiled `\\b<pattern>\\b`
+    """
+
+    def __init__(self, pattern):
+        """
+        Compiles the pattern.
+
+        Args:
+            pattern (str): a regular expression with one group, the term to mark
+        """
+        self.regex = re.compile(f"\\b{pattern}\\b", re.IGNORECASE)
+
+    def __call__(self, text):
+        """
+        Marks one text.
+
+        Args:
+            text (str): full text
+
+        Raises:
+            Exception: An error for the wrong type
+
+        Returns:
+            str: a string with all instances wrapped
+        """
+        if not isinstance(text, str):
+            raise Exception('this only converts strings')
+
+        return self.regex.sub('<mark>\\1</mark>', text)
+
+    def mark_all(self, texts):
+        """
+        Marks a column of texts.
+
+        Args:
+            texts (iterable): full texts
+
+        Returns:
+            [str]: the texts with all instances wrapped, in order
+        """
+        return [self(text) for text in texts]
+
+@functools.lru_cache(maxsize=4096)
+def get_friendly_day(day):
+    """Formats the date part of format_time once per day
+
+    Args:
+        day (str): e.g. 2024-11-01
+
+    Returns:
+        str: e.g. Nov 01, 2024
+    """
+    return date_type.fromisoformat(day).strftime("%b %d, %Y")
+
+@functools.lru_cache(maxsize=1440)
+def get_friendly_minute(minute):
+    """Formats the time part of format_time once per minute of the day
+
+    Args:
+        minute (str): e.g. 13:30
+
+    Returns:
+        str: e.g. 01:30PM
+    """
+    return time_type.fromisoformat(minute).strftime("%I:%M%p")
+
+def format_times(dates):
+    """Formats a column of ISO 8601 dates, like format_time on each
+
+    The wall-clock date and minute format_time shows are sliced straight out of the string,
+    and each day and minute is only formatted once. Anything not written like
+    2024-11-01T13:30 is handed to format_time.
+
+    Args:
+        dates (iterable): ISO 8601 dates, e.g. a DataFrame column, or a Snapshot's date column
+
+    Returns:
+        [str]: the formatted times, in order
+    """
+    formatted = []
+
+    for date in dates:
+        if len(date) >= 16 and date[10] in "T " and date[13] == ":":
+            formatted.append(f"{get_friendly_day(date[:10])} {get_friendly_minute(date[11:16])}")
+        else:
+            formatted.append(format_time(date))
+
+    return formatted
+
+def parse_times_with_numpy(dates):
+    """Parses a column of ISO 8601 dates in one NumPy call
+
+    NumPy reads dates without a time zone, so a trailing Z is dropped. A column NumPy can't
+    read the way datetime.fromisoformat does is left to the loop in parse_times: one with an
+    offset (NumPy warns about those), a date it can't parse, a date that doesn't start with
+    the year, or anything shorter than a day, such as a month or a word like "today" that
+    NumPy would read.
+
+    Args:
+        dates (list): ISO 8601 dates
+
+    Returns:
+        numpy.ndarray: a datetime64[us] array, or None if the column has to be parsed by the loop
+    """
+    try:
+        stripped = [date[:-1] if date and date[-1] == "Z" else date for date in dates]
+
+        if any(len(date) < 10 or not date[0].isdigit() for date in stripped if date):
+            return None
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            return numpy.array(stripped, dtype="datetime64[us]")
+    except (TypeError, ValueError, Warning):
+        return None
+
+def parse_times(dates):
+    """Parses a column of ISO 8601 dates into UTC timestamps in bulk
+
+    Dates without a time zone are taken to be UTC. Dates that can't be parsed become
+    NULL_TIMESTAMP, which is NumPy's NaT. With NumPy installed, a column it can read whole
+    is parsed by it, and otherwise each date is parsed with datetime.fromisoformat.
+
+    Args:
+        dates (iterable | Snapshot): ISO 8601 dates, or a snapshot, whose timestamps are already parsed
+
+    Returns:
+        array | numpy.ndarray: microseconds since the epoch as int64, or a datetime64[us] array if NumPy is installed
+    """
+    if isinstance(dates, Snapshot):
+        timestamps = array("q", dates.timestamps)
+    else:
+        if numpy is not None:
+            dates = list(dates)
+            parsed = parse_times_with_numpy(dates)
+            if parsed is not None:
+                return parsed
+
+        timestamps = array("q")
+        parse = datetime.fromisoformat
+
+        for date in dates:
+            try:
+                parsed = parse(date)
+            except (TypeError, ValueError):
+                timestamps.append(NULL_TIMESTAMP)
+                continue
+
+            if parsed.tzinfo is None:
+                parsed = parsed.replace(tzinfo=timezone.utc)
+
+            timestamps.append((parsed - EPOCH) // MICROSECOND)
+
+    if numpy is not None:
+        return numpy.frombuffer(timestamps, dtype="int64").view("datetime64[us]")
+
+    return timestamps
+
+def get_texts(rows):
+    """Gets the message of each row. A Snapshot's messages are read straight from its text column
+
+    Args:
+        rows ([str] | Snapshot): rows from the database, with the message third, or a snapshot
+
+    Returns:
+        iterable: the messages
+    """
+    if isinstance(rows, Snapshot):
+        return iter(rows.texts)
+
+    return (row[2] for row in rows)
+
 def get_instance_dict(words, rows):
     """Creates a dictionary of how many rows contain at least one instance
     
     Args:
-        rows ([str]): rows from the database
+        rows ([str] | Snapshot): rows from the database, or a snapshot
         words ([str]): list of words
         
     Returns:
         Counter
     """
-    instances = Counter()
-    for row in rows:
-        for word in words:
-            match = re.findall(f'\\b({word})\\b',row[2], flags = re.IGNORECASE)
-            if match:
-                instances.update([word])
+    instances, _ = TermMatcher(words).count(get_texts(rows))
+    return instances
+
+def get_occurrence_dict(words, rows):
+    """Creates a dictionary of how many times each word occurs across all rows
+
+    Args:
+        rows ([str] | Snapshot): rows from the database, or a snapshot
+        words ([str]): list of words
+
+    Returns:
+        Counter
+    """
+    _, totals = TermMatcher(words).count(get_texts(rows))
+    return totals
+
+def get_indexed_instance_dict(words, connection, pronoun):
+    """Creates a dictionary of how many of a pronoun's posts contain at least one instance, using the full-text index
+
+    Gives the same counts as get_instance_dict over the pronoun's rows. Each word is counted
+    with one index lookup in the posts the index can decide on its own, and in the rest with
+    one TermMatcher pass over them. If any word is one the index can't express, every
+    post is read in that one pass instead.
+
+    Args:
+        words ([str]): list of words
+        connection (Connection): connection to a database with a full-text index (see build_index.py)
+        pronoun (str): the pronoun whose posts are counted
+
+    Returns:
+        Counter
+    """
+    queries = {word: get_word_query(word) for word in words}
+
+    if not all(queries.values()):
+        texts = connection.execute("SELECT text FROM post WHERE pronoun=?", (pronoun,))
+        instances, _ = TermMatcher(words).count(text for (text,) in texts)
+        return instances
+
+    instances, _ = TermMatcher(words).count(get_unindexed_texts(connection, pronoun))
+    # a word listed twice is counted twice, like get_instance_dict does
+    multiplicity = Counter(words)
+
+    for word, query in queries.items():
+        count = count_matches(connection, pronoun, query)
+        if count:
+            instances[word] += count * multiplicity[word]
+
     return instances
 
 def get_frequency_dict(rows, regex, no_flags= False):
     """Creates a dictionary of how many times the pattern occurs across all rows
 
     Args:
-        rows ([str]): rows from the database
+        rows ([str] | Snapshot): rows from the database, or a snapshot
         regex (str): the regular expression pattern
         no_flags (bool, optional): Turns off the flags. Defaults to False.
 
@@ -97,8 +367,8 @@ def get_frequency_dict(rows, regex, no_flags= False):
     if not regex:
         raise ValueError("A Regular expression must be provided")
 
-    for row in rows:
-        message = row[2].strip()
+    for text in get_texts(rows):
+        message = text.strip()
         if isinstance(regex, re.Pattern):
             search_results = re.findall(regex, message)
         else:
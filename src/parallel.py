@@ -0,0 +1,149 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from src.database import connect_read_only
+from src.discourse import DiscourseTally
+from src.rows import get_rows_query
+from src.scanner import CategoryScanner
+
+# more chunks than workers, so a slow chunk doesn't leave the other workers idle
+CHUNKS_PER_WORKER = 4
+
+
+def get_rowid_ranges(connection, pronoun, count):
+    """Splits a pronoun's rowids into contiguous ranges
+
+    Args:
+        connection (Connection): connection to the database
+        pronoun (str): the pronoun
+        count (int): how many ranges to make
+
+    Returns:
+        [(int, int)]: lowest and highest rowid of each range, in rowid order
+    """
+    cursor = connection.cursor()
+    cursor.execute("SELECT MIN(rowid), MAX(rowid) FROM post WHERE pronoun=?", (pronoun,))
+    lowest, highest = cursor.fetchone()
+    cursor.close()
+
+    if lowest is None:
+        return []
+
+    size = max(1, -(-(highest - lowest + 1) // count))
+
+    return [(low, min(low + size - 1, highest)) for low in range(lowest, highest + 1, size)]
+
+
+def scan_rowid_range(database_file, pronoun, categories, keep_rows, rowid_range, row_filter=None):
+    """Scans the categories of one range of a pronoun's rows. Runs in a worker process.
+
+    Args:
+        database_file (str): path to a sqlite database
+        pronoun (str): the pronoun
+        categories ([str]): categories to scan
+        keep_rows (bool): keep the matching rows
+        rowid_range ((int, int)): lowest and highest rowid
+        row_filter (RowFilter, optional): only scan the rows it lets through. It can't have a limit. Defaults to None.
+
+    Returns:
+        CategoryScanner: the results for the range
+    """
+    connection = connect_read_only(database_file)
+    parameters = row_filter.get_parameters() if row_filter else []
+
+    try:
+        query = get_rows_query(connection, rowid_range=True, row_filter=row_filter)
+        cursor = connection.execute(query, (pronoun, *rowid_range, *parameters))
+        return CategoryScanner(categories, keep_rows=keep_rows).scan(cursor)
+    finally:
+        connection.close()
+
+
+def tally_rowid_range(database_file, pronoun, prepositions, personal_pronouns, rowid_range):
+    """Tallies the discourse of one range of a pronoun's posts. Runs in a worker process.
+
+    Args:
+        database_file (str): path to a sqlite database
+        pronoun (str): the pronoun
+        prepositions ([str]): prepositions / conjunctions to look for
+        personal_pronouns ([str]): personal pronouns to look for
+        rowid_range ((int, int)): lowest and highest rowid
+
+    Returns:
+        DiscourseTally: the counts for the range
+    """
+    connection = connect_read_only(database_file)
+
+    try:
+        cursor = connection.execute("SELECT text FROM post WHERE pronoun=? AND rowid BETWEEN ? AND ?", (pronoun, *rowid_range))
+        return DiscourseTally(pronoun, prepositions, personal_pronouns).tally(text for (text,) in cursor)
+    finally:
+        connection.close()
+
+
+def parallel_scan(database_file, pronoun, categories, keep_rows=True, workers=2, row_filter=None):
+    """Scans a pronoun's rows across a pool of processes
+
+    The results of each rowid range are merged in rowid order, which is the order a
+    serial scan reads them in, so frequencies and rows come out the same.
+
+    Args:
+        database_file (str): path to a sqlite database
+        pronoun (str): the pronoun
+        categories ([str]): categories to scan
+        keep_rows (bool, optional): keep the matching rows. Defaults to True.
+        workers (int, optional): how many processes to use. Defaults to 2.
+        row_filter (RowFilter, optional): only scan the rows it lets through. It can't have a limit,
+            as each range is scanned on its own. Defaults to None.
+
+    Returns:
+        CategoryScanner: the merged results
+    """
+    connection = connect_read_only(database_file)
+    rowid_ranges = get_rowid_ranges(connection, pronoun, workers * CHUNKS_PER_WORKER)
+    connection.close()
+
+    scanner = CategoryScanner(categories, keep_rows=keep_rows)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(scan_rowid_range, database_file, pronoun, categories, keep_rows, rowid_range, row_filter)
+            for rowid_range in rowid_ranges
+        ]
+
+        for future in futures:
+            scanner.merge(future.result())
+
+    return scanner
+
+
+def parallel_tally(database_file, pronouns, prepositions, personal_pronouns, workers=2):
+    """Tallies the discourse of several pronouns across a pool of processes, split by pronoun and rowid range
+
+    Args:
+        database_file (str): path to a sqlite database
+        pronouns ([str]): the pronouns
+        prepositions ([str]): prepositions / conjunctions to look for
+        personal_pronouns ([str]): personal pronouns to look for
+        workers (int, optional): how many processes to use. Defaults to 2.
+
+    Returns:
+        dict: the merged DiscourseTally of each pronoun
+    """
+    connection = connect_read_only(database_file)
+    chunks = max(1, workers * CHUNKS_PER_WORKER // max(1, len(pronouns)))
+    rowid_ranges = {pronoun: get_rowid_ranges(connection, pronoun, chunks) for pronoun in pronouns}
+    connection.close()
+
+    tallies = {pronoun: DiscourseTally(pronoun, prepositions, personal_pronouns) for pronoun in pronouns}
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            (pronoun, executor.submit(tally_rowid_range, database_file, pronoun, prepositions, personal_pronouns, rowid_range))
+            for pronoun in pronouns
+            for rowid_range in rowid_ranges[pronoun]
+        ]
+
+        for pronoun, future in futures:
+            tallies[pronoun].merge(future.result())
+
+    return tallies
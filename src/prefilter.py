@@ -0,0 +1,282 @@
+import re
+
+# the parser is private to re, so if it can't be imported, or isn't shaped the way this
+# module reads it, no pattern gets a prefilter and every message is matched as before
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:
+    try:
+        import sre_parse
+    except ImportError:
+        sre_parse = None
+
+from src.matcher import fold_case
+
+# how many literals a pattern may need before the prefilter gives up on it. Past this a
+# literal scan is no cheaper than the regex
+MAX_LITERALS = 64
+
+# literals shorter than this are in almost every message, so they don't filter anything
+MIN_LITERAL_LENGTH = 2
+
+try:
+    REPEATS = (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, getattr(sre_parse, "POSSESSIVE_REPEAT", None))
+    ZERO_WIDTH = (sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT)
+except AttributeError:
+    sre_parse = None
+
+# what is known about the text a part of a pattern matches: every string it can match (if
+# there are few), strings one of which it always starts with, ends with, and contains
+UNKNOWN = (None, None, None, None)
+
+
+def get_exact(strings):
+    return (strings, strings, strings, strings)
+
+
+def concatenate(heads, tails):
+    """Joins every string of one set to every string of another, or None if there'd be too many"""
+    if len(heads) * len(tails) > MAX_LITERALS:
+        return None
+
+    return frozenset(head + tail for head in heads for tail in tails)
+
+
+def get_selectivity(strings):
+    """Scores how well a set of required strings filters: the length of its shortest, then the fewer the better"""
+    if not strings:
+        return (0, 0)
+
+    return (min(len(string) for string in strings), -len(strings))
+
+
+def get_literal(code, ignore_case):
+    character = chr(code)
+
+    if not ignore_case:
+        return character
+
+    # only ASCII is folded the same way re.IGNORECASE folds it (see fold_case)
+    return character.lower() if character.isascii() else None
+
+
+def analyse_item(op, av, ignore_case):
+    """Works out what the text matched by one parsed item of a pattern must contain
+
+    Returns:
+        tuple: exact, prefixes, suffixes and required strings, any of which may be None for unknown
+    """
+    if op is sre_parse.LITERAL:
+        literal = get_literal(av, ignore_case)
+        return get_exact(frozenset([literal])) if literal is not None else UNKNOWN
+
+    if op in ZERO_WIDTH:
+        return get_exact(frozenset([""]))
+
+    if op is sre_parse.IN:
+        literals = [get_literal(code, ignore_case) if item_op is sre_parse.LITERAL else None for item_op, code in av]
+        if None in literals or len(literals) > MAX_LITERALS:
+            return UNKNOWN
+        return get_exact(frozenset(literals))
+
+    if op is sre_parse.SUBPATTERN:
+        _, add_flags, del_flags, items = av
+        if add_flags or del_flags:
+            return UNKNOWN
+        return analyse_sequence(items, ignore_case)
+
+    if op is getattr(sre_parse, "ATOMIC_GROUP", None):
+        return analyse_sequence(av, ignore_case)
+
+    if op is sre_parse.BRANCH:
+        branches = [analyse_sequence(items, ignore_case) for items in av[1]]
+        return tuple(
+            frozenset().union(*parts) if None not in parts and sum(map(len, parts)) <= MAX_LITERALS else None
+            for parts in zip(*branches)
+        )
+
+    if op in REPEATS:
+        low, high, items = av
+        exact, prefixes, suffixes, required = analyse_sequence(items, ignore_case)
+
+        if high == 0:
+            return get_exact(frozenset([""]))
+        if low == high == 1:
+            return exact, prefixes, suffixes, required
+        if low == 0 and high == 1 and exact is not None:
+            return get_exact(exact | {""})
+        if low >= 1:
+            return None, prefixes, suffixes, required
+
+    return UNKNOWN
+
+
+def analyse_sequence(items, ignore_case):
+    """Works out what the text matched by a sequence of parsed items must contain
+
+    Adjacent parts are joined while every string they match is known, so `n(o|a)` needs
+    "no" or "na" rather than only "n".
+
+    Returns:
+        tuple: exact, prefixes, suffixes and required strings, any of which may be None for unknown
+    """
+    current = frozenset([""])
+    is_exact = True
+    prefixes = None
+    candidates = []
+
+    for op, av in items:
+        exact, item_prefixes, item_suffixes, required = analyse_item(op, av, ignore_case)
+
+        if exact is not None:
+            joined = concatenate(current, exact)
+            if joined is None:
+                candidates.append(current)
+                joined = exact
+                if is_exact:
+                    prefixes = current
+                is_exact = False
+            current = joined
+            continue
+
+        joined = concatenate(current, item_prefixes) if item_prefixes is not None else None
+        if is_exact:
+            prefixes = joined if joined is not None else current
+
+        candidates.extend(strings for strings in (current, joined, required) if strings is not None)
+        current = item_suffixes if item_suffixes is not None else frozenset([""])
+        is_exact = False
+
+    candidates.append(current)
+    best = max(candidates, key=get_selectivity)
+
+    if is_exact:
+        return get_exact(current)
+
+    return None, prefixes, current, best if get_selectivity(best)[0] else None
+
+
+def get_required_literals(pattern, flags=0):
+    """Finds strings one of which every match of a pattern contains
+
+    Args:
+        pattern (str or Pattern): the regular expression
+        flags (int, optional): re flags. Defaults to 0.
+
+    Returns:
+        frozenset: the strings, lowercased if the pattern ignores case, or None if nothing is required
+            (or the pattern is too involved to tell, or re's parser isn't available)
+    """
+    if isinstance(pattern, re.Pattern):
+        flags |= pattern.flags
+        pattern = pattern.pattern
+
+    if not isinstance(pattern, str) or sre_parse is None:
+        return None
+
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+        ignore_case = bool(parsed.state.flags & re.IGNORECASE)
+        required = analyse_sequence(parsed.data if hasattr(parsed, "data") else list(parsed), ignore_case)[3]
+    except (AttributeError, TypeError, ValueError):
+        # a parser that has changed shape
+        return None
+
+    if not required:
+        return None
+
+    # a string that contains another required string adds nothing
+    return frozenset(
+        string for string in required
+        if not any(other != string and other in string for other in required)
+    )
+
+
+def get_ignore_case(pattern, flags=0):
+    if isinstance(pattern, re.Pattern):
+        return bool((pattern.flags | flags) & re.IGNORECASE)
+
+    # inline flags such as (?i) count too
+    return bool(re.compile(pattern, flags).flags & re.IGNORECASE)
+
+
+class LiteralPrefilter:
+    """
+    Rejects messages a pattern can't match with a substring check, so the regex only runs
+    on messages that contain one of the literals every match needs. For an ignore-case
+    pattern the literals are looked for in the message lowercased with fold_case, which
+    folds ASCII letters the way re.IGNORECASE does, so no match is ever rejected.
+
+    Attributes:
+        literals (tuple): The strings one of which every match contains, shortest first.
+        ignore_case (bool): Whether the pattern ignores case.
+    """
+
+    def __init__(self, literals, ignore_case=False):
+        """
+        Initializes the prefilter.
+
+        Args:
+            literals ([str]): the strings one of which every match contains
+            ignore_case (bool, optional): whether the pattern ignores case. Defaults to False.
+        """
+        self.literals = tuple(sorted(literals, key=lambda literal: (len(literal), literal)))
+        self.ignore_case = ignore_case
+
+    def prepare(self, text):
+        """
+        Gets the form of a message the literals are looked for in.
+
+        Args:
+            text (str): the message
+
+        Returns:
+            str: the message, folded if the pattern ignores case
+        """
+        return fold_case(text) if self.ignore_case else text
+
+    def contains_literal(self, prepared):
+        """
+        Checks a prepared message (see prepare) for the literals.
+
+        Args:
+            prepared (str): the prepared message
+
+        Returns:
+            bool: True if the message contains one of the literals
+        """
+        for literal in self.literals:
+            if literal in prepared:
+                return True
+
+        return False
+
+    def is_candidate(self, text):
+        """
+        Checks whether the pattern could match a message.
+
+        Args:
+            text (str): the message
+
+        Returns:
+            bool: False only if the pattern can't match it
+        """
+        return self.contains_literal(self.prepare(text))
+
+
+def get_prefilter(pattern, flags=0):
+    """Builds the prefilter of a pattern
+
+    Args:
+        pattern (str or Pattern): the regular expression
+        flags (int, optional): re flags. Defaults to 0.
+
+    Returns:
+        LiteralPrefilter: the prefilter, or None if the pattern needs no literal long enough to filter with
+    """
+    literals = get_required_literals(pattern, flags)
+
+    if not literals or min(len(literal) for literal in literals) < MIN_LITERAL_LENGTH:
+        return None
+
+    return LiteralPrefilter(literals, get_ignore_case(pattern, flags))
@@ -0,0 +1,188 @@
+import contextlib
+import datetime
+import json
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from src.regexp import regexp
+
+def get_peak_rss():
+    """Gets the highest resident set size this process has reached
+
+    Returns:
+        int: kilobytes, or None where the platform can't report it
+    """
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # macOS reports bytes, Linux kilobytes
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def get_cpu_time():
+    """Gets the CPU time used by this process and the worker processes it has waited for
+
+    Returns:
+        float: seconds of user and system time
+    """
+    times = os.times()
+
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def get_sidecar_file(output_file):
+    """Gets the path of the profile written next to a results file
+
+    Args:
+        output_file (str): the results file, e.g. results/bro.md
+
+    Returns:
+        str: e.g. results/bro.profile.json
+    """
+    return f"{os.path.splitext(output_file)[0]}.profile.json"
+
+
+class Stage:
+    """
+    The measurements of one stage of a run.
+
+    Attributes:
+        name (str): What the stage did.
+        rows (int): How many rows the stage processed, if it processes rows.
+        wall_seconds (float): Elapsed time.
+        cpu_seconds (float): CPU time, including worker processes.
+        peak_rss_kb (int): The process's peak memory when the stage finished.
+        peak_rss_growth_kb (int): How much the stage raised the peak.
+        regexp_calls (int): How many times SQLite called the REGEXP function during the stage.
+        regex_searches (int): How many times a scanner ran a category pattern over a message, if the stage scans.
+    """
+
+    def __init__(self, name, rows=None):
+        self.name = name
+        self.rows = rows
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.peak_rss_kb = None
+        self.peak_rss_growth_kb = None
+        self.regexp_calls = 0
+        self.regex_searches = 0
+
+    def to_dict(self):
+        rows_per_sec = None
+        if self.rows is not None and self.wall_seconds:
+            rows_per_sec = round(self.rows / self.wall_seconds, 1)
+
+        return {
+            "name": self.name,
+            "wall_seconds": round(self.wall_seconds, 6),
+            "cpu_seconds": round(self.cpu_seconds, 6),
+            "rows": self.rows,
+            "rows_per_sec": rows_per_sec,
+            "peak_rss_kb": self.peak_rss_kb,
+            "peak_rss_growth_kb": self.peak_rss_growth_kb,
+            "regexp_calls": self.regexp_calls,
+            "regex_searches": self.regex_searches,
+            "regex_evaluations": self.regexp_calls + self.regex_searches,
+        }
+
+
+class Profiler:
+    """
+    Records the time, CPU, rows and memory of each stage of a run. A disabled profiler
+    measures nothing, so code can always wrap its stages and only pay when profiling.
+
+        with profiler.stage("scan") as stage:
+            ...
+            stage.rows = rows_scanned
+
+    Attributes:
+        enabled (bool): Whether stages are measured.
+        stages ([Stage]): Every measured stage, in the order they finished.
+    """
+
+    def __init__(self, enabled=True):
+        """
+        Initializes the profiler.
+
+        Args:
+            enabled (bool, optional): Measure stages. Defaults to True.
+        """
+        self.enabled = enabled
+        self.stages = []
+        self.started = datetime.datetime.now(datetime.timezone.utc)
+        self.start_wall = time.perf_counter()
+        self.start_cpu = get_cpu_time()
+
+    @contextlib.contextmanager
+    def stage(self, name, rows=None):
+        """
+        Measures the code in a with block as one stage.
+
+        Args:
+            name (str): what the stage does
+            rows (int, optional): how many rows it processes. Can also be set on the stage inside the block.
+
+        Yields:
+            Stage: the stage being measured
+        """
+        stage = Stage(name, rows)
+
+        if not self.enabled:
+            yield stage
+            return
+
+        start_peak = get_peak_rss()
+        start_calls = regexp.calls
+        start_cpu = get_cpu_time()
+        start_wall = time.perf_counter()
+
+        try:
+            yield stage
+        finally:
+            stage.wall_seconds = time.perf_counter() - start_wall
+            stage.cpu_seconds = get_cpu_time() - start_cpu
+            stage.regexp_calls = regexp.calls - start_calls
+            stage.peak_rss_kb = get_peak_rss()
+            if start_peak is not None:
+                stage.peak_rss_growth_kb = stage.peak_rss_kb - start_peak
+
+            self.stages.append(stage)
+
+    def to_dict(self, **details):
+        """
+        Gets every stage and the run's totals.
+
+        Args:
+            **details: anything else to describe the run with, such as its arguments
+
+        Returns:
+            dict: the profile
+        """
+        return {
+            **details,
+            "started": self.started.isoformat(),
+            "wall_seconds": round(time.perf_counter() - self.start_wall, 6),
+            "cpu_seconds": round(get_cpu_time() - self.start_cpu, 6),
+            "peak_rss_kb": get_peak_rss(),
+            "regexp": regexp.get_stats(),
+            "stages": [stage.to_dict() for stage in self.stages],
+        }
+
+    def write(self, profile_file, **details):
+        """
+        Writes the profile as JSON.
+
+        Args:
+            profile_file (str): where to write it
+            **details: anything else to describe the run with, such as its arguments
+        """
+        with open(profile_file, "w", encoding="utf-8") as file:
+            json.dump(self.to_dict(**details), file, indent=2)
@@ -1,15 +1,16 @@
 import re
+from collections import Counter
 
-from src.regexes import PROFANITY_REGEX, NEGATION_REGEX, AFFIRMATION_REGEX, EMOJI_REGEX
-
-def regexp(expression, text, search=re.search):
-    """Provides a regex function for SQL Lite
-
-    Args:
-        expression (string): regular expression
-        text (string): text to search
-    """
-    return 1 if search(expression, text) else 0
+from src.cache import get_database_fingerprint
+from src.constants import DEFAULT_BATCH_SIZE
+from src.database import get_database_file
+from src.incremental import update_scanners
+from src.parallel import parallel_scan
+from src.prefilter import get_prefilter
+from src.profiler import Profiler
+from src.query import RowFilter
+from src.rows import ROWID_INDEX, RowStream, get_pronouns_rows_query, get_rows_by_rowid, get_rows_query
+from src.scanner import CATEGORY_BITS, CATEGORY_PATTERNS, CategoryScanner, compile_category, get_category_mask, get_mask_array, get_searches
 
 class PronounCollection:
     """
@@ -20,28 +21,67 @@ class PronounCollection:
     Attributes:
         pronoun (str): The pronoun to filter posts by.
         connection (sqlite3.Connection): The SQLite database connection.
-        rows (list): Cached list of all rows for the pronoun.
+        rows (list | RowStream | Snapshot): Cached list of all rows for the pronoun, a RowStream when streaming, or a Snapshot.
+        scanners (dict): The CategoryScanner holding the results of each category that has been scanned.
+        cache (ResultCache): Where scan results are stored between runs, if anywhere.
+        incremental (IncrementalStore): Where scan results are kept up to date between runs, if anywhere.
+        profiler (Profiler): Records the time spent loading and scanning the rows.
+        row_filter (RowFilter): Which of the pronoun's rows are read.
+        masks (array): The categories of each row as a bitmask (see CATEGORY_BITS), in row order, once get_masks has built it.
     """
 
-    def __init__(self, pronoun_name, connection):
+    def __init__(self, pronoun_name, connection, stream=False, batch_size=DEFAULT_BATCH_SIZE, cache=None, incremental=None, profiler=None, snapshot=None, row_filter=None):
         """
         Initializes the PronounCollection with a pronoun and a database connection.
 
         Args:
             pronoun_name (str): The pronoun to filter posts by.
             connection (sqlite3.Connection): The SQLite database connection.
+            stream (bool, optional): Read the rows in batches on every pass instead of keeping them all in memory. Defaults to False.
+            batch_size (int, optional): How many rows a stream fetches at a time. Defaults to DEFAULT_BATCH_SIZE.
+            cache (ResultCache, optional): Serve scan results from this cache while the database is unchanged. Defaults to None.
+            incremental (IncrementalStore, optional): Keep scan results in this store and only scan posts added since the last scan. Defaults to None.
+            profiler (Profiler, optional): Record the query, fetch and scan stages here. Defaults to None.
+            snapshot (Snapshot, optional): Read the rows from this memory-mapped snapshot instead of the database. Defaults to None.
+            row_filter (RowFilter, optional): Only read the rows it lets through. Can't be combined with a snapshot
+                or an incremental store, which hold every row. Defaults to None.
+
+        Raises:
+            ValueError: if a filter is combined with a snapshot or an incremental store
         """
         self.pronoun = pronoun_name
         self.connection = connection
-        self.rows = self.get_all_rows()
+        self.scanners = {}
+        self.cache = cache
+        self.fingerprint = get_database_fingerprint(connection, pronoun_name) if cache else None
+        self.incremental = incremental
+        self.profiler = profiler or Profiler(enabled=False)
+        self.row_filter = row_filter or RowFilter()
+        self.masks = None
+
+        if not self.row_filter.is_empty() and (snapshot is not None or incremental):
+            raise ValueError("Filtered rows can't be read from a snapshot or kept incrementally")
+
+        if snapshot is not None:
+            self.rows = snapshot
+        elif stream:
+            self.rows = RowStream(pronoun_name, connection, batch_size, self.row_filter)
+        else:
+            self.rows = self.get_all_rows()
     
     def get_frequency_dict(self, regex, no_flags = False):
         freq_dict = {}
         if not regex:
             raise ValueError("A Regular expression must be provided")
 
-        for row in self.rows:
-            message = row[3].strip()
+        # messages without any of the literals every match needs are skipped (see src.prefilter)
+        prefilter = get_prefilter(regex, 0 if no_flags else re.IGNORECASE)
+
+        for text in self.get_texts():
+            message = text.strip()
+            if prefilter is not None and not prefilter.is_candidate(message):
+                continue
+
             search_results = re.findall(regex, message, flags=re.IGNORECASE) if not no_flags else re.findall(regex, message)
 
             for result_tuple in search_results:
@@ -59,21 +99,269 @@ class PronounCollection:
     def get_all_rows(self):
         """
         Retrieves all rows from the 'post' table where the pronoun matches self.pronoun.
+        Only the columns analysis reads are selected (see src.rows), followed by the rowid.
 
         Returns:
             list: All rows from the database for the specified pronoun.
         """
         cursor = self.connection.cursor()
-        query = f"SELECT * FROM post WHERE post.pronoun='{self.pronoun}'"
+        query = get_rows_query(self.connection, row_filter=self.row_filter)
 
-        cursor.execute(query)
-        rows = cursor.fetchall()
+        with self.profiler.stage("query"):
+            cursor.execute(query, (self.pronoun, *self.row_filter.get_parameters()))
+
+        with self.profiler.stage("fetch") as stage:
+            rows = cursor.fetchall()
+            stage.rows = len(rows)
 
         self.rows = rows
+        self.scanners = {}
+        self.masks = None
         self.connection.commit()
 
         return rows
 
+    def scan(self, categories=None, keep_rows=True, workers=1):
+        """
+        Scans the rows once for every requested category that hasn't been scanned yet.
+        The frequency and row methods read their results from here, so scanning all the
+        categories you need up front means the messages are only read once.
+
+        Args:
+            categories ([str], optional): Categories to scan. Defaults to every category.
+            keep_rows (bool, optional): Keep the matching rows as well as the frequencies. Defaults to True.
+            workers (int, optional): Split the scan by rowid range across this many processes,
+                each reading the database on its own. A filter with a limit is always scanned in one process. Defaults to 1.
+
+        Returns:
+            dict: The CategoryScanner for each scanned category.
+        """
+        categories = categories or list(CATEGORY_PATTERNS)
+        missing = [
+            category for category in categories
+            if category not in self.scanners or (keep_rows and not self.scanners[category].keep_rows)
+        ]
+
+        if self.fingerprint:
+            with self.profiler.stage("cache " + "+".join(missing)):
+                missing = self.load_cached_scans(missing, keep_rows)
+
+        if not missing:
+            return self.scanners
+
+        # the categories are scanned together in one pass, so they're one stage
+        with self.profiler.stage("scan " + "+".join(missing)) as stage:
+            if self.incremental:
+                scanners = update_scanners(self.connection, self.pronoun, missing, self.incremental, keep_rows)
+            elif workers > 1 and self.row_filter.limit is None:
+                database_file = get_database_file(self.connection)
+                scanner = parallel_scan(database_file, self.pronoun, missing, keep_rows, workers, self.row_filter)
+                scanners = dict.fromkeys(missing, scanner)
+            elif hasattr(self.rows, "texts"):
+                # a snapshot's messages are scanned from its columns, and only the matching rows are built
+                scanner = CategoryScanner(missing, keep_rows=False).scan_columns(self.rows.texts, self.rows.rowids)
+                if keep_rows:
+                    # a row matching several categories is built once, and shared like a scanned row is
+                    matched = sorted(set().union(*(scanner.rowids[category] for category in missing)))
+                    rows = dict(zip(matched, self.rows.get_rows_by_rowid(matched)))
+                    scanner.keep_rows = True
+                    for category in missing:
+                        scanner.rows[category] = [rows[rowid] for rowid in scanner.rowids[category]]
+                scanners = dict.fromkeys(missing, scanner)
+            else:
+                scanner = CategoryScanner(missing, keep_rows=keep_rows).scan(self.rows)
+                scanners = dict.fromkeys(missing, scanner)
+
+            stage.rows = max(scanner.rows_scanned for scanner in scanners.values())
+            stage.regex_searches = get_searches(scanners)
+
+        self.add_scanners(scanners)
+
+        return self.scanners
+
+    def add_scanners(self, scanners):
+        """
+        Keeps the results of a scan, and caches them if there's a cache.
+
+        Args:
+            scanners (dict): The CategoryScanner holding the results of each category.
+        """
+        for category, scanner in scanners.items():
+            self.scanners[category] = scanner
+
+            if self.fingerprint:
+                key = self.cache.get_key(self.fingerprint, self.pronoun, category, self.row_filter)
+                self.cache.put(key, scanner.to_dict(category))
+
+    def load_cached_scans(self, categories, keep_rows=True):
+        """
+        Loads the results of any categories that are in the cache.
+
+        Args:
+            categories ([str]): Categories to look up.
+            keep_rows (bool, optional): Fetch the matching rows by their rowids as well. Defaults to True.
+
+        Returns:
+            [str]: The categories that weren't cached and still need scanning.
+        """
+        missing = []
+
+        for category in categories:
+            cached = self.cache.get(self.cache.get_key(self.fingerprint, self.pronoun, category, self.row_filter))
+
+            if cached is None:
+                missing.append(category)
+                continue
+
+            rows = get_rows_by_rowid(self.connection, cached["rowids"]) if keep_rows else None
+            self.scanners[category] = CategoryScanner.from_dict(category, cached, rows)
+
+        return missing
+
+    def get_category_frequencies(self, category):
+        """
+        Counts the frequency of each term of a category found in the messages.
+
+        Args:
+            category (str): the category name
+
+        Returns:
+            dict: A dictionary mapping each term (str) to its occurrence count (int).
+        """
+        return self.scan([category], keep_rows=False)[category].get_frequencies(category)
+
+    def get_category_rows(self, category):
+        """
+        Retrieves all rows where the message contains a term of the category.
+
+        Args:
+            category (str): the category name
+
+        Returns:
+            list: Rows where the category is present in the message.
+        """
+        return self.scan([category])[category].get_rows(category)
+
+    def iter_category_rows(self, category):
+        """
+        Yields the rows where the message contains a term of the category without keeping them.
+        Use this instead of get_category_rows when streaming a large pronoun.
+
+        Args:
+            category (str): the category name
+
+        Yields:
+            tuple: Rows where the category is present in the message.
+        """
+        if category in self.scanners and self.scanners[category].keep_rows:
+            yield from self.scanners[category].get_rows(category)
+            return
+
+        regex = compile_category(category)
+
+        if hasattr(self.rows, "texts"):
+            for position, text in enumerate(self.rows.texts):
+                if regex.search(text.strip()):
+                    yield self.rows[position]
+            return
+
+        for row in self.rows:
+            if regex.search(row[3].strip()):
+                yield row
+
+    def get_texts(self):
+        """
+        Gets the message of every row, in row order. A snapshot's are read from its
+        text column, without building its rows.
+
+        Returns:
+            iterable: the messages
+        """
+        if hasattr(self.rows, "texts"):
+            return self.rows.texts
+
+        return (row[3] for row in self.rows)
+
+    def get_rowids(self):
+        """
+        Gets the rowid of every row, in row order.
+
+        Returns:
+            list: the rowids
+        """
+        if hasattr(self.rows, "rowids"):
+            return self.rows.rowids
+
+        return [row[ROWID_INDEX] for row in self.rows]
+
+    def get_masks(self):
+        """
+        Gets the categories each row matches as a bitmask, one small integer per row. Every
+        category is scanned for (or loaded from the cache) once, and the masks are built from
+        the matching rowids, so no regex is run again for any combination of categories.
+
+        Returns:
+            array: the mask of each row, in row order (see CATEGORY_BITS)
+        """
+        if self.masks is not None:
+            return self.masks
+
+        scanners = self.scan(list(CATEGORY_PATTERNS), keep_rows=False)
+        positions = {rowid: position for position, rowid in enumerate(self.get_rowids())}
+        masks = get_mask_array(len(positions))
+
+        for category, bit in CATEGORY_BITS.items():
+            for rowid in scanners[category].rowids[category]:
+                masks[positions[rowid]] |= bit
+
+        self.masks = masks
+
+        return masks
+
+    def get_rows_with(self, categories, without=()):
+        """
+        Gets the rows that match every one of some categories and none of others, from the masks.
+
+        Args:
+            categories ([str]): categories a row must match all of, e.g. ["profanity", "negation"]
+            without ([str], optional): categories a row must match none of. Defaults to none.
+
+        Returns:
+            list: the rows, in row order
+        """
+        required = get_category_mask(categories)
+        excluded = get_category_mask(without)
+        masks = self.get_masks()
+
+        # there are only as many distinct masks as combinations of categories, so each is tested once
+        wanted = {mask for mask in set(masks) if mask & required == required and not mask & excluded}
+
+        if isinstance(self.rows, list) or hasattr(self.rows, "rowids"):
+            return [self.rows[position] for position, mask in enumerate(masks) if mask in wanted]
+
+        return [row for row, mask in zip(self.rows, masks) if mask in wanted]
+
+    def get_cooccurrence(self, categories=None):
+        """
+        Counts the rows that match each pair of categories.
+
+        Args:
+            categories ([str], optional): the categories. Defaults to every category.
+
+        Returns:
+            dict: category to category to how many rows match both. A category paired with itself is how many rows match it.
+        """
+        categories = categories or list(CATEGORY_PATTERNS)
+        mask_counts = Counter(self.get_masks())
+
+        return {
+            category: {
+                other: sum(count for mask, count in mask_counts.items() if mask & CATEGORY_BITS[category] and mask & CATEGORY_BITS[other])
+                for other in categories
+            }
+            for category in categories
+        }
+
     def get_profanity_frequencies(self):
         """
         Counts the frequency of each profanity found in the messages.
@@ -81,10 +369,7 @@ class PronounCollection:
         Returns:
             dict: A dictionary mapping each profanity (str) to its occurrence count (int).
         """
-        freq_dict = self.get_frequency_dict(PROFANITY_REGEX)
-        sorted_dict = dict(sorted(freq_dict.items(), key=lambda item:item[1], reverse=True))
-
-        return sorted_dict
+        return self.get_category_frequencies("profanity")
     
     def get_profanity_rows(self):
         """
@@ -93,15 +378,7 @@ class PronounCollection:
         Returns:
             list: Rows where a profanity is present in the message.
         """
-        rows_with_term = []
-        
-        for row in self.rows:
-            message = row[3].strip()
-            has_result = re.findall(PROFANITY_REGEX, message, flags=re.IGNORECASE)
-            if (has_result):
-                rows_with_term.append(row)
-        
-        return rows_with_term
+        return self.get_category_rows("profanity")
 
     def get_negation_frequencies(self):
         """
@@ -110,9 +387,7 @@ class PronounCollection:
         Returns:
             dict: A dictionary mapping each negation (str) to its occurrence count (int).
         """
-        freq_dict = self.get_frequency_dict(NEGATION_REGEX)
-        sorted_dict = dict(sorted(freq_dict.items(), key=lambda item:item[1], reverse=True))
-        return sorted_dict
+        return self.get_category_frequencies("negation")
 
     def get_negation_rows(self):
         """
@@ -121,15 +396,7 @@ class PronounCollection:
         Returns:
             list: Rows where a negation is present in the message.
         """
-        rows_with_term = []
-        
-        for row in self.rows:
-            message = row[3].strip()
-            has_result = re.search(NEGATION_REGEX, message, flags=re.IGNORECASE)
-            if (has_result):
-                rows_with_term.append(row)
-        
-        return rows_with_term
+        return self.get_category_rows("negation")
     
     def get_affirmation_frequencies(self):
         """
@@ -138,9 +405,7 @@ class PronounCollection:
         Returns:
             dict: A dictionary mapping each affirmation (str) to its occurrence count (int).
         """
-        freq_dict = self.get_frequency_dict(AFFIRMATION_REGEX)
-        sorted_dict = dict(sorted(freq_dict.items(), key=lambda item:item[1], reverse=True))
-        return sorted_dict
+        return self.get_category_frequencies("affirmation")
         
     def get_affirmation_rows(self):
         """
@@ -149,26 +414,17 @@ class PronounCollection:
         Returns:
             list: Rows where a negation is present in the message.
         """
-        rows_with_term = []
-        
-        for row in self.rows:
-            message = row[3].strip()
-            has_result = re.search(AFFIRMATION_REGEX, message, flags=re.IGNORECASE)
-            if (has_result):
-                rows_with_term.append(row)
-        
-        return rows_with_term
+        return self.get_category_rows("affirmation")
     
     def get_emoji_frequencies(self):
         """
-        Counts the frequency of each emoji found in the messages.
+        Counts the frequency of each emoji found in the messages. A flag, a skin tone, a ZWJ
+        family or a keycap is counted as one emoji (see src.emoji).
 
         Returns:
             dict: A dictionary mapping each emoji (str) to its occurrence count (int).
         """
-        freq_dict = self.get_frequency_dict(EMOJI_REGEX, True)
-        sorted_dict = dict(sorted(freq_dict.items(), key=lambda item:item[1], reverse=True))
-        return sorted_dict
+        return self.get_category_frequencies("emoji")
 
     def get_emoji_rows(self):
         """
@@ -177,12 +433,99 @@ class PronounCollection:
         Returns:
             list: Rows where an emoji is present in the message.
         """
-        rows_with_term = []
-        
-        for row in self.rows:
-            message = row[3].strip()
-            has_result = re.search(EMOJI_REGEX, message)
-            if (has_result):
-                rows_with_term.append(row)
-        
-        return rows_with_term
\ No newline at end of file
+        return self.get_category_rows("emoji")
+
+    def get_personal_pronoun_frequencies(self):
+        """
+        Counts the frequency of each personal pronoun found in the messages.
+
+        Returns:
+            dict: A dictionary mapping each personal pronoun (str) to its occurrence count (int).
+        """
+        return self.get_category_frequencies("personal_pronoun")
+
+    def get_personal_pronoun_rows(self):
+        """
+        Retrieves all rows where the message contains a personal pronoun.
+
+        Returns:
+            list: Rows where a personal pronoun is present in the message.
+        """
+        return self.get_category_rows("personal_pronoun")
+
+
+def scan_pronouns(connection, pronouns, categories, keep_rows=True, stream=False, batch_size=DEFAULT_BATCH_SIZE, cache=None, profiler=None, row_filter=None):
+    """
+    Builds a PronounCollection for each pronoun from one pass over the post table. Each row
+    is sent to its pronoun's scanner, so every category of every pronoun is scanned without
+    a query or a pass of its own.
+
+    Args:
+        connection (sqlite3.Connection): The SQLite database connection.
+        pronouns ([str]): The pronouns to collect.
+        categories ([str]): Categories to scan.
+        keep_rows (bool, optional): Keep the matching rows as well as the frequencies. Defaults to True.
+        stream (bool, optional): Don't keep each pronoun's rows; its collection streams them when they're needed. Defaults to False.
+        batch_size (int, optional): How many rows are fetched at a time. Defaults to DEFAULT_BATCH_SIZE.
+        cache (ResultCache, optional): Serve scan results from this cache while the database is unchanged. Defaults to None.
+        profiler (Profiler, optional): Record the shared scan here. Defaults to None.
+        row_filter (RowFilter, optional): Only read the rows it lets through. It can't have a limit,
+            which would be shared between the pronouns. Defaults to None.
+
+    Returns:
+        dict: The PronounCollection of each pronoun, with its categories scanned.
+    """
+    profiler = profiler or Profiler(enabled=False)
+    row_filter = row_filter or RowFilter()
+    # streaming collections don't read anything until they're used
+    collections = {
+        pronoun: PronounCollection(pronoun, connection, stream=True, batch_size=batch_size, cache=cache, profiler=profiler, row_filter=row_filter)
+        for pronoun in pronouns
+    }
+    missing = {
+        pronoun: collection.load_cached_scans(categories, keep_rows) if collection.fingerprint else list(categories)
+        for pronoun, collection in collections.items()
+    }
+    scan_categories = [category for category in categories if any(category in missed for missed in missing.values())]
+
+    if stream and not scan_categories:
+        return collections
+
+    rows = {pronoun: [] for pronoun in pronouns}
+    scanners = {pronoun: CategoryScanner(scan_categories, keep_rows=keep_rows) for pronoun in pronouns if missing[pronoun]}
+
+    with profiler.stage("scan " + "+".join(pronouns)) as stage:
+        cursor = connection.cursor()
+        query = get_pronouns_rows_query(connection, len(pronouns), row_filter)
+        cursor.execute(query, (*pronouns, *row_filter.get_parameters()))
+        stage.rows = 0
+
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+
+            stage.rows += len(batch)
+
+            for row in batch:
+                pronoun = row[-1]
+                row = row[:ROWID_INDEX + 1]
+
+                if not stream:
+                    rows[pronoun].append(row)
+
+                if pronoun in scanners:
+                    scanners[pronoun].scan_row(row)
+
+        cursor.close()
+        stage.regex_searches = get_searches(scanners)
+
+    for pronoun, collection in collections.items():
+        if not stream:
+            collection.rows = rows[pronoun]
+
+        if pronoun in scanners:
+            collection.add_scanners({category: scanners[pronoun] for category in missing[pronoun]})
+
+    return collections
+
@@ -0,0 +1,146 @@
+import datetime
+import re
+
+RELATIVE_DATE = re.compile(r"^(\d+)([hdw])$")
+RELATIVE_UNITS = {"h": "hours", "d": "days", "w": "weeks"}
+
+
+def parse_date(value, now=None):
+    """Parses a date for a filter. Takes an ISO 8601 date or time, or a span back from now like 7d, 12h or 2w
+
+    Args:
+        value (str): the date
+        now (datetime, optional): what a span is counted back from. Defaults to the current time.
+
+    Raises:
+        ValueError: if the date can't be parsed
+
+    Returns:
+        str: the date in UTC, written so it compares with the stored ISO 8601 dates as text
+    """
+    match = RELATIVE_DATE.match(value.strip())
+
+    if match:
+        now = now or datetime.datetime.now(datetime.timezone.utc)
+        date = now - datetime.timedelta(**{RELATIVE_UNITS[match.group(2)]: int(match.group(1))})
+    else:
+        date = datetime.datetime.fromisoformat(value.strip())
+
+    if date.tzinfo is not None:
+        date = date.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+    return date.isoformat()
+
+
+class RowFilter:
+    """
+    Narrows the rows a query selects, in SQL, so rows outside the filter are never read.
+    Every value is a bound parameter.
+
+    Dates are compared as text, which orders ISO 8601 UTC dates (the way Bluesky writes
+    indexedAt) by time.
+
+    Attributes:
+        since (str): Only rows dated at or after this.
+        until (str): Only rows dated before this.
+        limit (int): Only the first this many rows, in rowid order.
+        min_rowid (int): Only rows with at least this rowid.
+        max_rowid (int): Only rows with at most this rowid.
+    """
+
+    def __init__(self, since=None, until=None, limit=None, min_rowid=None, max_rowid=None):
+        """
+        Initializes the filter. Leave a value out not to filter by it.
+
+        Args:
+            since (str, optional): Only rows dated at or after this (see parse_date). Defaults to None.
+            until (str, optional): Only rows dated before this (see parse_date). Defaults to None.
+            limit (int, optional): Only the first this many rows, in rowid order. Defaults to None.
+            min_rowid (int, optional): Only rows with at least this rowid. Defaults to None.
+            max_rowid (int, optional): Only rows with at most this rowid. Defaults to None.
+        """
+        self.since = since
+        self.until = until
+        self.limit = limit
+        self.min_rowid = min_rowid
+        self.max_rowid = max_rowid
+
+    def is_empty(self):
+        """
+        Checks whether the filter lets every row through.
+
+        Returns:
+            bool: True if nothing is filtered
+        """
+        return not any(value is not None for value in self.to_dict().values())
+
+    def get_conditions(self, date_column):
+        """
+        Gets the SQL condition of each value that's set.
+
+        Args:
+            date_column (str): the name of the date column
+
+        Returns:
+            [str]: conditions with a ? for each parameter, in the order of get_parameters
+        """
+        conditions = []
+
+        if self.since is not None:
+            conditions.append(f'"{date_column}" >= ?')
+        if self.until is not None:
+            conditions.append(f'"{date_column}" < ?')
+        if self.min_rowid is not None:
+            conditions.append("rowid >= ?")
+        if self.max_rowid is not None:
+            conditions.append("rowid <= ?")
+
+        return conditions
+
+    def get_parameters(self):
+        """
+        Gets the parameters of the conditions, then the limit.
+
+        Returns:
+            list: the values to bind
+        """
+        values = [self.since, self.until, self.min_rowid, self.max_rowid, self.limit]
+
+        return [value for value in values if value is not None]
+
+    def apply(self, query, date_column):
+        """
+        Adds the filter to a query that ends in a WHERE clause, and orders the rows by rowid.
+
+        Args:
+            query (str): the query
+            date_column (str): the name of the date column
+
+        Returns:
+            str: the filtered query. Bind get_parameters after the query's own parameters.
+        """
+        for condition in self.get_conditions(date_column):
+            query = f"{query} AND {condition}"
+
+        # rows come back in rowid order whichever index SQLite picks
+        query = f"{query} ORDER BY rowid"
+
+        if self.limit is not None:
+            query = f"{query} LIMIT ?"
+
+        return query
+
+    def to_dict(self):
+        """
+        Gets the filter's values, to tell results of different filters apart.
+
+        Returns:
+            dict: every value, None where it isn't set
+        """
+        return {
+            "since": self.since,
+            "until": self.until,
+            "limit": self.limit,
+            "min_rowid": self.min_rowid,
+            "max_rowid": self.max_rowid,
+        }
@@ -5,18 +5,19 @@ import re
 PROFANITY_REGEX = "(\\b|\w*)?((fuck|shit|dick|cock|cunt|twat|damn)(\\w+)?)|(\\b)?(ass(hole|wad|face|head)?)|(wtf|stfu|omfg|fml|lmfao)(\\b)"
 NEGATION_REGEX = "\\b(n(o+(pe)?|a+(h|w)?|uh))\\b"
 AFFIRMATION_REGEX = "\\b(y((e+|a+|u+)(a+)?(y|h|s|p)?)\\b)"
-EMOJI_REGEX =  re.compile(
-    "(["
-    "\U0001F1E0-\U0001F1FF"  # flags (iOS)
-    "\U0001F300-\U0001F5FF"  # symbols & pictographs
-    "\U0001F600-\U0001F64F"  # emoticons
-    "\U0001F680-\U0001F6FF"  # transport & map symbols
-    "\U0001F700-\U0001F77F"  # alchemical symbols
-    "\U0001F780-\U0001F7FF"  # Geometric Shapes Extended
-    "\U0001F800-\U0001F8FF"  # Supplemental Arrows-C
-    "\U0001F900-\U0001F9FF"  # Supplemental Symbols and Pictographs
-    "\U0001FA00-\U0001FA6F"  # Chess Symbols
-    "\U0001FA70-\U0001FAFF"  # Symbols and Pictographs Extended-A
-    "\U00002702-\U000027B0"  # Dingbats
-    "])"
-    )
\ No newline at end of file
+PERSONAL_PRONOUN_REGEX = "\\b((i|you|he|she|we|they))\\b"
+# the codepoints counted as emojis, as inclusive ranges
+EMOJI_RANGES = [
+    (0x1F1E0, 0x1F1FF),  # flags (iOS)
+    (0x1F300, 0x1F5FF),  # symbols & pictographs
+    (0x1F600, 0x1F64F),  # emoticons
+    (0x1F680, 0x1F6FF),  # transport & map symbols
+    (0x1F700, 0x1F77F),  # alchemical symbols
+    (0x1F780, 0x1F7FF),  # Geometric Shapes Extended
+    (0x1F800, 0x1F8FF),  # Supplemental Arrows-C
+    (0x1F900, 0x1F9FF),  # Supplemental Symbols and Pictographs
+    (0x1FA00, 0x1FA6F),  # Chess Symbols
+    (0x1FA70, 0x1FAFF),  # Symbols and Pictographs Extended-A
+    (0x2702, 0x27B0),  # Dingbats
+]
+EMOJI_REGEX = re.compile("([" + "".join(f"{chr(start)}-{chr(end)}" for start, end in EMOJI_RANGES) + "])")
\ No newline at end of file
@@ -0,0 +1,163 @@
+import re
+import sqlite3
+from collections import OrderedDict
+
+from src.prefilter import get_prefilter
+
+DEFAULT_PATTERN_CACHE_SIZE = 256
+
+
+class RegexpFunction:
+    """
+    A REGEXP function for SQLite that keeps its own bounded LRU cache of compiled patterns,
+    so a query calling it once per row compiles its pattern once, however many other
+    patterns are in use. Each pattern is compiled with its LiteralPrefilter, so a text that
+    has none of the literals every match needs is rejected without running the regex.
+
+    Attributes:
+        max_patterns (int): How many compiled patterns are kept.
+        patterns (OrderedDict): Compiled pattern and prefilter (or None) keyed by (expression, flags), least recently used first.
+        calls (int): How many times the function has been called.
+        hits (int): Calls whose pattern was already compiled.
+        misses (int): Calls that had to compile their pattern.
+        rejected (int): Calls the prefilter answered without running the regex.
+    """
+
+    def __init__(self, max_patterns=DEFAULT_PATTERN_CACHE_SIZE):
+        """
+        Initializes the function with an empty cache.
+
+        Args:
+            max_patterns (int, optional): How many compiled patterns to keep. Defaults to DEFAULT_PATTERN_CACHE_SIZE.
+        """
+        self.max_patterns = max_patterns
+        self.patterns = OrderedDict()
+        self.calls = 0
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+
+    def get_compiled(self, expression, flags=0):
+        """
+        Gets the compiled pattern and prefilter for an expression, compiling them on a cache miss.
+
+        Args:
+            expression (string): regular expression
+            flags (int, optional): re flags. Defaults to 0.
+
+        Returns:
+            (Pattern, LiteralPrefilter): the compiled pattern, and its prefilter or None
+        """
+        key = (expression, flags)
+        compiled = self.patterns.get(key)
+
+        if compiled is not None:
+            self.hits += 1
+            self.patterns.move_to_end(key)
+            return compiled
+
+        self.misses += 1
+        compiled = (re.compile(expression, flags), get_prefilter(expression, flags))
+        self.patterns[key] = compiled
+
+        if len(self.patterns) > self.max_patterns:
+            self.patterns.popitem(last=False)
+
+        return compiled
+
+    def get_pattern(self, expression, flags=0):
+        """
+        Gets the compiled pattern for an expression, compiling it on a cache miss.
+
+        Args:
+            expression (string): regular expression
+            flags (int, optional): re flags. Defaults to 0.
+
+        Returns:
+            Pattern: the compiled pattern
+        """
+        return self.get_compiled(expression, flags)[0]
+
+    def search(self, expression, text, flags=0):
+        """
+        Searches text for an expression.
+
+        Args:
+            expression (string): regular expression
+            text (string): text to search
+
+        Returns:
+            int: 1 for a match, 0 for none, None when the text is NULL
+        """
+        self.calls += 1
+
+        if text is None:
+            return None
+
+        pattern, prefilter = self.get_compiled(expression, flags)
+
+        if prefilter is not None and not prefilter.is_candidate(text):
+            self.rejected += 1
+            return 0
+
+        return 1 if pattern.search(text) else 0
+
+    def __call__(self, expression, text):
+        return self.search(expression, text)
+
+    def search_ignore_case(self, expression, text):
+        """
+        Searches text for an expression, ignoring case. Use it in place of `LOWER(text) REGEXP(...)`
+        so SQLite doesn't have to make a lowercased copy of every text.
+
+        Args:
+            expression (string): regular expression
+            text (string): text to search
+
+        Returns:
+            int: 1 for a match, 0 for none, None when the text is NULL
+        """
+        return self.search(expression, text, re.IGNORECASE)
+
+    def get_stats(self):
+        """
+        Gets the call and cache counters.
+
+        Returns:
+            dict: calls, hits, misses, calls the prefilter rejected, and how many patterns are cached
+        """
+        return {
+            "calls": self.calls,
+            "hits": self.hits,
+            "misses": self.misses,
+            "rejected": self.rejected,
+            "cached_patterns": len(self.patterns),
+        }
+
+
+def register_regexp(connection, function=None):
+    """Registers REGEXP (`text REGEXP pattern`) and IREGEXP (`IREGEXP(pattern, text)`) on a connection
+
+    Both are registered as deterministic where SQLite supports it, so it can factor
+    repeated calls with the same arguments out of a query.
+
+    Args:
+        connection (Connection): connection to the database
+        function (RegexpFunction, optional): function to register. Defaults to the shared `regexp`.
+
+    Returns:
+        RegexpFunction: the registered function, for reading its counters
+    """
+    function = function or regexp
+
+    for name, callback in (("regexp", function), ("iregexp", function.search_ignore_case)):
+        try:
+            connection.create_function(name, 2, callback, deterministic=True)
+        except sqlite3.NotSupportedError:
+            connection.create_function(name, 2, callback)
+
+    return function
+
+
+# shared by every connection in the process
+regexp = RegexpFunction()
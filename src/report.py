@@ -0,0 +1,66 @@
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+class TableWriter:
+    """
+    Writes a Markdown table to a file one row at a time. Rows are joined in a buffer and
+    written in chunks, so a table of any length is built in linear time and only one chunk
+    is held in memory.
+
+    Attributes:
+        file (TextIOWrapper): The file to write to.
+        chunk_size (int): How many characters to buffer before writing.
+        rows_written (int): How many rows have been written.
+    """
+
+    def __init__(self, file, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Initializes the writer.
+
+        Args:
+            file (TextIOWrapper): The file to write to.
+            chunk_size (int, optional): How many characters to buffer before writing. Defaults to DEFAULT_CHUNK_SIZE.
+        """
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = []
+        self.buffered = 0
+        self.rows_written = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+
+    def write(self, text):
+        """
+        Buffers text, writing the buffer out once it's full.
+
+        Args:
+            text (str): the text to write
+        """
+        self.buffer.append(text)
+        self.buffered += len(text)
+
+        if self.buffered >= self.chunk_size:
+            self.flush()
+
+    def write_row(self, cells):
+        """
+        Writes one table row.
+
+        Args:
+            cells ([str]): the value of each column
+        """
+        self.write(f"|{'|'.join(cells)}|\n")
+        self.rows_written += 1
+
+    def flush(self):
+        """
+        Writes out whatever is buffered.
+        """
+        if self.buffer:
+            self.file.write("".join(self.buffer))
+            self.buffer = []
+            self.buffered = 0
@@ -0,0 +1,146 @@
+from src.constants import DEFAULT_BATCH_SIZE
+from src.query import RowFilter
+
+# rows keep the first columns of the post table in the positions `SELECT *` gave them
+# (the date is row[2], the message is row[3]) with the rowid added at the end
+ROW_COLUMN_COUNT = 4
+DATE_INDEX = 2
+ROWID_INDEX = ROW_COLUMN_COUNT
+
+
+def get_row_columns(connection):
+    """Gets the names of the post columns that analysis reads
+
+    Args:
+        connection (Connection): connection to the database
+
+    Returns:
+        [str]: column names, in table order
+    """
+    table_info = connection.execute("PRAGMA table_info(post)").fetchall()
+
+    return [column[1] for column in table_info][:ROW_COLUMN_COUNT]
+
+
+def get_rows_query(connection, rowid_range=False, row_filter=None):
+    """Builds the query that selects a pronoun's rows with only the columns analysis reads
+
+    Args:
+        connection (Connection): connection to the database
+        rowid_range (bool, optional): Only select rows between two rowids. Defaults to False.
+        row_filter (RowFilter, optional): Only select the rows it lets through. Defaults to None.
+
+    Returns:
+        str: a query whose parameters are the pronoun, then the lowest and highest rowid if rowid_range is set,
+            then the filter's parameters
+    """
+    row_columns = get_row_columns(connection)
+    columns = ", ".join(f'"{column}"' for column in row_columns)
+    query = f"SELECT {columns}, rowid FROM post WHERE post.pronoun=?"
+
+    if rowid_range:
+        query = f"{query} AND rowid BETWEEN ? AND ?"
+
+    return (row_filter or RowFilter()).apply(query, row_columns[DATE_INDEX])
+
+
+def get_pronouns_rows_query(connection, pronoun_count, row_filter=None):
+    """Builds the query that selects the rows of several pronouns in one pass over the table
+
+    Args:
+        connection (Connection): connection to the database
+        pronoun_count (int): how many pronouns there are
+        row_filter (RowFilter, optional): Only select the rows it lets through. Its limit would apply to
+            all the pronouns together, so it can't have one. Defaults to None.
+
+    Returns:
+        str: a query whose parameters are the pronouns, then the filter's parameters. Each row ends with its pronoun, after the rowid.
+    """
+    row_columns = get_row_columns(connection)
+    columns = ", ".join(f'"{column}"' for column in row_columns)
+    placeholders = ", ".join("?" * pronoun_count)
+    query = f"SELECT {columns}, rowid, pronoun FROM post WHERE post.pronoun IN ({placeholders})"
+
+    row_filter = row_filter or RowFilter()
+    if row_filter.limit is not None:
+        raise ValueError("A limit can't be shared between pronouns")
+
+    return row_filter.apply(query, row_columns[DATE_INDEX])
+
+
+def get_rows_by_rowid(connection, rowids, batch_size=500):
+    """Fetches rows by their rowids
+
+    Args:
+        connection (Connection): connection to the database
+        rowids ([int]): rowids to fetch
+        batch_size (int, optional): how many rowids to look up per query. Defaults to 500.
+
+    Returns:
+        list: the rows, in the order of the rowids given
+    """
+    columns = ", ".join(f'"{column}"' for column in get_row_columns(connection))
+    rows = []
+
+    for start in range(0, len(rowids), batch_size):
+        batch = rowids[start:start + batch_size]
+        placeholders = ", ".join("?" * len(batch))
+        cursor = connection.execute(f"SELECT {columns}, rowid FROM post WHERE rowid IN ({placeholders})", batch)
+        found = {row[ROWID_INDEX]: row for row in cursor}
+        rows.extend(found[rowid] for rowid in batch if rowid in found)
+
+    return rows
+
+
+class RowStream:
+    """
+    A re-iterable source of a pronoun's rows. Every iteration runs the query again and
+    reads it in batches with fetchmany, so only one batch is held in memory at a time.
+
+    Attributes:
+        pronoun (str): The pronoun to filter posts by.
+        connection (sqlite3.Connection): The SQLite database connection.
+        batch_size (int): How many rows are fetched at a time.
+        row_filter (RowFilter): Which of the pronoun's rows are read.
+    """
+
+    def __init__(self, pronoun, connection, batch_size=DEFAULT_BATCH_SIZE, row_filter=None):
+        """
+        Initializes the stream. Nothing is read until it is iterated.
+
+        Args:
+            pronoun (str): The pronoun to filter posts by.
+            connection (sqlite3.Connection): The SQLite database connection.
+            batch_size (int, optional): How many rows are fetched at a time. Defaults to DEFAULT_BATCH_SIZE.
+            row_filter (RowFilter, optional): Only read the rows it lets through. Defaults to None.
+        """
+        self.pronoun = pronoun
+        self.connection = connection
+        self.batch_size = batch_size
+        self.row_filter = row_filter or RowFilter()
+        self.query = get_rows_query(connection, row_filter=self.row_filter)
+        self.parameters = (pronoun, *self.row_filter.get_parameters())
+
+    def __iter__(self):
+        cursor = self.connection.cursor()
+        cursor.execute(self.query, self.parameters)
+
+        while True:
+            batch = cursor.fetchmany(self.batch_size)
+            if not batch:
+                break
+
+            yield from batch
+
+        cursor.close()
+
+    def __len__(self):
+        cursor = self.connection.cursor()
+        if self.row_filter.is_empty():
+            cursor.execute("SELECT COUNT(*) FROM post WHERE post.pronoun=?", (self.pronoun,))
+        else:
+            cursor.execute(f"SELECT COUNT(*) FROM ({self.query})", self.parameters)
+        count = cursor.fetchone()[0]
+        cursor.close()
+
+        return count
@@ -0,0 +1,363 @@
+import re
+from array import array
+
+from src.emoji import EmojiFinder
+from src.matcher import fold_case
+from src.prefilter import get_prefilter
+from src.regexes import PROFANITY_REGEX, NEGATION_REGEX, AFFIRMATION_REGEX, EMOJI_REGEX, PERSONAL_PRONOUN_REGEX
+from src.rows import ROWID_INDEX
+
+# category name: (pattern, flags)
+CATEGORY_PATTERNS = {
+    "profanity": (PROFANITY_REGEX, re.IGNORECASE),
+    "negation": (NEGATION_REGEX, re.IGNORECASE),
+    "affirmation": (AFFIRMATION_REGEX, re.IGNORECASE),
+    "emoji": (EMOJI_REGEX, 0),
+    "personal_pronoun": (PERSONAL_PRONOUN_REGEX, re.IGNORECASE),
+}
+
+# categories found with something other than their regex: emojis are found as whole sequences
+CATEGORY_FINDERS = {
+    "emoji": EmojiFinder(),
+}
+
+# each category's bit in a post's category mask
+CATEGORY_BITS = {category: 1 << index for index, category in enumerate(CATEGORY_PATTERNS)}
+
+TEXT_INDEX = 3
+
+
+def compile_category(category):
+    """Compiles a category's pattern, or gets the finder used in its place
+
+    Args:
+        category (str): the category name
+
+    Returns:
+        re.Pattern or EmojiFinder: something with findall and search
+    """
+    finder = CATEGORY_FINDERS.get(category)
+
+    if finder is not None:
+        return finder
+
+    pattern, flags = CATEGORY_PATTERNS[category]
+
+    return re.compile(pattern, flags)
+
+
+def get_term(result):
+    """Gets the term a findall result found
+
+    Args:
+        result (str | tuple): a findall result: the match, or the groups of a pattern with several
+
+    Returns:
+        str: the match, or the first group that matched
+    """
+    if isinstance(result, str):
+        return result
+
+    return [item for item in result if item != ''][0]
+
+
+def get_category_mask(categories):
+    """Combines the bits of categories into one mask
+
+    Args:
+        categories ([str]): category names
+
+    Returns:
+        int: the mask, 0 for no categories
+    """
+    mask = 0
+
+    for category in categories:
+        mask |= CATEGORY_BITS[category]
+
+    return mask
+
+
+def get_mask_array(length=0):
+    """Makes an array of category masks, one per post, all 0
+
+    Args:
+        length (int, optional): how many posts. Defaults to 0.
+
+    Returns:
+        array: the smallest unsigned array that holds every category's bit
+    """
+    typecode = "B" if len(CATEGORY_BITS) <= 8 else "L"
+
+    return array(typecode, bytes(length * array(typecode).itemsize))
+
+
+def sort_frequencies(freq_dict):
+    """Sorts a frequency dictionary from most to least frequent
+
+    Args:
+        freq_dict (dict): term to count
+
+    Returns:
+        dict: the same terms, ordered by count (ties keep their first-seen order)
+    """
+    return dict(sorted(freq_dict.items(), key=lambda item:item[1], reverse=True))
+
+
+def get_searches(scanners):
+    """Counts the pattern searches of the scanners of several categories
+
+    Args:
+        scanners (dict): the CategoryScanner of each category. Categories scanned together share one.
+
+    Returns:
+        int: how many times their patterns were run, counting each scanner once
+    """
+    return sum({id(scanner): scanner.searches for scanner in scanners.values()}.values())
+
+
+class CategoryScanner:
+    """
+    Reads each message once and runs every category pattern over it, collecting
+    the term frequencies and the matching rows of every category in the same pass.
+
+    Attributes:
+        categories (list): The category names being scanned.
+        patterns (dict): Compiled pattern (or finder, see compile_category) for each category.
+        prefilters (dict): The LiteralPrefilter of each category that has one (see src.prefilter).
+        frequencies (dict): Term frequencies for each category, in first-seen order.
+        rows (dict): Matching rows for each category, in scan order (empty unless keep_rows is set).
+        rowids (dict): Rowids of the matching rows for each category, in scan order.
+        rows_scanned (int): How many rows have been scanned.
+        searches (int): How many times a category pattern was run over a message.
+    """
+
+    def __init__(self, categories=None, keep_rows=True, text_index=TEXT_INDEX, rowid_index=ROWID_INDEX):
+        """
+        Initializes the scanner.
+
+        Args:
+            categories ([str], optional): Categories to scan. Defaults to every category in CATEGORY_PATTERNS.
+            keep_rows (bool, optional): Keep the matching rows as well as the frequencies. Defaults to True.
+            text_index (int, optional): Position of the message in a row. Defaults to 3.
+            rowid_index (int, optional): Position of the rowid in a row. Defaults to ROWID_INDEX.
+        """
+        self.categories = list(categories) if categories else list(CATEGORY_PATTERNS)
+        self.keep_rows = keep_rows
+        self.text_index = text_index
+        self.rowid_index = rowid_index
+        self.patterns = {}
+        self.prefilters = {}
+
+        for category in self.categories:
+            pattern, flags = CATEGORY_PATTERNS[category]
+            self.patterns[category] = compile_category(category)
+            prefilter = get_prefilter(pattern, flags)
+            if prefilter is not None:
+                self.prefilters[category] = prefilter
+
+        self.frequencies = {category: {} for category in self.categories}
+        self.rows = {category: [] for category in self.categories}
+        self.rowids = {category: [] for category in self.categories}
+        self.rows_scanned = 0
+        self.searches = 0
+
+    def scan_row(self, row):
+        """
+        Runs every category pattern over a single row.
+
+        Args:
+            row (tuple): a row from the database
+        """
+        self.scan_text(row[self.text_index], row[self.rowid_index], row)
+
+    def scan_text(self, text, rowid, row=None):
+        """
+        Runs every category pattern over a single message.
+
+        Args:
+            text (str): the message
+            rowid (int): the rowid of its row
+            row (tuple, optional): the row, kept for each matching category if keep_rows is set. Defaults to None.
+        """
+        message = text.strip()
+        self.rows_scanned += 1
+        candidates = self.get_candidates(message)
+
+        for category, pattern in self.patterns.items():
+            if category not in candidates:
+                continue
+
+            self.searches += 1
+            search_results = pattern.findall(message)
+
+            if not search_results:
+                continue
+
+            if self.keep_rows:
+                self.rows[category].append(row)
+
+            self.rowids[category].append(rowid)
+
+            for result in search_results:
+                self.count_term(category, get_term(result).lower().strip())
+
+    def count_term(self, category, term):
+        """
+        Counts one occurrence of a category's term. Override this to count terms another way.
+
+        Args:
+            category (str): the category name
+            term (str): the term, lowercased
+        """
+        freq_dict = self.frequencies[category]
+        freq_dict[term] = freq_dict.get(term, 0) + 1
+
+    def get_candidates(self, message):
+        """
+        Finds the categories whose pattern could match a message. The message is folded
+        once for every prefilter, and a category without one is always a candidate.
+
+        Args:
+            message (str): the message
+
+        Returns:
+            [str]: the candidate categories
+        """
+        folded = None
+        candidates = []
+
+        for category in self.categories:
+            prefilter = self.prefilters.get(category)
+
+            if prefilter is not None:
+                if not prefilter.ignore_case:
+                    prepared = message
+                else:
+                    if folded is None:
+                        folded = fold_case(message)
+                    prepared = folded
+
+                if not prefilter.contains_literal(prepared):
+                    continue
+
+            candidates.append(category)
+
+        return candidates
+
+    def scan(self, rows):
+        """
+        Scans every row.
+
+        Args:
+            rows (iterable): rows from the database
+
+        Returns:
+            CategoryScanner: the scanner, so calls can be chained
+        """
+        for row in rows:
+            self.scan_row(row)
+
+        return self
+
+    def scan_columns(self, texts, rowids):
+        """
+        Scans messages given as a column, without building a row for each. The matching
+        rowids are kept, but not the rows.
+
+        Args:
+            texts (iterable): the message of each row
+            rowids (iterable): the rowid of each row, in the same order
+
+        Returns:
+            CategoryScanner: the scanner, so calls can be chained
+        """
+        for text, rowid in zip(texts, rowids):
+            self.scan_text(text, rowid)
+
+        return self
+
+    def merge(self, other):
+        """
+        Adds the results of a scanner that scanned the rows after this one's.
+
+        Args:
+            other (CategoryScanner): a scanner for the same categories
+
+        Returns:
+            CategoryScanner: the scanner, so calls can be chained
+        """
+        for category in self.categories:
+            freq_dict = self.frequencies[category]
+
+            for term, count in other.frequencies[category].items():
+                freq_dict[term] = freq_dict.get(term, 0) + count
+
+            self.rows[category].extend(other.rows[category])
+            self.rowids[category].extend(other.rowids[category])
+
+        self.rows_scanned += other.rows_scanned
+        self.searches += other.searches
+
+        return self
+
+    def get_frequencies(self, category):
+        """
+        Gets the term frequencies for a category, most frequent first.
+
+        Args:
+            category (str): the category name
+
+        Returns:
+            dict: A dictionary mapping each term (str) to its occurrence count (int).
+        """
+        return sort_frequencies(self.frequencies[category])
+
+    def get_rows(self, category):
+        """
+        Gets the rows that matched a category.
+
+        Args:
+            category (str): the category name
+
+        Returns:
+            list: Rows where the category is present in the message.
+        """
+        return self.rows[category]
+
+    def to_dict(self, category):
+        """
+        Gets the results of a category in a form that can be stored as JSON.
+
+        Args:
+            category (str): the category name
+
+        Returns:
+            dict: the frequencies, matching rowids and how many rows were scanned
+        """
+        return {
+            "frequencies": self.frequencies[category],
+            "rowids": self.rowids[category],
+            "rows_scanned": self.rows_scanned,
+        }
+
+    @classmethod
+    def from_dict(cls, category, data, rows=None):
+        """
+        Rebuilds a scanner for one category from stored results.
+
+        Args:
+            category (str): the category name
+            data (dict): results from to_dict
+            rows (list, optional): the matching rows, in rowid order. Leave out to not keep rows.
+
+        Returns:
+            CategoryScanner: a scanner holding the stored results
+        """
+        scanner = cls([category], keep_rows=rows is not None)
+        scanner.frequencies[category] = dict(data["frequencies"])
+        scanner.rowids[category] = list(data["rowids"])
+        scanner.rows[category] = list(rows or [])
+        scanner.rows_scanned = data["rows_scanned"]
+
+        return scanner
@@ -0,0 +1,235 @@
+import datetime
+import os
+import sqlite3
+
+from src.cache import get_pattern_hash
+from src.constants import CACHE_DIRECTORY
+from src.database import get_database_file
+from src.incremental import count_rows_up_to, get_high_water_mark
+from src.rows import DATE_INDEX, get_rows_query
+from src.scanner import TEXT_INDEX, compile_category
+from src.snapshot import EPOCH, parse_timestamp
+
+SERIES_FILE = f"{CACHE_DIRECTORY}/series.sqlite"
+
+MICROSECONDS_PER_HOUR = 3_600_000_000
+
+# how many hours each bucket spans, and how far the hours are shifted so a bucket starts
+# on a boundary. Hour 0 of the epoch is a Thursday, so weeks are shifted 72 hours to start on Monday
+BUCKETS = {
+    "hour": (1, 0),
+    "day": (24, 0),
+    "week": (168, 72),
+}
+
+# the category the pronoun's post counts are stored under
+POSTS = ""
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS hourly_counts (
+        database TEXT, pronoun TEXT, category TEXT, hour INTEGER, posts INTEGER, occurrences INTEGER,
+        PRIMARY KEY (database, pronoun, category, hour)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS series_state (
+        database TEXT, pronoun TEXT, category TEXT, pattern_hash TEXT, high_water INTEGER, row_count INTEGER,
+        PRIMARY KEY (database, pronoun, category)
+    )""",
+]
+
+
+def get_hour(date_string):
+    """Gets the hour since the epoch a post was made in
+
+    Args:
+        date_string (str): the post's date
+
+    Returns:
+        int: the hour, or None if the date can't be parsed
+    """
+    timestamp = parse_timestamp(date_string)
+
+    return None if timestamp is None else timestamp // MICROSECONDS_PER_HOUR
+
+
+def format_hour(hour):
+    """Writes the start of an hour since the epoch as an ISO 8601 date
+
+    Args:
+        hour (int): hours since the epoch
+
+    Returns:
+        str: e.g. 2024-11-01T13:00:00Z
+    """
+    date = EPOCH + datetime.timedelta(hours=hour)
+
+    return date.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class SeriesStore:
+    """
+    Hourly counts of each pronoun's posts, and of the posts that match each category, kept
+    in a SQLite file of their own. Days and weeks are summed from the hours with GROUP BY,
+    so a series over months is read from a few thousand rows instead of the posts.
+
+    Like IncrementalStore, the counts remember the highest rowid they've read and only read
+    posts appended after it. If the posts up to it have changed, or a category's pattern
+    has, that pronoun and category are counted again from the start.
+
+    Attributes:
+        series_file (str): The SQLite file the counts are kept in.
+        connection (sqlite3.Connection): Connection to it.
+    """
+
+    def __init__(self, series_file=SERIES_FILE):
+        """
+        Opens the store, creating it if needed.
+
+        Args:
+            series_file (str, optional): The SQLite file to keep the counts in. Defaults to SERIES_FILE.
+        """
+        os.makedirs(os.path.dirname(series_file) or ".", exist_ok=True)
+        self.series_file = series_file
+        self.connection = sqlite3.connect(series_file)
+
+        for statement in SCHEMA:
+            self.connection.execute(statement)
+
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def get_mark(self, database, connection, pronoun, category):
+        """
+        Gets the rowid a pronoun and category have been counted up to, clearing the counts if they're out of date.
+
+        Args:
+            database (str): the database's file
+            connection (Connection): connection to the database
+            pronoun (str): the pronoun
+            category (str): the category name, or POSTS
+
+        Returns:
+            (int, int): the highest rowid counted, and how many of the pronoun's posts that covers
+        """
+        pattern_hash = get_pattern_hash(category) if category != POSTS else ""
+        state = self.connection.execute(
+            "SELECT pattern_hash, high_water, row_count FROM series_state WHERE database=? AND pronoun=? AND category=?",
+            (database, pronoun, category),
+        ).fetchone()
+
+        if state and state[0] == pattern_hash and count_rows_up_to(connection, pronoun, state[1]) == state[2]:
+            return state[1], state[2]
+
+        key = (database, pronoun, category)
+        self.connection.execute("DELETE FROM hourly_counts WHERE database=? AND pronoun=? AND category=?", key)
+        self.connection.execute("DELETE FROM series_state WHERE database=? AND pronoun=? AND category=?", key)
+
+        return 0, 0
+
+    def update(self, connection, pronoun, categories=()):
+        """
+        Counts the posts appended since the last update: every post of the pronoun, and the
+        posts that match each category.
+
+        Args:
+            connection (Connection): connection to the database
+            pronoun (str): the pronoun
+            categories ([str], optional): the categories to count. Defaults to none, for only the post counts.
+
+        Returns:
+            int: how many posts were read
+        """
+        database = os.path.abspath(get_database_file(connection))
+        high_water = get_high_water_mark(connection)
+        names = [POSTS, *categories]
+        marks = {name: self.get_mark(database, connection, pronoun, name) for name in names}
+        patterns = {category: compile_category(category) for category in categories}
+        start = min(mark for mark, _ in marks.values())
+
+        counts = {name: {} for name in names}
+        new_rows = dict.fromkeys(names, 0)
+        cursor = connection.execute(get_rows_query(connection, rowid_range=True), (pronoun, start + 1, high_water))
+        read = 0
+
+        for row in cursor:
+            read += 1
+            rowid = row[-1]
+            hour = get_hour(row[DATE_INDEX])
+            text = row[TEXT_INDEX]
+
+            for name in names:
+                if rowid <= marks[name][0]:
+                    continue
+
+                new_rows[name] += 1
+                if hour is None:
+                    continue
+
+                occurrences = 1
+                if name != POSTS:
+                    # the same text the scanner searches, so the counts agree with the reports
+                    occurrences = len(patterns[name].findall(text.strip())) if text else 0
+                    if not occurrences:
+                        continue
+
+                bucket = counts[name].setdefault(hour, [0, 0])
+                bucket[0] += 1
+                bucket[1] += occurrences
+
+        cursor.close()
+
+        for name in names:
+            self.connection.executemany(
+                "INSERT INTO hourly_counts (database, pronoun, category, hour, posts, occurrences) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT DO UPDATE SET posts = posts + excluded.posts, occurrences = occurrences + excluded.occurrences",
+                [(database, pronoun, name, hour, posts, occurrences) for hour, (posts, occurrences) in counts[name].items()],
+            )
+            self.connection.execute(
+                "INSERT OR REPLACE INTO series_state (database, pronoun, category, pattern_hash, high_water, row_count) VALUES (?, ?, ?, ?, ?, ?)",
+                (database, pronoun, name, get_pattern_hash(name) if name != POSTS else "", high_water, marks[name][1] + new_rows[name]),
+            )
+
+        self.connection.commit()
+
+        return read
+
+    def get_series(self, connection, pronoun, category=POSTS, bucket="day", since=None, until=None):
+        """
+        Sums the hourly counts of a pronoun into buckets.
+
+        Args:
+            connection (Connection): connection to the database the counts were read from
+            pronoun (str): the pronoun
+            category (str, optional): the category name. Defaults to POSTS, for only the post counts.
+            bucket (str, optional): hour, day or week. Defaults to "day".
+            since (str, optional): only buckets from this date on (see src.query.parse_date). Defaults to None.
+            until (str, optional): only buckets before this date. Defaults to None.
+
+        Returns:
+            [(str, int, int, int)]: the start of each bucket, how many posts it has, how many of them match the category,
+                and how many times the category occurs, in date order
+        """
+        database = os.path.abspath(get_database_file(connection))
+        hours, offset = BUCKETS[bucket]
+        conditions = ""
+        parameters = [offset, hours, category, category, database, pronoun, category]
+
+        for bound, operator in ((since, ">="), (until, "<")):
+            if bound is not None:
+                conditions += f" AND hour {operator} ?"
+                parameters.append(get_hour(bound))
+
+        query = (
+            "SELECT (hour + ?) / ? AS bucket, "
+            f"SUM(CASE WHEN category='{POSTS}' THEN posts ELSE 0 END), "
+            "SUM(CASE WHEN category=? THEN posts ELSE 0 END), "
+            "SUM(CASE WHEN category=? THEN occurrences ELSE 0 END) "
+            f"FROM hourly_counts WHERE database=? AND pronoun=? AND category IN ('{POSTS}', ?){conditions} "
+            "GROUP BY bucket ORDER BY bucket"
+        )
+
+        return [
+            (format_hour(index * hours - offset), posts, matching, occurrences)
+            for index, posts, matching, occurrences in self.connection.execute(query, parameters)
+        ]
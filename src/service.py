@@ -0,0 +1,412 @@
+import json
+import os
+import socketserver
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from src.database import connect_read_only, get_database_file
+from src.discourse import DiscourseTally
+from src.incremental import count_rows_up_to, get_high_water_mark
+from src.pronoun import PronounCollection
+from src.rows import ROWID_INDEX, get_rows_query
+from src.scanner import CATEGORY_BITS, CATEGORY_PATTERNS, TEXT_INDEX, CategoryScanner, get_mask_array
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_ADDRESS = f"http://{DEFAULT_HOST}:{DEFAULT_PORT}"
+
+# how many rows a /rows response holds when no limit is asked for
+DEFAULT_PAGE_SIZE = 10000
+
+UNIX_PREFIX = "unix:"
+
+
+def parse_address(address):
+    """Splits a server address into where to listen or connect
+
+    Args:
+        address (str): http://host:port, host:port, or unix:/path/to/socket
+
+    Raises:
+        ValueError: if the address has no port
+
+    Returns:
+        (str, int): the host and port, or the socket path and None
+    """
+    if address.startswith(UNIX_PREFIX):
+        return address[len(UNIX_PREFIX):], None
+
+    parts = urlsplit(address if "//" in address else f"//{address}")
+    if parts.port is None:
+        raise ValueError(f"{address} has no port")
+
+    return parts.hostname or DEFAULT_HOST, parts.port
+
+
+def get_data_version(connection):
+    """Gets a number that changes whenever another connection commits a change to the database
+
+    Args:
+        connection (Connection): connection to the database
+
+    Returns:
+        int: the data version
+    """
+    return connection.execute("PRAGMA data_version").fetchone()[0]
+
+
+class WarmPronoun:
+    """
+    A pronoun's posts held in memory with every category scanned, so frequency, row and
+    co-occurrence queries are answered without reading the database. Rows appended to
+    the database since the last query are read and scanned on their own, and their results
+    merged into what's held; if any earlier row has changed, everything is read again.
+
+    Attributes:
+        pronoun (str): The pronoun.
+        connection (sqlite3.Connection): Connection to the database.
+        collection (PronounCollection): The pronoun's rows, scans and category masks.
+        high_water (int): The highest rowid in the database when the rows were last read.
+        data_version (int): SQLite's data_version when the rows were last read, which changes whenever another connection writes.
+        tallies (dict): The DiscourseTally of each set of words asked for, by (prepositions, personal pronouns).
+    """
+
+    def __init__(self, pronoun, connection):
+        """
+        Reads and scans the pronoun's posts.
+
+        Args:
+            pronoun (str): The pronoun.
+            connection (sqlite3.Connection): Connection to the database.
+        """
+        self.pronoun = pronoun
+        self.connection = connection
+        self.load()
+
+    def load(self):
+        """
+        Reads every post of the pronoun and scans every category, dropping what was held.
+        """
+        self.data_version = get_data_version(self.connection)
+        self.high_water = get_high_water_mark(self.connection)
+        self.collection = PronounCollection(self.pronoun, self.connection)
+        self.collection.get_masks()
+        self.tallies = {}
+
+    def refresh(self):
+        """
+        Reads the posts appended since the last refresh, or everything again if earlier posts have changed.
+
+        Returns:
+            int: how many posts were read
+        """
+        data_version = get_data_version(self.connection)
+        if data_version == self.data_version:
+            return 0
+
+        self.data_version = data_version
+        high_water = get_high_water_mark(self.connection)
+        rows = self.collection.rows
+
+        if high_water < self.high_water or count_rows_up_to(self.connection, self.pronoun, self.high_water) != len(rows):
+            self.load()
+            return len(self.collection.rows)
+
+        if high_water == self.high_water:
+            return 0
+
+        query = get_rows_query(self.connection, rowid_range=True)
+        new_rows = self.connection.execute(query, (self.pronoun, self.high_water + 1, high_water)).fetchall()
+        self.high_water = high_water
+
+        if not new_rows:
+            return 0
+
+        scanner = CategoryScanner(keep_rows=False).scan(new_rows)
+
+        # categories scanned together share a scanner, which is merged once
+        for held in {id(held): held for held in self.collection.scanners.values()}.values():
+            held.merge(scanner)
+
+        masks = self.collection.masks
+        positions = {row[ROWID_INDEX]: len(rows) + position for position, row in enumerate(new_rows)}
+        masks.extend(get_mask_array(len(new_rows)))
+
+        for category, bit in CATEGORY_BITS.items():
+            for rowid in scanner.rowids[category]:
+                masks[positions[rowid]] |= bit
+
+        rows.extend(new_rows)
+
+        for tally in self.tallies.values():
+            tally.tally(row[TEXT_INDEX] for row in new_rows)
+
+        return len(new_rows)
+
+    def get_rows(self, categories=(), without=()):
+        """
+        Gets the pronoun's rows that match every one of some categories and none of others, in row order.
+
+        Args:
+            categories ([str], optional): categories a row must match all of. Defaults to none, for every row.
+            without ([str], optional): categories a row must match none of. Defaults to none.
+
+        Returns:
+            list: the rows
+        """
+        if not categories and not without:
+            return self.collection.rows
+
+        return self.collection.get_rows_with(categories, without)
+
+    def get_tally(self, prepositions, personal_pronouns):
+        """
+        Gets the pronoun's discourse tally, tallying its posts the first time a set of words is asked for.
+
+        Args:
+            prepositions ([str]): prepositions / conjunctions to look for before the pronoun
+            personal_pronouns ([str]): personal pronouns to look for
+
+        Returns:
+            DiscourseTally: the tally
+        """
+        key = (tuple(prepositions), tuple(personal_pronouns))
+
+        if key not in self.tallies:
+            tally = DiscourseTally(self.pronoun, prepositions, personal_pronouns)
+            self.tallies[key] = tally.tally(row[TEXT_INDEX] for row in self.collection.rows)
+
+        return self.tallies[key]
+
+
+class QueryService:
+    """
+    Answers queries about the pronouns of one database from WarmPronouns, loading each
+    pronoun the first time it's asked for. Every query first reads any appended posts.
+
+    Attributes:
+        database_file (str): The database.
+        connection (sqlite3.Connection): Connection to it.
+        pronouns (dict): The WarmPronoun of each pronoun loaded so far.
+        started (float): When the service started, as a Unix time.
+    """
+
+    def __init__(self, database_file, pronouns=()):
+        """
+        Opens the database and loads the pronouns.
+
+        Args:
+            database_file (str): path to the database
+            pronouns ([str], optional): pronouns to load up front. Defaults to none.
+        """
+        self.connection = connect_read_only(database_file)
+        self.database_file = os.path.realpath(get_database_file(self.connection))
+        self.pronouns = {}
+        self.started = time.time()
+
+        for pronoun in pronouns:
+            self.get_pronoun(pronoun)
+
+    def close(self):
+        self.connection.close()
+
+    def get_pronoun(self, pronoun):
+        """
+        Gets a pronoun's posts, loading them or reading the posts appended since the last query.
+
+        Args:
+            pronoun (str): the pronoun
+
+        Returns:
+            WarmPronoun: the pronoun's posts
+        """
+        warm = self.pronouns.get(pronoun)
+
+        if warm is None:
+            warm = self.pronouns[pronoun] = WarmPronoun(pronoun, self.connection)
+        else:
+            warm.refresh()
+
+        return warm
+
+    def get_status(self, query):
+        return {
+            "database": self.database_file,
+            "high_water": get_high_water_mark(self.connection),
+            "pronouns": {pronoun: len(warm.collection.rows) for pronoun, warm in self.pronouns.items()},
+            "uptime": round(time.time() - self.started, 3),
+        }
+
+    def get_counts(self, query):
+        counts = self.connection.execute("SELECT pronoun, COUNT(*) FROM post GROUP BY pronoun").fetchall()
+
+        return {"counts": dict(counts)}
+
+    def get_frequencies(self, query):
+        warm = self.get_pronoun(get_pronoun_parameter(query))
+        category = get_category_parameter(query)
+
+        return {
+            "rows": len(warm.collection.rows),
+            "frequencies": warm.collection.get_category_frequencies(category),
+        }
+
+    def get_rows(self, query):
+        warm = self.get_pronoun(get_pronoun_parameter(query))
+        rows = warm.get_rows(get_categories_parameter(query, "categories"), get_categories_parameter(query, "without"))
+        offset = int(query.get("offset", 0))
+        limit = int(query.get("limit", DEFAULT_PAGE_SIZE))
+
+        return {"total": len(rows), "rows": rows[offset:offset + limit]}
+
+    def get_cooccurrence(self, query):
+        warm = self.get_pronoun(get_pronoun_parameter(query))
+        categories = get_categories_parameter(query, "categories") or list(CATEGORY_PATTERNS)
+
+        return {"cooccurrence": warm.collection.get_cooccurrence(categories)}
+
+    def get_tally(self, query):
+        warm = self.get_pronoun(get_pronoun_parameter(query))
+        tally = warm.get_tally(get_list_parameter(query, "prepositions"), get_list_parameter(query, "personalPronouns"))
+
+        return {"tally": tally.to_dict()}
+
+    def answer(self, path, query):
+        """
+        Answers a query.
+
+        Args:
+            path (str): what's asked for: /status, /counts, /frequencies, /rows, /cooccurrence or /tally
+            query (dict): the query's parameters, each a string
+
+        Raises:
+            ValueError: if a parameter is missing or wrong
+
+        Returns:
+            dict: the answer, which can be written as JSON, or None if there's no such path
+        """
+        routes = {
+            "/status": self.get_status,
+            "/counts": self.get_counts,
+            "/frequencies": self.get_frequencies,
+            "/rows": self.get_rows,
+            "/cooccurrence": self.get_cooccurrence,
+            "/tally": self.get_tally,
+        }
+
+        route = routes.get(path)
+
+        return route(query) if route else None
+
+
+def get_pronoun_parameter(query):
+    pronoun = query.get("pronoun")
+    if not pronoun:
+        raise ValueError("A pronoun must be given")
+
+    return pronoun
+
+
+def check_category(category):
+    if category not in CATEGORY_PATTERNS:
+        raise ValueError(f"Unknown category {category}, expected one of {', '.join(CATEGORY_PATTERNS)}")
+
+
+def get_category_parameter(query):
+    category = query.get("category")
+    if category is None:
+        raise ValueError("A category must be given")
+
+    check_category(category)
+
+    return category
+
+
+def get_list_parameter(query, name):
+    value = query.get(name)
+
+    return value.split(",") if value else []
+
+
+def get_categories_parameter(query, name):
+    categories = get_list_parameter(query, name)
+
+    for category in categories:
+        check_category(category)
+
+    return categories
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """
+    Serves a QueryService over HTTP: each GET path is a query, its parameters are the URL's
+    query string, and the answer is JSON. A bad query gets a 400, an unknown path a 404.
+    """
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+
+        try:
+            start = time.perf_counter()
+            answer = self.server.service.answer(url.path, query)
+        except ValueError as error:
+            self.send_json(400, {"error": str(error)})
+            return
+
+        if answer is None:
+            self.send_json(404, {"error": f"No such query {url.path}"})
+            return
+
+        answer["seconds"] = round(time.perf_counter() - start, 6)
+        self.send_json(200, answer)
+
+    def send_json(self, status, answer):
+        body = json.dumps(answer, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # a Unix socket has no client address to log
+        if self.server.verbose:
+            print(f"{self.log_date_time_string()} {format % args}")
+
+
+class UnixHTTPServer(socketserver.UnixStreamServer):
+    """An HTTPServer that listens on a Unix socket instead of a port"""
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler expects a (host, port) client address
+        return request, ("unix", 0)
+
+
+def make_server(service, address=DEFAULT_ADDRESS, verbose=False):
+    """Makes a server that answers queries with a service
+
+    Args:
+        service (QueryService): the service
+        address (str, optional): where to listen, see parse_address. Defaults to DEFAULT_ADDRESS.
+        verbose (bool, optional): Log every request. Defaults to False.
+
+    Returns:
+        HTTPServer or UnixHTTPServer: the server, not yet serving
+    """
+    host, port = parse_address(address)
+
+    if port is None:
+        if os.path.exists(host):
+            os.remove(host)
+        server = UnixHTTPServer(host, QueryHandler)
+    else:
+        server = HTTPServer((host, port), QueryHandler)
+
+    server.service = service
+    server.verbose = verbose
+
+    return server
+
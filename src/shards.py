@@ -0,0 +1,339 @@
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from src.cache import ResultCache
+from src.constants import DEFAULT_BATCH_SIZE
+from src.database import connect_read_only
+from src.discourse import DiscourseTally
+from src.incremental import IncrementalStore, update_tally
+from src.profiler import Profiler
+from src.pronoun import PronounCollection
+from src.query import RowFilter
+from src.rows import ROWID_INDEX, RowStream, get_rows_by_rowid
+from src.scanner import CATEGORY_BITS, CATEGORY_PATTERNS, CategoryScanner, get_mask_array, get_searches
+
+
+def expand_databases(patterns):
+    """Expands database files and globs into a list of files
+
+    Args:
+        patterns ([str]): database files, or globs like shards/*.sqlite
+
+    Raises:
+        FileNotFoundError: if a glob matches nothing
+
+    Returns:
+        [str]: each file once, in the order given and sorted within each glob
+    """
+    database_files = []
+
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        if not matches:
+            raise FileNotFoundError(f"No database matches {pattern}")
+
+        for match in matches:
+            if match not in database_files:
+                database_files.append(match)
+
+    return database_files
+
+
+def get_shard_workers(database_files, workers=1):
+    """Decides how many processes to read the shards with
+
+    Args:
+        database_files ([str]): the shards
+        workers (int, optional): how many processes were asked for. Defaults to 1, for one per shard up to the CPU count.
+
+    Returns:
+        int: how many processes to use
+    """
+    if workers > 1:
+        return workers
+
+    return max(1, min(len(database_files), os.cpu_count() or 1))
+
+
+def scan_shard(database_file, pronoun, categories, row_filter=None, cache_directory=None, cache_size=None):
+    """Scans the categories of a pronoun's posts in one shard. Runs in a worker process.
+
+    Results are served from and stored in the result cache, so a shard that hasn't changed
+    since the last run isn't read again.
+
+    Args:
+        database_file (str): path to the shard
+        pronoun (str): the pronoun
+        categories ([str]): categories to scan
+        row_filter (RowFilter, optional): only scan the rows it lets through. Defaults to None.
+        cache_directory (str, optional): the result cache's directory. Defaults to None, for no cache.
+        cache_size (int, optional): how large the result cache may get, in bytes. Defaults to None.
+
+    Returns:
+        dict: the shard's row count, how many pattern searches its scan ran, the results of each category (see CategoryScanner.to_dict), and the cache's hits and misses
+    """
+    connection = connect_read_only(database_file)
+
+    try:
+        cache = ResultCache(cache_directory, cache_size) if cache_directory else None
+        collection = PronounCollection(pronoun, connection, stream=True, cache=cache, row_filter=row_filter)
+        scanners = collection.scan(categories, keep_rows=False) if categories else {}
+        rows = scanners[categories[0]].rows_scanned if categories else len(collection.rows)
+        searches = get_searches(scanners)
+        stats = cache.get_stats() if cache else {"hits": 0, "misses": 0}
+
+        return {
+            "rows": rows,
+            "searches": searches,
+            "results": {category: scanners[category].to_dict(category) for category in categories},
+            **stats,
+        }
+    finally:
+        connection.close()
+
+
+def tally_shard(database_file, pronouns, prepositions, personal_pronouns, store_directory):
+    """Tallies the discourse of every pronoun in one shard. Runs in a worker process.
+
+    Tallies are kept in an IncrementalStore, so a shard is only read past what the last run read.
+
+    Args:
+        database_file (str): path to the shard
+        pronouns ([str]): the pronouns
+        prepositions ([str]): prepositions / conjunctions to look for
+        personal_pronouns ([str]): personal pronouns to look for
+        store_directory (str): the IncrementalStore's directory
+
+    Returns:
+        dict: each pronoun's tally, as DiscourseTally.to_dict
+    """
+    connection = connect_read_only(database_file)
+
+    try:
+        store = IncrementalStore(store_directory)
+        return {
+            pronoun: update_tally(connection, pronoun, prepositions, personal_pronouns, store).to_dict()
+            for pronoun in pronouns
+        }
+    finally:
+        connection.close()
+
+
+def get_shard_pronoun_counts(connections):
+    """Counts the posts of every pronoun across the shards
+
+    Args:
+        connections ([Connection]): connection to each shard
+
+    Returns:
+        dict: pronoun to post count
+    """
+    counts = {}
+
+    for connection in connections:
+        for pronoun, count in connection.execute("SELECT pronoun, COUNT(*) FROM post GROUP BY pronoun"):
+            counts[pronoun] = counts.get(pronoun, 0) + count
+
+    return counts
+
+
+def shard_tally(database_files, pronouns, prepositions, personal_pronouns, workers=1, store=None):
+    """Tallies the discourse of several pronouns across shards, one process per shard
+
+    Args:
+        database_files ([str]): the shards
+        pronouns ([str]): the pronouns
+        prepositions ([str]): prepositions / conjunctions to look for
+        personal_pronouns ([str]): personal pronouns to look for
+        workers (int, optional): how many processes to use (see get_shard_workers). Defaults to 1.
+        store (IncrementalStore, optional): where each shard's tallies are kept between runs. Defaults to a new IncrementalStore.
+
+    Returns:
+        dict: the merged DiscourseTally of each pronoun
+    """
+    store = store or IncrementalStore()
+    tallies = {pronoun: DiscourseTally(pronoun, prepositions, personal_pronouns) for pronoun in pronouns}
+
+    with ProcessPoolExecutor(max_workers=get_shard_workers(database_files, workers)) as executor:
+        futures = [
+            executor.submit(tally_shard, database_file, pronouns, prepositions, personal_pronouns, store.directory)
+            for database_file in database_files
+        ]
+
+        # merged in shard order, whichever shard finishes first
+        for future in futures:
+            for pronoun, data in future.result().items():
+                tallies[pronoun].merge(DiscourseTally.from_dict(pronoun, prepositions, personal_pronouns, data))
+
+    return tallies
+
+
+class ShardRows:
+    """
+    A re-iterable source of a pronoun's rows across shards, read one shard after another.
+
+    Attributes:
+        streams ([RowStream]): The stream of each shard, in shard order.
+    """
+
+    def __init__(self, pronoun, connections, batch_size=DEFAULT_BATCH_SIZE, row_filter=None):
+        """
+        Initializes the streams. Nothing is read until they're iterated.
+
+        Args:
+            pronoun (str): The pronoun to filter posts by.
+            connections ([sqlite3.Connection]): Connection to each shard.
+            batch_size (int, optional): How many rows are fetched at a time. Defaults to DEFAULT_BATCH_SIZE.
+            row_filter (RowFilter, optional): Only read the rows it lets through. Defaults to None.
+        """
+        self.streams = [RowStream(pronoun, connection, batch_size, row_filter) for connection in connections]
+
+    def __iter__(self):
+        for stream in self.streams:
+            yield from stream
+
+    def __len__(self):
+        return sum(len(stream) for stream in self.streams)
+
+
+class ShardedCollection(PronounCollection):
+    """
+    A PronounCollection over several databases (shards). Each shard is scanned in a process
+    of its own into partial results, which are merged in shard order into one scanner per
+    category. Matching rows are kept as rowids per shard and fetched when they're written.
+
+    Attributes:
+        connections (dict): Connection to each shard, by file.
+        shard_rowids (dict): The matching rowids of each category, by shard file.
+    """
+
+    def __init__(self, pronoun_name, connections, batch_size=DEFAULT_BATCH_SIZE, cache=None, profiler=None, row_filter=None):
+        """
+        Initializes the collection. Rows are streamed from the shards when they're needed.
+
+        Args:
+            pronoun_name (str): The pronoun to filter posts by.
+            connections (dict): Connection to each shard, by file, in shard order.
+            batch_size (int, optional): How many rows a stream fetches at a time. Defaults to DEFAULT_BATCH_SIZE.
+            cache (ResultCache, optional): Serve each shard's results from this cache while it is unchanged. Defaults to None.
+            profiler (Profiler, optional): Record the scan here. Defaults to None.
+            row_filter (RowFilter, optional): Only read the rows it lets through. It can't have a limit or rowid bounds,
+                which would apply to each shard on its own. Defaults to None.
+
+        Raises:
+            ValueError: if the filter has a limit or rowid bounds
+        """
+        self.pronoun = pronoun_name
+        self.connections = connections
+        self.connection = next(iter(connections.values()))
+        self.scanners = {}
+        self.shard_rowids = {}
+        self.cache = cache
+        # every shard looks its own results up, so the collection doesn't
+        self.fingerprint = None
+        self.incremental = None
+        self.profiler = profiler or Profiler(enabled=False)
+        self.row_filter = row_filter or RowFilter()
+        self.masks = None
+
+        if self.row_filter.limit is not None or self.row_filter.min_rowid is not None or self.row_filter.max_rowid is not None:
+            raise ValueError("A limit or rowid bounds can't be shared between shards")
+
+        self.rows = ShardRows(pronoun_name, connections.values(), batch_size, self.row_filter)
+
+    def scan(self, categories=None, keep_rows=True, workers=1):
+        """
+        Scans every shard for every requested category that hasn't been scanned yet.
+
+        Args:
+            categories ([str], optional): Categories to scan. Defaults to every category.
+            keep_rows (bool, optional): Fetch the matching rows as well as the frequencies. Defaults to True.
+            workers (int, optional): How many processes to scan with (see get_shard_workers). Defaults to 1.
+
+        Returns:
+            dict: The merged CategoryScanner for each scanned category.
+        """
+        categories = categories or list(CATEGORY_PATTERNS)
+        missing = [category for category in categories if category not in self.scanners]
+
+        if missing:
+            self.scan_shards(missing, workers)
+
+        if keep_rows:
+            for category in categories:
+                scanner = self.scanners[category]
+                if not scanner.keep_rows:
+                    scanner.keep_rows = True
+                    scanner.rows[category] = [
+                        row
+                        for database_file, rowids in self.shard_rowids[category].items()
+                        for row in get_rows_by_rowid(self.connections[database_file], rowids)
+                    ]
+
+        return self.scanners
+
+    def get_masks(self):
+        """
+        Gets the categories each row matches as a bitmask, in row order across the shards.
+        Rowids repeat between shards, so each shard's rowids are placed on their own.
+
+        Returns:
+            array: the mask of each row (see CATEGORY_BITS)
+        """
+        if self.masks is not None:
+            return self.masks
+
+        scanners = self.scan(list(CATEGORY_PATTERNS), keep_rows=False)
+        masks = get_mask_array()
+
+        for database_file, stream in zip(self.connections, self.rows.streams):
+            positions = {row[ROWID_INDEX]: len(masks) + position for position, row in enumerate(stream)}
+            masks.extend(get_mask_array(len(positions)))
+
+            for category, bit in CATEGORY_BITS.items():
+                for rowid in self.shard_rowids[category][database_file]:
+                    masks[positions[rowid]] |= bit
+
+        self.masks = masks
+
+        return masks
+
+    def scan_shards(self, categories, workers=1):
+        """
+        Scans the shards for categories and merges their results.
+
+        Args:
+            categories ([str]): Categories to scan.
+            workers (int, optional): How many processes to scan with (see get_shard_workers). Defaults to 1.
+        """
+        database_files = list(self.connections)
+        cache_directory = self.cache.directory if self.cache else None
+        cache_size = self.cache.max_bytes if self.cache else None
+
+        with self.profiler.stage("scan shards " + "+".join(categories)) as stage:
+            with ProcessPoolExecutor(max_workers=get_shard_workers(database_files, workers)) as executor:
+                futures = [
+                    executor.submit(scan_shard, database_file, self.pronoun, categories, self.row_filter, cache_directory, cache_size)
+                    for database_file in database_files
+                ]
+                partials = [future.result() for future in futures]
+
+            stage.rows = sum(partial["rows"] for partial in partials)
+            stage.regex_searches = sum(partial["searches"] for partial in partials)
+
+        for category in categories:
+            scanner = CategoryScanner([category], keep_rows=False)
+            self.shard_rowids[category] = {}
+
+            # merged in shard order, so ties in the frequencies fall the way one database would order them
+            for database_file, partial in zip(database_files, partials):
+                shard_scanner = CategoryScanner.from_dict(category, partial["results"][category])
+                scanner.merge(shard_scanner)
+                self.shard_rowids[category][database_file] = shard_scanner.rowids[category]
+
+            self.scanners[category] = scanner
+
+        if self.cache:
+            self.cache.hits += sum(partial["hits"] for partial in partials)
+            self.cache.misses += sum(partial["misses"] for partial in partials)
@@ -0,0 +1,518 @@
+import array
+import bisect
+import datetime
+import json
+import mmap
+import os
+import sys
+
+from src.cache import get_database_fingerprint
+from src.constants import CACHE_DIRECTORY, DEFAULT_BATCH_SIZE
+from src.rows import get_row_columns, get_rows_query
+
+SNAPSHOT_DIRECTORY = f"{CACHE_DIRECTORY}/snapshots"
+SNAPSHOT_MAGIC = b"PRNSNAP1"
+SNAPSHOT_VERSION = 2
+
+# the columns a row holds, in the order of src.rows: the URI, another column (the CID),
+# the date, the message, and then the rowid
+URI_COLUMN = 0
+DATE_COLUMN = 2
+TEXT_COLUMN = 3
+
+NULL_TIMESTAMP = -2 ** 63
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def get_snapshot_file(pronoun, directory=SNAPSHOT_DIRECTORY):
+    """Gets where a pronoun's snapshot is kept
+
+    Args:
+        pronoun (str): the pronoun
+        directory (str, optional): the snapshot directory. Defaults to SNAPSHOT_DIRECTORY.
+
+    Returns:
+        str: the snapshot's path
+    """
+    return os.path.join(directory, f"{pronoun}.snapshot")
+
+
+def parse_timestamp(date_string):
+    """Parses an ISO 8601 date into microseconds since the epoch
+
+    Args:
+        date_string (str): e.g. 2024-11-01T12:30:00.000Z
+
+    Returns:
+        int: the timestamp, or None if it can't be parsed
+    """
+    try:
+        date = datetime.datetime.fromisoformat(date_string)
+    except (TypeError, ValueError):
+        return None
+
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+
+    return (date - EPOCH) // datetime.timedelta(microseconds=1)
+
+
+class StringColumnBuilder:
+    """
+    Collects strings into one UTF-8 buffer and the offset each one starts at.
+
+    Attributes:
+        offsets (array): Where each string starts, with the end of the buffer last.
+        data (bytearray): Every string, one after the other.
+        nulls (bytearray): 1 for each NULL value.
+    """
+
+    def __init__(self):
+        self.offsets = array.array("q", [0])
+        self.data = bytearray()
+        self.nulls = bytearray()
+
+    def append(self, value):
+        if value is not None and not isinstance(value, str):
+            raise ValueError(f"Snapshots only hold text columns, not {type(value).__name__}")
+
+        if value:
+            self.data += value.encode("utf-8", "surrogatepass")
+
+        self.offsets.append(len(self.data))
+        self.nulls.append(value is None)
+
+    def get_sections(self, name):
+        sections = {f"{name}.offsets": self.offsets.tobytes(), f"{name}.data": bytes(self.data)}
+
+        if any(self.nulls):
+            sections[f"{name}.nulls"] = bytes(self.nulls)
+
+        return sections
+
+
+class StringColumn:
+    """
+    A read-only view of a string column in a memory-mapped snapshot. Strings are decoded
+    from the mapping only when they're read.
+
+    Attributes:
+        offsets (memoryview): Where each string starts.
+        data (memoryview): The UTF-8 buffer.
+        nulls (memoryview): 1 for each NULL value, or None if there are none.
+    """
+
+    def __init__(self, sections, name):
+        self.offsets = sections[f"{name}.offsets"].cast("q")
+        self.data = sections[f"{name}.data"]
+        self.nulls = sections.get(f"{name}.nulls")
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if self.nulls is not None and self.nulls[index]:
+            return None
+
+        return str(self.data[self.offsets[index]:self.offsets[index + 1]], "utf-8", "surrogatepass")
+
+    def __iter__(self):
+        offsets = self.offsets
+        data = self.data
+        nulls = self.nulls or bytes(len(self))
+        start = offsets[0]
+
+        for index in range(len(self)):
+            end = offsets[index + 1]
+            yield None if nulls[index] else str(data[start:end], "utf-8", "surrogatepass")
+            start = end
+
+
+def export_snapshot(connection, pronoun, snapshot_file=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Writes a columnar snapshot of a pronoun's rows
+
+    The messages and dates are kept in UTF-8 buffers with an array of offsets, the dates
+    also as int64 microseconds since the epoch, and the URIs split into an interned prefix (the author and
+    collection) and the record key. The snapshot can be memory-mapped with Snapshot, so
+    loading it doesn't build a tuple per row.
+
+    Args:
+        connection (Connection): connection to the database
+        pronoun (str): the pronoun to export
+        snapshot_file (str, optional): where to write it. Defaults to the pronoun's file in SNAPSHOT_DIRECTORY.
+        batch_size (int, optional): how many rows to read at a time. Defaults to DEFAULT_BATCH_SIZE.
+
+    Returns:
+        int: how many rows were exported
+    """
+    snapshot_file = snapshot_file or get_snapshot_file(pronoun)
+    columns = get_row_columns(connection)
+    fingerprint = get_database_fingerprint(connection, pronoun)
+
+    rowids = array.array("q")
+    timestamps = array.array("q")
+    uri_prefix_ids = array.array("i")
+    uri_prefixes = {}
+    prefix_column = StringColumnBuilder()
+    string_columns = {index: StringColumnBuilder() for index in range(len(columns))}
+
+    cursor = connection.execute(get_rows_query(connection), (pronoun,))
+
+    while True:
+        batch = cursor.fetchmany(batch_size)
+        if not batch:
+            break
+
+        for row in batch:
+            rowids.append(row[-1])
+
+            uri = row[URI_COLUMN]
+            prefix, suffix = None, uri
+            if isinstance(uri, str) and "/" in uri:
+                prefix, _, suffix = uri.rpartition("/")
+                prefix += "/"
+
+            if prefix not in uri_prefixes:
+                uri_prefixes[prefix] = len(uri_prefixes)
+                prefix_column.append(prefix)
+
+            uri_prefix_ids.append(uri_prefixes[prefix])
+            string_columns[URI_COLUMN].append(suffix)
+
+            for index, builder in string_columns.items():
+                if index != URI_COLUMN:
+                    builder.append(row[index])
+
+            timestamp = parse_timestamp(row[DATE_COLUMN])
+            timestamps.append(NULL_TIMESTAMP if timestamp is None else timestamp)
+
+    cursor.close()
+
+    sections = {"rowids": rowids.tobytes(), "timestamps": timestamps.tobytes(), "uri.prefix_ids": uri_prefix_ids.tobytes()}
+    sections.update(prefix_column.get_sections("uri.prefixes"))
+
+    for index, builder in string_columns.items():
+        sections.update(builder.get_sections(f"column{index}"))
+
+    header = {
+        "version": SNAPSHOT_VERSION,
+        "byteorder": sys.byteorder,
+        "pronoun": pronoun,
+        "columns": columns,
+        "count": len(rowids),
+        "fingerprint": fingerprint,
+        "sections": {},
+    }
+
+    # sections start on 8 byte boundaries so they can be cast to int64 in place
+    position = 0
+    for name, data in sections.items():
+        header["sections"][name] = [position, len(data)]
+        position += len(data) + (-len(data) % 8)
+
+    header_bytes = json.dumps(header).encode("utf-8")
+    header_bytes += b" " * (-(len(SNAPSHOT_MAGIC) + 8 + len(header_bytes)) % 8)
+
+    os.makedirs(os.path.dirname(snapshot_file) or ".", exist_ok=True)
+    temporary_file = f"{snapshot_file}.tmp"
+
+    with open(temporary_file, "wb") as file:
+        file.write(SNAPSHOT_MAGIC)
+        file.write(len(header_bytes).to_bytes(8, "little"))
+        file.write(header_bytes)
+
+        for data in sections.values():
+            file.write(data)
+            file.write(b"\0" * (-len(data) % 8))
+
+    os.replace(temporary_file, snapshot_file)
+
+    return len(rowids)
+
+
+class Snapshot:
+    """
+    A memory-mapped columnar snapshot of a pronoun's rows, written by export_snapshot.
+
+    Opening one reads only its header; the columns are views of the mapping, and a row is
+    only built when it's read. It can stand in for the rows of a PronounCollection: it can
+    be iterated any number of times, indexed and measured, and each row has the same
+    columns as a row read from the database.
+
+    Attributes:
+        snapshot_file (str): The file that is mapped.
+        pronoun (str): The pronoun the rows belong to.
+        columns ([str]): The names of the columns in each row, before the rowid.
+        fingerprint (dict): The fingerprint of the database when the snapshot was written.
+        rowids (memoryview): The rowid of each row, as int64.
+        timestamps (memoryview): The date of each row in microseconds since the epoch, as int64. NULL_TIMESTAMP where there's no date.
+        texts (StringColumn): The message of each row.
+    """
+
+    def __init__(self, snapshot_file):
+        """
+        Maps a snapshot.
+
+        Args:
+            snapshot_file (str): the snapshot to open
+
+        Raises:
+            ValueError: if the file isn't a snapshot this version can read
+        """
+        self.snapshot_file = snapshot_file
+
+        with open(snapshot_file, "rb") as file:
+            self.mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        view = memoryview(self.mapping)
+        if bytes(view[:len(SNAPSHOT_MAGIC)]) != SNAPSHOT_MAGIC:
+            raise ValueError(f"{snapshot_file} is not a snapshot")
+
+        header_start = len(SNAPSHOT_MAGIC) + 8
+        header_length = int.from_bytes(view[len(SNAPSHOT_MAGIC):header_start], "little")
+        header = json.loads(bytes(view[header_start:header_start + header_length]))
+
+        if header["version"] != SNAPSHOT_VERSION or header["byteorder"] != sys.byteorder:
+            raise ValueError(f"{snapshot_file} was written by a different version or machine")
+
+        data_start = header_start + header_length
+        sections = {
+            name: view[data_start + offset:data_start + offset + length]
+            for name, (offset, length) in header["sections"].items()
+        }
+        # every view has to be released before the mapping can be closed
+        self.views = [view, *sections.values()]
+
+        self.pronoun = header["pronoun"]
+        self.columns = header["columns"]
+        self.fingerprint = header["fingerprint"]
+        self.count = header["count"]
+        self.rowids = sections["rowids"].cast("q")
+        self.timestamps = sections["timestamps"].cast("q")
+        self.uri_prefix_ids = sections["uri.prefix_ids"].cast("i")
+        self.uri_prefixes = StringColumn(sections, "uri.prefixes")
+        self.column_values = {index: StringColumn(sections, f"column{index}") for index in range(len(self.columns))}
+        self.texts = self.column_values[TEXT_COLUMN]
+        self.views += [self.rowids, self.timestamps, self.uri_prefix_ids]
+        self.views += [column.offsets for column in [self.uri_prefixes, *self.column_values.values()]]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def get_uri(self, index):
+        """
+        Gets a row's URI, joining its interned prefix back on.
+
+        Args:
+            index (int): the row's position in the snapshot
+
+        Returns:
+            str: the URI
+        """
+        prefix = self.uri_prefixes[self.uri_prefix_ids[index]]
+        suffix = self.column_values[URI_COLUMN][index]
+
+        return suffix if prefix is None else prefix + suffix
+
+    def get_value(self, column, index):
+        """
+        Gets one value of a row.
+
+        Args:
+            column (int): the column's position in a row
+            index (int): the row's position in the snapshot
+
+        Returns:
+            the value
+        """
+        if column == URI_COLUMN:
+            return self.get_uri(index)
+
+        if column == len(self.columns):
+            return self.rowids[index]
+
+        return self.column_values[column][index]
+
+    def get_column(self, column, positions=None):
+        """
+        Gets the values of one column, in row order. URIs are rebuilt in one loop over the
+        column, with each interned URI prefix decoded once.
+
+        Args:
+            column (int): the column's position in a row
+            positions (iterable, optional): the positions of the rows to read. Defaults to every row.
+
+        Returns:
+            iterable: the values
+        """
+        if positions is None:
+            if column == len(self.columns):
+                return iter(self.rowids)
+
+            if column != URI_COLUMN:
+                return iter(self.column_values[column])
+
+            positions = range(self.count)
+
+        if column == URI_COLUMN:
+            return self.get_uris(positions)
+
+        if column == len(self.columns):
+            rowids = self.rowids
+
+            return (rowids[index] for index in positions)
+
+        values = self.column_values[column]
+
+        return (values[index] for index in positions)
+
+    def get_uris(self, positions):
+        """
+        Gets the URIs of some rows, joining their interned prefixes back on.
+
+        Args:
+            positions (iterable): the positions of the rows
+
+        Yields:
+            str: each row's URI
+        """
+        prefix_ids = self.uri_prefix_ids
+        suffixes = self.column_values[URI_COLUMN]
+        prefixes = {}
+
+        for index in positions:
+            prefix_id = prefix_ids[index]
+
+            if prefix_id not in prefixes:
+                prefixes[prefix_id] = self.uri_prefixes[prefix_id]
+
+            prefix = prefixes[prefix_id]
+            suffix = suffixes[index]
+            yield suffix if prefix is None else prefix + suffix
+
+    def get_rows(self, positions):
+        """
+        Builds the rows at some positions, a column at a time.
+
+        Args:
+            positions ([int]): the positions of the rows
+
+        Returns:
+            list: the rows, in the order of the positions
+        """
+        return list(zip(*(self.get_column(column, positions) for column in range(len(self.columns) + 1))))
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+
+        if not 0 <= index < self.count:
+            raise IndexError("snapshot index out of range")
+
+        values = [self.get_uri(index)]
+
+        for column in range(1, len(self.columns)):
+            values.append(self.column_values[column][index])
+
+        values.append(self.rowids[index])
+
+        return tuple(values)
+
+    def __iter__(self):
+        return zip(*(self.get_column(column) for column in range(len(self.columns) + 1)))
+
+    def get_rows_by_rowid(self, rowids):
+        """
+        Builds the rows with some rowids, without building any other row. The rows are
+        in rowid order, as they were read from the database, so each is found by bisection.
+
+        Args:
+            rowids ([int]): the rowids
+
+        Raises:
+            KeyError: if a rowid isn't in the snapshot
+
+        Returns:
+            list: the rows, in the order of the rowids
+        """
+        positions = []
+
+        for rowid in rowids:
+            position = bisect.bisect_left(self.rowids, rowid)
+
+            if position == self.count or self.rowids[position] != rowid:
+                raise KeyError(rowid)
+
+            positions.append(position)
+
+        return self.get_rows(positions)
+
+    def select(self, *columns):
+        """
+        Iterates over some columns of every row, like `SELECT uri, indexedAt, text`. The
+        notebooks select their rows this way.
+
+        Args:
+            *columns (str): column names, or "rowid"
+
+        Returns:
+            iterable: a tuple of the chosen values for each row
+        """
+        names = [*self.columns, "rowid"]
+
+        return zip(*(self.get_column(names.index(column)) for column in columns))
+
+    def is_current(self, connection):
+        """
+        Checks whether the database is unchanged since the snapshot was written.
+
+        Args:
+            connection (Connection): connection to the database
+
+        Returns:
+            bool: True if the snapshot still holds the same rows
+        """
+        return self.fingerprint is not None and self.fingerprint == get_database_fingerprint(connection, self.pronoun)
+
+    def close(self):
+        """
+        Unmaps the snapshot. Its columns can't be read afterwards.
+        """
+        for view in reversed(self.views):
+            view.release()
+
+        self.mapping.close()
+
+
+def load_snapshot(connection, pronoun, directory=SNAPSHOT_DIRECTORY):
+    """Maps a pronoun's snapshot if it's there and the database hasn't changed since it was written
+
+    Args:
+        connection (Connection): connection to the database
+        pronoun (str): the pronoun
+        directory (str, optional): the snapshot directory. Defaults to SNAPSHOT_DIRECTORY.
+
+    Returns:
+        Snapshot: the snapshot, or None if there is no current one
+    """
+    snapshot_file = get_snapshot_file(pronoun, directory)
+
+    if not os.path.exists(snapshot_file):
+        return None
+
+    try:
+        snapshot = Snapshot(snapshot_file)
+    except ValueError:
+        return None
+
+    if not snapshot.is_current(connection):
+        snapshot.close()
+        return None
+
+    return snapshot
@@ -1,22 +1,25 @@
 import sys, re, sqlite3, os, argparse
 
 from src.constants import DEFAULT_DATABASE_FILE, OUTPUT_DIRECTORY, SOCIAL_PRONOUNS
+from src.database import connect_read_only
+from src.client import ServiceClient
+from src.collocation import DEFAULT_TOP_K, DEFAULT_WINDOW, CollocationTally
+from src.discourse import DiscourseTally, get_position_counts
+from src.fts import has_index, get_word_query, get_phrase_query, count_matches, get_unindexed_texts
+from src.incremental import IncrementalStore, update_tally
+from src.parallel import parallel_tally
+from src.profiler import Profiler, get_sidecar_file
+from src.regexp import register_regexp
+from src.scanner import CATEGORY_PATTERNS
+from src.series import BUCKETS, SeriesStore
+from src.service import DEFAULT_ADDRESS
+from src.shards import expand_databases, get_shard_pronoun_counts, shard_tally
 
 pronoun_list = SOCIAL_PRONOUNS
 personal_pronoun_list = ["I", "you", "he", "she", "we", "they"]
 preposition_and_conjunction_list = ["and", "with", "for", "to", "from", "before"]
 
 
-def regexp(expression, text, search=re.search):
-    """Provides a regex function for SQL Lite
-
-    Args:
-        expression (string): regular expression
-        text (string): text to search
-    """
-    return 1 if search(expression, text) else 0
-
-
 def get_table_columns(column_names):
     """Returns the starting part of a markdown table column
 
@@ -36,13 +39,136 @@ def get_table_columns(column_names):
     return table_headers + table_body_start
 
 
-def print_pronoun_count_summary(pronouns, connection, file):
+def get_pronoun_counts(connection):
+    """Counts the posts of every pronoun with one aggregate query
+
+    Args:
+        connection (Connection): connection to the database
+
+    Returns:
+        dict: pronoun to post count
+    """
+    cursor = connection.cursor()
+    cursor.execute("SELECT pronoun, COUNT(*) FROM post GROUP BY pronoun")
+    counts = dict(cursor.fetchall())
+    cursor.close()
+
+    return counts
+
+
+def get_discourse_tally(query_pronoun, connection, collocations=None):
+    """Tallies prepositions / conjunctions, personal pronouns and positions in one pass over the pronoun's posts
+
+    Args:
+        query_pronoun (string): pronoun
+        connection (Connection): connection to the database
+        collocations (CollocationTally, optional): also tally the pronoun's collocations in the same pass. Defaults to None.
+
+    Returns:
+        DiscourseTally: counts for every summary table of the pronoun
+    """
+    tally = DiscourseTally(query_pronoun, preposition_and_conjunction_list, personal_pronoun_list)
+    cursor = connection.cursor()
+    cursor.execute("SELECT text FROM post WHERE pronoun=?", (query_pronoun,))
+
+    if collocations is None:
+        tally.tally(text for (text,) in cursor)
+    else:
+        for (text,) in cursor:
+            tally.add(text)
+            collocations.add(text)
+
+    cursor.close()
+
+    return tally
+
+
+def get_collocation_tally(query_pronoun, connection, window=DEFAULT_WINDOW):
+    """Tallies the words around the pronoun in one pass over its posts
+
+    Args:
+        query_pronoun (string): pronoun
+        connection (Connection): connection to the database
+        window (int, optional): how many words either side of the pronoun to count. Defaults to DEFAULT_WINDOW.
+
+    Returns:
+        CollocationTally: the collocates, n-grams and word positions of the pronoun
+    """
+    tally = CollocationTally(query_pronoun, window)
+    cursor = connection.cursor()
+    cursor.execute("SELECT text FROM post WHERE pronoun=?", (query_pronoun,))
+    tally.tally(text for (text,) in cursor)
+    cursor.close()
+
+    return tally
+
+
+def get_index_tally(query_pronoun, connection, positions=True):
+    """Tallies the pronoun's discourse, counting prepositions / conjunctions and personal pronouns with the full-text index
+
+    Each word is counted with one index lookup in the posts the index can decide on its own. A
+    preposition is only counted before the pronoun in the same case, so the index's candidates
+    are checked with REGEXP (see src.regexp). The other posts, and every post for a word the index
+    can't express, are tallied with the regex as usual. The positions are counted with one
+    aggregate query, since the index can't tell where a word falls in a post.
+
+    Args:
+        query_pronoun (string): pronoun
+        connection (Connection): connection to the database, with REGEXP registered
+        positions (bool, optional): Count the positions too. Defaults to True.
+
+    Returns:
+        DiscourseTally: counts for every summary table of the pronoun
+    """
+    preposition_queries = {word: get_phrase_query(word, query_pronoun) for word in preposition_and_conjunction_list}
+    personal_pronoun_queries = {word: get_word_query(word) for word in personal_pronoun_list}
+
+    tally = DiscourseTally(query_pronoun, preposition_and_conjunction_list, personal_pronoun_list, positions=False)
+    unindexed = DiscourseTally(
+        query_pronoun,
+        [word for word, query in preposition_queries.items() if query],
+        [word for word, query in personal_pronoun_queries.items() if query],
+        positions=False,
+    )
+    unindexed.tally(get_unindexed_texts(connection, query_pronoun))
+    tally.merge(unindexed)
+
+    inexpressible = DiscourseTally(
+        query_pronoun,
+        [word for word, query in preposition_queries.items() if query is None],
+        [word for word, query in personal_pronoun_queries.items() if query is None],
+        positions=False,
+    )
+    if inexpressible.prepositions or inexpressible.personal_pronouns:
+        cursor = connection.cursor()
+        cursor.execute("SELECT text FROM post WHERE pronoun=?", (query_pronoun,))
+        tally.merge(inexpressible.tally(text for (text,) in cursor))
+        cursor.close()
+
+    for word, query in preposition_queries.items():
+        if query:
+            pattern = f"\\b({word})\\s({query_pronoun})"
+            tally.preposition_counts[word] += count_matches(connection, query_pronoun, query, "post.text REGEXP ?", (pattern,))
+
+    for word, query in personal_pronoun_queries.items():
+        # they're looked for in the lowercased text, where a word with a capital is never found
+        if query and word == word.lower():
+            tally.personal_pronoun_counts[word] += count_matches(connection, query_pronoun, query)
+
+    if positions:
+        tally.position_counts.update(get_position_counts(connection, query_pronoun))
+
+    return tally
+
+
+def print_pronoun_count_summary(pronouns, connection, file, counts=None):
     """Prints out the preposition / conjunction combinations with the pronoun
 
     Args:
         query_pronoun (string): pronoun
         connection (Connection): connection to the database
         file (TextIOWrapper): file to write to
+        counts (dict, optional): post count of each pronoun. Counted from the database if not given.
     """
     intro = "\n## Summary \n"
     table_columns = get_table_columns(["Pronoun", "Count"])
@@ -52,26 +178,22 @@ def print_pronoun_count_summary(pronouns, connection, file):
     
     print(pronouns)
     
-    for pronoun in pronouns:
-        cursor = connection.cursor()
-        query = f"SELECT * FROM post WHERE post.pronoun='{pronoun}'"
-
-        cursor.execute(query)
+    if counts is None:
+        counts = get_pronoun_counts(connection)
 
-        output = cursor.fetchall()
-        count = len(output)
-        file.write(f"| {pronoun} | {count}|\n")
-        connection.commit()
+    for pronoun in pronouns:
+        file.write(f"| {pronoun} | {counts.get(pronoun, 0)}|\n")
         
 
 
-def print_preps_and_conjunctions(query_pronoun,connection, file):
+def print_preps_and_conjunctions(query_pronoun,connection, file, tally=None):
     """Prints out the preposition / conjunction combinations with the pronoun
 
     Args:
         query_pronoun (string): pronoun
         connection (Connection): connection to the database
         file (TextIOWrapper): file to write to
+        tally (DiscourseTally, optional): counts for the pronoun. Tallied from the database if not given.
     """
     intro = f"\n### &lt;preposition|conjunction&gt; + {query_pronoun} \n"
     table_columns = get_table_columns([f"&lt;preposition / conjunction&gt; + {query_pronoun}", "Count"])
@@ -79,50 +201,43 @@ def print_preps_and_conjunctions(query_pronoun,connection, file):
     file.write(intro)
     file.write(table_columns)
 
+    if tally is None:
+        tally = get_discourse_tally(query_pronoun, connection)
     
     for word in preposition_and_conjunction_list:
-        cursor = connection.cursor()
-        query = f"SELECT * FROM post WHERE pronoun='{query_pronoun}' AND text REGEXP('\\b({word})\\s({query_pronoun})')"
-
-        cursor.execute(query)
-
-        output = cursor.fetchall()
-        file.write(f"| {word} + {query_pronoun}  | {len(output)} |\n")
+        file.write(f"| {word} + {query_pronoun}  | {tally.preposition_counts[word]} |\n")
 
-        connection.commit()
 
-
-def print_associated_pronouns(query_pronoun, connection, file):
+def print_associated_pronouns(query_pronoun, connection, file, tally=None):
     """Prints out personal pronouns in the discours with the pronoun
 
     Args:
         query_pronoun (string): pronoun
         connection (Connection): connection to the database
         file (TextIOWrapper): file to write to
+        tally (DiscourseTally, optional): counts for the pronoun. Tallied from the database if not given.
     """
     intro = "\n### Co-occuring Personal Pronouns \n"
     table_columns = get_table_columns(["Personal Pronoun", "Count"])
 
     file.write(intro)
     file.write(table_columns)
+
+    if tally is None:
+        tally = get_discourse_tally(query_pronoun, connection)
     
     for word in personal_pronoun_list:
-        cursor = connection.cursor()
-        query = f"SELECT * FROM post WHERE pronoun='{query_pronoun}' AND LOWER(text) REGEXP('\\b({word})\\b')"
-        
-        cursor.execute(query)
-        
-        output = cursor.fetchall()
-        file.write(f"| {word} | {len(output)} |\n")
-        connection.commit()
+        file.write(f"| {word} | {tally.personal_pronoun_counts[word]} |\n")
 
-def print_positions(query_pronoun, connection, file):
+def print_positions(query_pronoun, connection, file, tally=None, collocations=None):
     """Prints out the preposition / conjunction combinations with the pronoun
 
     Args:
         query_pronoun (string): pronoun
         connection (Connection): connection to the database
         file (TextIOWrapper): file to write to
+        tally (DiscourseTally, optional): counts for the pronoun. Tallied from the database if not given.
+        collocations (CollocationTally, optional): take the positions from the words of each post instead of the tally. Defaults to None.
     """
     intro = "\n### Positioning in the Discourse \n"
     table_columns = get_table_columns(["Position", "Count"])
@@ -130,33 +245,129 @@ def print_positions(query_pronoun, connection, file):
     file.write(intro)
     file.write(table_columns)
 
-    start_query = f"SELECT * FROM post WHERE pronoun='{query_pronoun}' AND LOWER(text) REGEXP('^{query_pronoun}')"
-    end_query = f"SELECT * FROM post WHERE pronoun='{query_pronoun}' AND LOWER(text) REGEXP('{query_pronoun}$')"
-    middle_query = f"SELECT * FROM post WHERE pronoun='{query_pronoun}' AND LOWER(text) REGEXP('([^^]({query_pronoun})[^$])')"
-    solo_query = f"SELECT * FROM post WHERE pronoun='{query_pronoun}' AND LOWER(text) REGEXP('^{query_pronoun}$')"
-
-    position_dict = {
-        "start": start_query,
-        "middle": middle_query,
-        "end": end_query,
-        "only": solo_query
-    }
+    if collocations is not None:
+        position_counts = collocations.position_counts
+    else:
+        if tally is None:
+            tally = get_discourse_tally(query_pronoun, connection)
+        position_counts = tally.position_counts
     
-    for position, query in position_dict.items():
-        cursor = connection.cursor()
-        cursor.execute(query)
-        output = cursor.fetchall()
-        file.write(f"| {position} | {len(output)} |\n")
-        connection.commit()
+    for position, count in position_counts.items():
+        file.write(f"| {position} | {count} |\n")
+
+def print_collocations(query_pronoun, file, collocations, top_k=DEFAULT_TOP_K):
+    """Prints out the words and n-grams most often found around the pronoun
+
+    Args:
+        query_pronoun (string): pronoun
+        file (TextIOWrapper): file to write to
+        collocations (CollocationTally): the pronoun's collocations
+        top_k (int, optional): how many of each to print. Defaults to DEFAULT_TOP_K.
+    """
+    tables = [
+        (f"Words before {query_pronoun}", "Word", "left"),
+        (f"Words after {query_pronoun}", "Word", "right"),
+        (f"Bigrams with {query_pronoun}", "Bigram", "bigrams"),
+        (f"Trigrams with {query_pronoun}", "Trigram", "trigrams"),
+    ]
+
+    for title, column, kind in tables:
+        file.write(f"\n### {title} \n")
+        file.write(get_table_columns([column, "Count"]))
+
+        # a count is only over if the sketch had to drop terms to make room
+        for term, count, error in collocations.get_top(kind, top_k):
+            file.write(f"| {term} | {count if not error else f'{count} (±{error})'} |\n")
+
+def print_bucket_table(file, title, bucket, pronouns, counts):
+    """Prints a table of a count of each pronoun in each hour, day or week
+
+    Args:
+        file (TextIOWrapper): file to write to
+        title (str): the table's heading
+        bucket (str): hour, day or week
+        pronouns ([str]): pronouns, one column each
+        counts (dict): the start of each bucket to each pronoun's count in it
+    """
+    file.write(f"\n## {title} \n")
+    file.write(get_table_columns([bucket.capitalize(), *pronouns]))
+
+    for start in sorted(counts):
+        file.write(f"| {start} | " + " | ".join(str(counts[start].get(pronoun, 0)) for pronoun in pronouns) + " |\n")
+
+    file.write("\n\n")
+
+def print_post_series(pronouns, connection, file, bucket, store, categories=()):
+    """Prints out how many posts each pronoun has in each hour, day or week, and how many of them match each category
+
+    Args:
+        pronouns ([str]): pronouns
+        connection (Connection): connection to the database
+        file (TextIOWrapper): file to write to
+        bucket (str): hour, day or week
+        store (SeriesStore): where the hourly counts are kept
+        categories ([str], optional): categories to add a table of matching posts for. Defaults to none.
+    """
+    counts = {}
+    category_counts = {category: {} for category in categories}
+
+    for pronoun in pronouns:
+        # the posts and every category are counted in one pass over the new posts
+        store.update(connection, pronoun, categories)
+        for start, posts, _, _ in store.get_series(connection, pronoun, bucket=bucket):
+            counts.setdefault(start, {})[pronoun] = posts
+
+        for category in categories:
+            for start, _, matching, _ in store.get_series(connection, pronoun, category, bucket):
+                category_counts[category].setdefault(start, {})[pronoun] = matching
+
+    print_bucket_table(file, f"Posts per {bucket}", bucket, pronouns, counts)
+
+    for category in categories:
+        print_bucket_table(file, f"Posts with {category} per {bucket}", bucket, pronouns, category_counts[category])
 
 def main(argv):
     parser = argparse.ArgumentParser();
-    parser.add_argument("-d", "--database", help="relative path to a sqlite database", default=DEFAULT_DATABASE_FILE, type=str)
+    parser.add_argument("-d", "--database", help="relative path to a sqlite database. Give several, or a glob, to summarize shards as one.", default=[DEFAULT_DATABASE_FILE], nargs="+", type=str)
     parser.add_argument("-o", "--outputFile", help="Name of the summary file", default="summary", type=str)
+    parser.add_argument("--workers", help="How many processes to tally the posts with. With several databases, defaults to one per database.", default=1, type=int)
+    parser.add_argument("--incremental", help="Keep the tallies up to date between runs, reading only posts added since the last run.", action="store_true")
+    parser.add_argument("--fts", help="Count words with the full-text index (build it with build_index.py).", action="store_true")
+    parser.add_argument("--collocations", help="Add the words, bigrams and trigrams most often found around each pronoun, and count its position among the words of each post.", action="store_true")
+    parser.add_argument("--window", help="How many words either side of the pronoun --collocations counts.", default=DEFAULT_WINDOW, type=int)
+    parser.add_argument("--topK", help="How many words and n-grams --collocations prints.", default=DEFAULT_TOP_K, type=int)
+    parser.add_argument("--series", help="Add how many posts each pronoun has in each hour, day or week. The hourly counts are kept between runs and only new posts are counted.", choices=list(BUCKETS))
+    parser.add_argument("--seriesCategories", help="Add a --series table per category of how many of each pronoun's posts match it.", nargs="+", default=[], choices=list(CATEGORY_PATTERNS))
+    parser.add_argument("--server", help=f"Ask a running serve.py for the counts and tallies instead of reading the database (default address {DEFAULT_ADDRESS}). If none is running, the database is read as usual.", nargs="?", const=DEFAULT_ADDRESS, type=str)
+    parser.add_argument("--profile", help="Time each stage and write the measurements to a .profile.json file next to the summary.", action="store_true")
     args = parser.parse_args()
     
-    database_file = args.database
+    try:
+        database_files = expand_databases(args.database)
+    except FileNotFoundError as error:
+        parser.error(str(error))
+
+    sharded = len(database_files) > 1
+    if sharded and (args.fts or args.series or args.collocations):
+        parser.error("several databases can't be combined with --fts, --series or --collocations")
+    if args.seriesCategories and not args.series:
+        parser.error("--seriesCategories needs --series")
+    if args.server and (sharded or args.incremental or args.fts or args.workers > 1):
+        parser.error("--server can't be combined with several databases, --incremental, --fts or --workers")
+
+    client = None
+    if args.server:
+        client = ServiceClient(args.server)
+        status = client.get_status()
+        if status is None:
+            print(f"No server at {args.server}, reading the database")
+            client = None
+        elif status["database"] != os.path.realpath(database_files[0]):
+            parser.error(f"the server at {args.server} serves {status['database']}")
+
+    database_file = database_files[0]
     output_file = f"{OUTPUT_DIRECTORY}/{args.outputFile}.md"
+    profiler = Profiler(enabled=args.profile)
     
     if  not os.path.exists(OUTPUT_DIRECTORY):
         os.makedirs(OUTPUT_DIRECTORY)
@@ -165,18 +376,83 @@ def main(argv):
 
         
         with open(output_file, 'w', encoding="utf-8") as file:
+            sqlite_connection = None
             try:
-                sqlite_connection = sqlite3.connect(database_file)
-                sqlite_connection.create_function('regexp', 2, regexp)
+                sqlite_connection = connect_read_only(database_file)
                 
-                print_pronoun_count_summary(pronoun_list, sqlite_connection, file)
+                with profiler.stage("pronoun counts"):
+                    counts = None
+                    if client:
+                        counts = client.get_pronoun_counts()
+                    elif sharded:
+                        shard_connections = [connect_read_only(shard_file) for shard_file in database_files[1:]]
+                        counts = get_shard_pronoun_counts([sqlite_connection, *shard_connections])
+                        for shard_connection in shard_connections:
+                            shard_connection.close()
+
+                    print_pronoun_count_summary(pronoun_list, sqlite_connection, file, counts)
+
+                if args.fts and not has_index(sqlite_connection):
+                    print("No current full-text index found, counting with regular expressions. Run build_index.py to build it.")
+
+                tallies = {}
+                if client:
+                    with profiler.stage("server tally"):
+                        tallies = {
+                            pronoun: client.get_tally(pronoun, preposition_and_conjunction_list, personal_pronoun_list)
+                            for pronoun in pronoun_list
+                        }
+                elif sharded:
+                    # each shard's tallies are kept incrementally, so unchanged shards aren't read again
+                    with profiler.stage("shard tally") as stage:
+                        tallies = shard_tally(database_files, pronoun_list, preposition_and_conjunction_list, personal_pronoun_list, args.workers)
+                        stage.rows = sum(tally.total for tally in tallies.values())
+                elif args.incremental:
+                    with profiler.stage("incremental tally") as stage:
+                        store = IncrementalStore()
+                        tallies = {
+                            pronoun: update_tally(sqlite_connection, pronoun, preposition_and_conjunction_list, personal_pronoun_list, store)
+                            for pronoun in pronoun_list
+                        }
+                        stage.rows = sum(tally.total for tally in tallies.values())
+                elif args.fts and has_index(sqlite_connection):
+                    with profiler.stage("index tally") as stage:
+                        register_regexp(sqlite_connection)
+                        # with --collocations the positions come from the collocation pass
+                        tallies = {pronoun: get_index_tally(pronoun, sqlite_connection, positions=not args.collocations) for pronoun in pronoun_list}
+                        stage.rows = sum(tally.total for tally in tallies.values())
+                elif args.workers > 1:
+                    with profiler.stage("parallel tally") as stage:
+                        tallies = parallel_tally(database_file, pronoun_list, preposition_and_conjunction_list, personal_pronoun_list, args.workers)
+                        stage.rows = sum(tally.total for tally in tallies.values())
                 
                 for pronoun in pronoun_list:
                     file.write(f"## {pronoun.capitalize()}\n")
-                    print_preps_and_conjunctions( pronoun, sqlite_connection,file)
-                    print_positions(pronoun, sqlite_connection, file )
-                    print_associated_pronouns( pronoun, sqlite_connection, file)
-                    file.write("\n\n")
+                    tally = tallies.get(pronoun)
+                    collocations = CollocationTally(pronoun, args.window) if args.collocations else None
+                    if tally is None:
+                        # the collocations are tallied in the same pass as the rest
+                        with profiler.stage(f"tally {pronoun}") as stage:
+                            tally = get_discourse_tally(pronoun, sqlite_connection, collocations)
+                            stage.rows = tally.total
+                    elif collocations:
+                        with profiler.stage(f"collocations {pronoun}") as stage:
+                            collocations = get_collocation_tally(pronoun, sqlite_connection, args.window)
+                            stage.rows = collocations.total
+
+                    with profiler.stage(f"render {pronoun}"):
+                        print_preps_and_conjunctions( pronoun, sqlite_connection,file, tally)
+                        print_positions(pronoun, sqlite_connection, file, tally, collocations)
+                        print_associated_pronouns( pronoun, sqlite_connection, file, tally)
+                        if collocations:
+                            print_collocations(pronoun, file, collocations, args.topK)
+                        file.write("\n\n")
+
+                if args.series:
+                    with profiler.stage(f"{args.series} series"):
+                        store = SeriesStore()
+                        print_post_series(pronoun_list, sqlite_connection, file, args.series, store, args.seriesCategories)
+                        store.close()
 
                 sqlite_connection.close()
 
@@ -187,6 +463,11 @@ def main(argv):
                 if sqlite_connection:
                     sqlite_connection.close()
                     print('SQLite Connection closed')
+
+        if args.profile:
+            profile_file = get_sidecar_file(output_file)
+            profiler.write(profile_file, command="summarize", arguments=vars(args), output_file=output_file)
+            print(f"Profile written to {profile_file}")
     except Exception as main_error:
         print("Kinda all the way failed")
         print(main_error)
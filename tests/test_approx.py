@@ -0,0 +1,106 @@
+import sqlite3
+
+import pytest
+
+from benchmarks.generate import generate
+from src.approx import HyperLogLog, SpaceSaving, allocate_sample, count_distinct_authors, get_did, sample_rows
+from src.database import connect_read_only
+
+
+@pytest.fixture(scope="module")
+def database_file(tmp_path_factory):
+    database_file = str(tmp_path_factory.mktemp("approx") / "posts.sqlite")
+    generate(database_file, 6000, seed=8)
+
+    # a gap in the rowids, as deleted posts leave
+    connection = sqlite3.connect(database_file)
+    connection.execute("DELETE FROM post WHERE rowid BETWEEN 2000 AND 3000")
+    connection.commit()
+    connection.close()
+
+    return database_file
+
+
+@pytest.fixture
+def connection(database_file):
+    connection = connect_read_only(database_file)
+    yield connection
+    connection.close()
+
+
+@pytest.mark.parametrize("counts, sample_size", [
+    ([10, 10, 10], 10),
+    ([1, 2, 3, 4, 5, 6, 7], 20),
+    ([0, 500, 1, 0, 333], 97),
+    ([5, 5], 10),
+])
+def test_allocation_adds_up_to_sample_size(counts, sample_size):
+    sizes = allocate_sample(counts, sample_size)
+
+    assert sum(sizes) == sample_size
+    assert all(0 <= size <= count for size, count in zip(sizes, counts))
+
+
+@pytest.mark.parametrize("sample_size", [1, 7, 150, 999])
+def test_sample_is_sample_size_of_distinct_posts(connection, sample_size):
+    rows, population = sample_rows(connection, "bro", sample_size, seed=sample_size)
+    all_rows = connection.execute("SELECT uri, cid, indexedAt, text, rowid FROM post WHERE pronoun='bro'").fetchall()
+
+    assert population == len(all_rows)
+    assert len(rows) == sample_size
+    assert len({row[-1] for row in rows}) == sample_size
+    assert set(rows) <= set(all_rows)
+    assert [row[-1] for row in rows] == sorted(row[-1] for row in rows)
+
+
+def test_sample_of_whole_pronoun_is_every_post(connection):
+    rows, population = sample_rows(connection, "bro", 10 ** 6)
+
+    assert len(rows) == population
+
+
+def test_sample_is_repeatable(connection):
+    assert sample_rows(connection, "bro", 200, seed=1) == sample_rows(connection, "bro", 200, seed=1)
+
+
+@pytest.mark.parametrize("precision", [10, 14])
+def test_distinct_authors_within_error(connection, precision):
+    rows = connection.execute("SELECT uri FROM post").fetchall()
+    authors = count_distinct_authors(rows, precision)
+    exact = len({get_did(uri) for (uri,) in rows})
+
+    assert abs(authors.get_estimate() - exact) <= exact * authors.get_error()
+
+
+def test_merged_distinct_authors_same_as_one_pass():
+    values = [f"did:plc:{index}" for index in range(20000)]
+    whole, first, second = HyperLogLog(12), HyperLogLog(12), HyperLogLog(12)
+
+    for value in values:
+        whole.add(value)
+    for value in values[:12000]:
+        first.add(value)
+    for value in values[8000:]:
+        second.add(value)
+
+    assert first.merge(second).registers == whole.registers
+    assert abs(whole.get_estimate() - len(values)) <= len(values) * whole.get_error()
+
+
+def test_space_saving_counts_within_error(connection):
+    terms = [word.lower() for (text,) in connection.execute("SELECT text FROM post") for word in text.split()]
+    exact = {}
+    for term in terms:
+        exact[term] = exact.get(term, 0) + 1
+
+    sketch = SpaceSaving(50)
+    for term in terms:
+        sketch.add(term)
+
+    assert sketch.total == len(terms)
+    for term, count, error in sketch.get_top():
+        assert exact[term] <= count <= exact[term] + error
+
+    # any term that makes up more than 1 / capacity of the stream is kept
+    kept = {term for term, _, _ in sketch.get_top()}
+    assert {term for term, count in exact.items() if count > len(terms) / 50} <= kept
@@ -0,0 +1,103 @@
+import sqlite3
+
+import pytest
+
+import src.cache
+from benchmarks.generate import generate
+from src.cache import ResultCache, get_database_fingerprint
+from src.database import connect_read_only
+from src.pronoun import PronounCollection
+from src.query import RowFilter
+
+CATEGORIES = ["profanity", "negation"]
+
+
+@pytest.fixture
+def database_file(tmp_path):
+    database_file = str(tmp_path / "posts.sqlite")
+    generate(database_file, 1000, seed=4)
+
+    return database_file
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResultCache(str(tmp_path / "results"))
+
+
+def scan(database_file, cache, pronoun="bro", row_filter=None):
+    """Scans like one analyse.py run: a new connection and collection, then the categories"""
+    connection = connect_read_only(database_file)
+    scanners = PronounCollection(pronoun, connection, cache=cache, row_filter=row_filter).scan(CATEGORIES)
+    results = {category: (scanner.get_frequencies(category), scanner.get_rows(category)) for category, scanner in scanners.items()}
+    connection.close()
+
+    return results
+
+
+def test_unchanged_database_is_served_from_cache(database_file, cache):
+    first = scan(database_file, cache)
+    hits = cache.hits
+
+    assert scan(database_file, cache) == first
+    assert cache.hits == hits + len(CATEGORIES)
+
+
+STATEMENTS = [
+    "INSERT INTO post VALUES ('at://did:plc:cache/app.bsky.feed.post/new', 'cid', '2024-11-01T00:00:00.000Z', 'fuck no bro', 'bro')",
+    "UPDATE post SET text='fuck no bro' WHERE rowid=(SELECT MAX(rowid) FROM post WHERE pronoun='bro')",
+    "DELETE FROM post WHERE rowid=(SELECT MAX(rowid) FROM post WHERE pronoun='bro')",
+]
+
+
+@pytest.mark.parametrize("statement", STATEMENTS)
+def test_write_invalidates(database_file, cache, statement):
+    scan(database_file, cache)
+    writer = sqlite3.connect(database_file)
+    writer.execute(statement)
+    writer.commit()
+    writer.close()
+    misses = cache.misses
+
+    assert scan(database_file, cache) == scan(database_file, None)
+    assert cache.misses == misses + len(CATEGORIES)
+
+
+@pytest.mark.parametrize("statement", STATEMENTS)
+def test_write_in_wal_mode_invalidates(database_file, cache, statement):
+    writer = sqlite3.connect(database_file)
+    writer.execute("PRAGMA journal_mode=WAL")
+    writer.execute("PRAGMA wal_autocheckpoint=0")
+    scan(database_file, cache)
+
+    # the write stays in the -wal file, so the main file's size and modification time don't change
+    writer.execute(statement)
+    writer.commit()
+    misses = cache.misses
+    cached = scan(database_file, cache)
+
+    assert cache.misses == misses + len(CATEGORIES)
+    assert cached == scan(database_file, None)
+
+    writer.close()
+
+
+def test_changed_pattern_invalidates(database_file, cache, monkeypatch):
+    scan(database_file, cache)
+    pattern, flags = src.cache.CATEGORY_PATTERNS["negation"]
+    monkeypatch.setitem(src.cache.CATEGORY_PATTERNS, "negation", (pattern.replace("uh", "ope"), flags))
+    misses = cache.misses
+
+    scan(database_file, cache)
+
+    # only the changed category is scanned again
+    assert cache.misses == misses + 1
+
+
+def test_filtered_results_are_cached_apart(database_file, cache):
+    unfiltered = scan(database_file, cache)
+    row_filter = RowFilter(since="2024-06-01")
+    filtered = scan(database_file, cache, row_filter=row_filter)
+
+    assert filtered == scan(database_file, None, row_filter=row_filter)
+    assert scan(database_file, cache) == unfiltered
@@ -0,0 +1,101 @@
+import sqlite3
+
+import pytest
+
+import summarize
+from benchmarks.generate import generate
+from src.database import connect_read_only
+from src.discourse import DiscourseTally, get_position_counts
+from src.fts import FTS_TABLE, build_index, has_fts5, has_index
+from src.notebook_helpers import get_indexed_instance_dict, get_instance_dict
+from src.regexp import register_regexp
+
+# texts the index could count differently from the regex: case, underscores, punctuation between
+# words, combining marks, emojis newer than SQLite's Unicode tables, letters that fold to ASCII ones,
+# and the characters the position patterns treat specially
+TRICKY_TEXTS = [
+    "For bro", "for bro", "for, bro", "for\tbro", "_for bro", "for_ bro", "with bros", "with Bro", "WITH bro",
+    "and bró", "́and bro", "to bro🤣", "from 🤣bro", "before bro", "ſo bro",
+    "you🤣", "🤣you", "YOU", "You", "_you", "you_", "ſhe", "ſhe she", "Khey", "theý", "shé",
+    "théy", "they're", "we'll", "İ", "i", "I", "ı we", "İwe",
+    "bro", "BRO\n", "bro\n", "^bro", "bro$", "x^bro y", "x bro$ y", "xbro$", "Bro", "\nbro", "bro bro", "", None,
+]
+WORDS = ["you", "she", "they", "we", "i", "I", "hey"]
+
+
+def add_posts(database_file, texts, pronoun="bro"):
+    connection = sqlite3.connect(database_file)
+    start = connection.execute("SELECT MAX(rowid) FROM post").fetchone()[0] or 0
+    connection.executemany(
+        "INSERT INTO post VALUES (?, ?, ?, ?, ?)",
+        [(f"at://did:plc:test/app.bsky.feed.post/{start + index}", "cid", "2024-11-01T00:00:00.000Z", text, pronoun) for index, text in enumerate(texts)],
+    )
+    connection.commit()
+    connection.close()
+
+
+@pytest.fixture(scope="module")
+def database_file(tmp_path_factory):
+    if not has_fts5(sqlite3.connect(":memory:")):
+        pytest.skip("SQLite was built without FTS5")
+
+    database_file = str(tmp_path_factory.mktemp("fts") / "posts.sqlite")
+    generate(database_file, 3000, seed=1)
+    add_posts(database_file, TRICKY_TEXTS)
+
+    connection = sqlite3.connect(database_file)
+    build_index(connection)
+    connection.close()
+
+    # posts added after the index was built are counted with the regex
+    add_posts(database_file, TRICKY_TEXTS[::-1])
+
+    return database_file
+
+
+@pytest.fixture
+def connection(database_file):
+    connection = connect_read_only(database_file)
+    register_regexp(connection)
+    yield connection
+    connection.close()
+
+
+@pytest.mark.parametrize("pronoun", ["bro", "sis"])
+def test_index_tally_same_as_regex(connection, pronoun):
+    assert has_index(connection)
+
+    indexed = summarize.get_index_tally(pronoun, connection)
+    plain = summarize.get_discourse_tally(pronoun, connection)
+
+    assert indexed.preposition_counts == plain.preposition_counts
+    assert indexed.personal_pronoun_counts == plain.personal_pronoun_counts
+    assert indexed.position_counts == plain.position_counts
+
+
+def test_position_counts_same_as_regex(connection):
+    texts = [text for (text,) in connection.execute("SELECT text FROM post WHERE pronoun='bro'")]
+
+    assert get_position_counts(connection, "bro") == DiscourseTally("bro", [], []).tally(texts).position_counts
+
+
+@pytest.mark.parametrize("words", [WORDS, WORDS + ["you"], ["she", "théy"]])
+def test_indexed_instance_dict_same_as_regex(connection, words):
+    rows = [(None, None, text) for (text,) in connection.execute("SELECT text FROM post WHERE pronoun='bro'")]
+
+    assert get_indexed_instance_dict(words, connection, "bro") == get_instance_dict(words, rows)
+
+
+def test_old_tokenizer_is_rebuilt(tmp_path):
+    database_file = str(tmp_path / "old.sqlite")
+    generate(database_file, 200, seed=2)
+
+    connection = sqlite3.connect(database_file)
+    connection.execute(f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(text, content='post', content_rowid='rowid')")
+    connection.execute("CREATE TABLE post_fts_meta (key TEXT PRIMARY KEY, value INTEGER)")
+
+    assert not has_index(connection)
+    assert build_index(connection) == 200
+    assert has_index(connection)
+
+    connection.close()
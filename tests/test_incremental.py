@@ -0,0 +1,140 @@
+import sqlite3
+
+import pytest
+
+import src.incremental
+import summarize
+from benchmarks.generate import generate
+from src.database import connect_read_only
+from src.incremental import IncrementalStore, update_scanners, update_tally
+from src.scanner import CategoryScanner
+
+CATEGORIES = ["profanity", "negation", "emoji"]
+APPENDED_TEXTS = ["fuck no bro", "nah bro 😂", "bro", "for bro, you", ""]
+
+
+class CountingScanner(CategoryScanner):
+    """A CategoryScanner that adds up how many rows every scanner of the run reads"""
+
+    scanned = 0
+
+    def scan(self, rows):
+        scanned = self.rows_scanned
+        super().scan(rows)
+        CountingScanner.scanned += self.rows_scanned - scanned
+
+        return self
+
+
+@pytest.fixture
+def database_file(tmp_path):
+    database_file = str(tmp_path / "posts.sqlite")
+    generate(database_file, 1000, seed=5)
+
+    return database_file
+
+
+@pytest.fixture
+def store(tmp_path):
+    return IncrementalStore(str(tmp_path / "incremental"))
+
+
+@pytest.fixture
+def counting(monkeypatch):
+    monkeypatch.setattr(src.incremental, "CategoryScanner", CountingScanner)
+    CountingScanner.scanned = 0
+
+    return CountingScanner
+
+
+def write(database_file, statement, parameters=()):
+    connection = sqlite3.connect(database_file)
+    connection.executemany(statement, parameters) if parameters else connection.execute(statement)
+    connection.commit()
+    connection.close()
+
+
+def append(database_file, texts=APPENDED_TEXTS):
+    write(
+        database_file,
+        "INSERT INTO post VALUES (?, 'cid', '2024-11-01T00:00:00.000Z', ?, 'bro')",
+        [(f"at://did:plc:incremental/app.bsky.feed.post/{index}", text) for index, text in enumerate(texts)],
+    )
+
+
+def scan(database_file, store):
+    connection = connect_read_only(database_file)
+    scanners = update_scanners(connection, "bro", CATEGORIES, store)
+    results = {category: (list(scanner.get_frequencies(category).items()), scanner.get_rows(category)) for category, scanner in scanners.items()}
+    connection.close()
+
+    return results
+
+
+def scan_whole(database_file):
+    connection = connect_read_only(database_file)
+    scanner = CategoryScanner(CATEGORIES).scan(connection.execute(src.incremental.get_rows_query(connection), ("bro",)))
+    results = {category: (list(scanner.get_frequencies(category).items()), scanner.get_rows(category)) for category in CATEGORIES}
+    connection.close()
+
+    return results
+
+
+def count_bro(database_file):
+    connection = connect_read_only(database_file)
+    (count,) = connection.execute("SELECT COUNT(*) FROM post WHERE pronoun='bro'").fetchone()
+    connection.close()
+
+    return count
+
+
+def test_append_scans_only_new_posts(database_file, store, counting):
+    scan(database_file, store)
+    assert counting.scanned == count_bro(database_file)
+
+    counting.scanned = 0
+    append(database_file)
+
+    assert scan(database_file, store) == scan_whole(database_file)
+    assert counting.scanned == len(APPENDED_TEXTS)
+
+
+def test_unchanged_database_scans_nothing(database_file, store, counting):
+    expected = scan(database_file, store)
+    counting.scanned = 0
+
+    assert scan(database_file, store) == expected
+    assert counting.scanned == 0
+
+
+@pytest.mark.parametrize("statement", [
+    "DELETE FROM post WHERE rowid=(SELECT MIN(rowid) FROM post WHERE pronoun='bro')",
+    # a re-import: the oldest post is deleted and appended again with a new rowid
+    "REPLACE INTO post SELECT * FROM post WHERE rowid=(SELECT MIN(rowid) FROM post WHERE pronoun='bro')",
+])
+def test_rewrite_below_mark_recomputes(database_file, store, counting, statement):
+    scan(database_file, store)
+    write(database_file, statement)
+    counting.scanned = 0
+
+    assert scan(database_file, store) == scan_whole(database_file)
+    assert counting.scanned == count_bro(database_file)
+
+
+@pytest.mark.parametrize("change", [append, lambda database_file: write(database_file, "DELETE FROM post WHERE rowid % 7 = 0")])
+def test_tally_same_as_full_pass(database_file, store, change):
+    prepositions, personal_pronouns = summarize.preposition_and_conjunction_list, summarize.personal_pronoun_list
+    connection = connect_read_only(database_file)
+    update_tally(connection, "bro", prepositions, personal_pronouns, store)
+    connection.close()
+
+    change(database_file)
+    connection = connect_read_only(database_file)
+    tally = update_tally(connection, "bro", prepositions, personal_pronouns, store)
+    whole = summarize.get_discourse_tally("bro", connection)
+    connection.close()
+
+    assert tally.total == whole.total
+    assert tally.preposition_counts == whole.preposition_counts
+    assert tally.personal_pronoun_counts == whole.personal_pronoun_counts
+    assert tally.position_counts == whole.position_counts
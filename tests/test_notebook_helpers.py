@@ -0,0 +1,59 @@
+import pytest
+
+import src.notebook_helpers
+from src.notebook_helpers import make_link, make_links, parse_times, uriToUrl, uris_to_urls
+
+URIS = [
+    "at://did:plc:abc/app.bsky.feed.post/3kxyz",
+    "at://did:plc:abc/app.bsky.feed.like/3kxyz",
+    "https://bsky.app/profile/did:plc:abc/post/3kxyz",
+    "",
+]
+DATES = [
+    "2024-11-01T12:00:00Z",
+    "2024-11-01T12:00:00.123456Z",
+    "2024-11-01T12:00:00.123Z",
+    "2024-11-01 12:00:00",
+    "2024-11-01",
+    "",
+    None,
+]
+ODD_DATES = [["2024-11-01T12:00:00+05:00"], ["yesterday"], ["today"], ["2024-11"], [" 2024-11-01T12:00:00Z"], ["2024-13-01T00:00:00Z"], [5]]
+
+
+def test_uri_to_url():
+    assert uriToUrl(URIS[0]) == "https://bsky.app/profile/did:plc:abc/post/3kxyz"
+
+    # anything that isn't a post's at:// URI comes back as it is
+    for uri in URIS[1:]:
+        assert uriToUrl(uri) == uri
+
+
+def test_batch_links_same_as_single():
+    assert uris_to_urls(URIS) == [uriToUrl(uri) for uri in URIS]
+    assert make_links(URIS) == [make_link(uri) for uri in URIS]
+
+
+def parse_times_without_numpy(dates, monkeypatch):
+    with monkeypatch.context() as patch:
+        patch.setattr(src.notebook_helpers, "numpy", None)
+        return list(parse_times(dates))
+
+
+def test_parse_times():
+    timestamps = parse_times(DATES)
+    if src.notebook_helpers.numpy is not None:
+        timestamps = timestamps.astype("int64")
+    timestamps = list(timestamps)
+
+    assert timestamps[:5] == [1730462400000000, 1730462400123456, 1730462400123000, 1730462400000000, 1730419200000000]
+    assert timestamps[5:] == [src.notebook_helpers.NULL_TIMESTAMP] * 2
+
+
+@pytest.mark.parametrize("dates", [DATES, *ODD_DATES, [*DATES, *ODD_DATES[0]]])
+def test_numpy_parse_times_same_as_loop(dates, monkeypatch):
+    numpy = pytest.importorskip("numpy")
+    parsed = parse_times(dates)
+
+    assert parsed.dtype == numpy.dtype("datetime64[us]")
+    assert list(parsed.astype("int64")) == parse_times_without_numpy(dates, monkeypatch)
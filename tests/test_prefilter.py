@@ -0,0 +1,82 @@
+import random
+import re
+
+import pytest
+
+import src.prefilter
+from benchmarks.generate import get_rows
+from src.prefilter import get_prefilter, get_required_literals
+from src.regexes import NEGATION_REGEX, PROFANITY_REGEX
+from src.regexp import RegexpFunction
+from src.scanner import CATEGORY_PATTERNS, CategoryScanner
+
+# texts the prefilter could get wrong: letters re.IGNORECASE folds from outside ASCII, case, and no text at all
+TRICKY_TEXTS = [
+    "FUCK", "ſhit", "ſtfu", "dİck", "dıck", "KOCK", "cocK", "ASS", "nah", "NAH", "Naw", "nuh",
+    "yes", "YEAH", "yuP", "Yaſ", "ﬀuck", "straße", "İ", "", "   no   ", "nȯ", "nö",
+]
+
+
+@pytest.fixture(scope="module")
+def rows():
+    generated = [
+        (uri, cid, indexed_at, text, rowid)
+        for rowid, (uri, cid, indexed_at, text, _) in enumerate(get_rows(random.Random(0), 3000), start=1)
+    ]
+    extra = [(None, None, None, text, -index) for index, text in enumerate(TRICKY_TEXTS, start=1)]
+
+    return generated + extra
+
+
+def scan(rows, prefilters=True):
+    scanner = CategoryScanner(keep_rows=False)
+    if not prefilters:
+        scanner.prefilters = {}
+    scanner.scan(rows)
+
+    return scanner
+
+
+def test_scanner_same_with_and_without_prefilters(rows):
+    prefiltered = scan(rows)
+    plain = scan(rows, prefilters=False)
+
+    assert prefiltered.prefilters
+    assert prefiltered.frequencies == plain.frequencies
+    assert prefiltered.rowids == plain.rowids
+
+
+@pytest.mark.parametrize("category", [
+    category for category, (pattern, _) in CATEGORY_PATTERNS.items() if isinstance(pattern, str)
+])
+def test_regexp_same_as_search(rows, category):
+    pattern, flags = CATEGORY_PATTERNS[category]
+    compiled = re.compile(pattern, flags)
+    function = RegexpFunction()
+    search = function.search_ignore_case if flags & re.IGNORECASE else function
+    texts = [row[3] for row in rows] + [None]
+
+    expected = [None if text is None else int(bool(compiled.search(text))) for text in texts]
+
+    assert [search(pattern, text) for text in texts] == expected
+
+
+def test_required_literals():
+    assert get_required_literals(NEGATION_REGEX, re.IGNORECASE) == frozenset(["no", "na", "nuh"])
+    assert get_required_literals(r"(?i)FOO\w+bar") == frozenset(["foo"])
+    assert get_required_literals("a|b*") is None
+
+
+def test_no_parser_means_no_prefilter(monkeypatch, rows):
+    plain = scan(rows, prefilters=False)
+    monkeypatch.setattr(src.prefilter, "sre_parse", None)
+
+    assert get_required_literals(PROFANITY_REGEX, re.IGNORECASE) is None
+    assert get_prefilter(PROFANITY_REGEX, re.IGNORECASE) is None
+
+    # the scanner looks its prefilters up through src.scanner's get_prefilter, which reads the patched module
+    unfiltered = scan(rows)
+
+    assert unfiltered.prefilters == {}
+    assert unfiltered.frequencies == plain.frequencies
+    assert unfiltered.rowids == plain.rowids
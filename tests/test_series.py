@@ -0,0 +1,110 @@
+import sqlite3
+
+import pytest
+
+import src.cache
+from benchmarks.generate import generate
+from src.database import connect_read_only
+from src.series import POSTS, SeriesStore
+
+CATEGORIES = ["profanity", "negation", "emoji"]
+APPENDED_TEXTS = ["fuck no bro", "nah bro 😂", "bro", ""]
+
+
+@pytest.fixture
+def database_file(tmp_path):
+    database_file = str(tmp_path / "posts.sqlite")
+    generate(database_file, 1000, seed=7)
+
+    return database_file
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SeriesStore(str(tmp_path / "series.sqlite"))
+    yield store
+    store.close()
+
+
+def write(database_file, statement, parameters=()):
+    connection = sqlite3.connect(database_file)
+    connection.executemany(statement, parameters) if parameters else connection.execute(statement)
+    connection.commit()
+    connection.close()
+
+
+def append(database_file):
+    write(
+        database_file,
+        "INSERT INTO post VALUES (?, 'cid', '2024-11-01T00:00:00.000Z', ?, 'bro')",
+        [(f"at://did:plc:series/app.bsky.feed.post/{index}", text) for index, text in enumerate(APPENDED_TEXTS)],
+    )
+
+
+def update(database_file, store):
+    """Updates the store, then reads every category's hourly and weekly series back"""
+    connection = connect_read_only(database_file)
+    read = store.update(connection, "bro", CATEGORIES)
+    series = {
+        (category, bucket): store.get_series(connection, "bro", category, bucket)
+        for category in (POSTS, *CATEGORIES)
+        for bucket in ("hour", "week")
+    }
+    connection.close()
+
+    return read, series
+
+
+def count_bro(database_file):
+    connection = connect_read_only(database_file)
+    (count,) = connection.execute("SELECT COUNT(*) FROM post WHERE pronoun='bro'").fetchone()
+    connection.close()
+
+    return count
+
+
+def test_append_reads_only_new_posts(database_file, store, tmp_path):
+    update(database_file, store)
+    append(database_file)
+    read, series = update(database_file, store)
+    fresh = SeriesStore(str(tmp_path / "fresh.sqlite"))
+
+    assert read == len(APPENDED_TEXTS)
+    assert series == update(database_file, fresh)[1]
+
+    fresh.close()
+
+
+def test_unchanged_database_reads_nothing(database_file, store):
+    _, expected = update(database_file, store)
+
+    assert update(database_file, store) == (0, expected)
+
+
+@pytest.mark.parametrize("statement", [
+    "DELETE FROM post WHERE rowid=(SELECT MIN(rowid) FROM post WHERE pronoun='bro')",
+    "REPLACE INTO post SELECT * FROM post WHERE rowid=(SELECT MIN(rowid) FROM post WHERE pronoun='bro')",
+])
+def test_rewrite_below_mark_recounts(database_file, store, tmp_path, statement):
+    update(database_file, store)
+    write(database_file, statement)
+    read, series = update(database_file, store)
+    fresh = SeriesStore(str(tmp_path / "fresh.sqlite"))
+
+    assert read == count_bro(database_file)
+    assert series == update(database_file, fresh)[1]
+
+    fresh.close()
+
+
+def test_changed_pattern_recounts(database_file, store, tmp_path, monkeypatch):
+    update(database_file, store)
+    pattern, flags = src.cache.CATEGORY_PATTERNS["negation"]
+    monkeypatch.setitem(src.cache.CATEGORY_PATTERNS, "negation", (pattern.replace("uh", "ope"), flags))
+    read, series = update(database_file, store)
+    fresh = SeriesStore(str(tmp_path / "fresh.sqlite"))
+
+    assert read == count_bro(database_file)
+    assert series == update(database_file, fresh)[1]
+
+    fresh.close()
@@ -0,0 +1,128 @@
+import sqlite3
+import threading
+
+import pytest
+
+import summarize
+from benchmarks.generate import generate
+from src.client import RemoteCollection, ServiceClient
+from src.scanner import CATEGORY_PATTERNS
+from src.service import QueryService, make_server
+
+CATEGORIES = list(CATEGORY_PATTERNS)
+APPENDED_TEXTS = ["fuck no bro", "nah bro 😂", "yeah bro", "for bro, you", ""]
+
+
+@pytest.fixture
+def database_file(tmp_path):
+    database_file = str(tmp_path / "posts.sqlite")
+    generate(database_file, 1000, seed=9)
+
+    return database_file
+
+
+@pytest.fixture
+def service(database_file):
+    service = QueryService(database_file, ["bro"])
+    yield service
+    service.close()
+
+
+def write(database_file, statement, parameters=()):
+    connection = sqlite3.connect(database_file)
+    connection.executemany(statement, parameters) if parameters else connection.execute(statement)
+    connection.commit()
+    connection.close()
+
+
+def append(database_file):
+    write(
+        database_file,
+        "INSERT INTO post VALUES (?, 'cid', '2024-11-01T00:00:00.000Z', ?, 'bro')",
+        [(f"at://did:plc:service/app.bsky.feed.post/{index}", text) for index, text in enumerate(APPENDED_TEXTS)],
+    )
+
+
+def ask(service):
+    """Asks a service everything analyse.py and summarize.py ask for about bro"""
+    prepositions, personal_pronouns = ",".join(summarize.preposition_and_conjunction_list), ",".join(summarize.personal_pronoun_list)
+    answers = {"rows": service.answer("/rows", {"pronoun": "bro"})}
+
+    for category in CATEGORIES:
+        answers[category] = (
+            service.answer("/frequencies", {"pronoun": "bro", "category": category}),
+            service.answer("/rows", {"pronoun": "bro", "categories": category}),
+        )
+
+    answers["cooccurrence"] = service.answer("/cooccurrence", {"pronoun": "bro"})
+    answers["tally"] = service.answer("/tally", {"pronoun": "bro", "prepositions": prepositions, "personalPronouns": personal_pronouns})
+
+    return answers
+
+
+def ask_fresh(database_file):
+    service = QueryService(database_file, ["bro"])
+    answers = ask(service)
+    service.close()
+
+    return answers
+
+
+def test_append_reads_only_new_posts(database_file, service):
+    # the tally is asked for before the append, so it's updated rather than made afresh
+    ask(service)
+    append(database_file)
+
+    assert service.pronouns["bro"].refresh() == len(APPENDED_TEXTS)
+    assert ask(service) == ask_fresh(database_file)
+
+
+def test_unchanged_database_reads_nothing(database_file, service):
+    expected = ask(service)
+
+    assert service.pronouns["bro"].refresh() == 0
+    assert ask(service) == expected
+
+
+@pytest.mark.parametrize("statement", [
+    "DELETE FROM post WHERE rowid=(SELECT MIN(rowid) FROM post WHERE pronoun='bro')",
+    "REPLACE INTO post SELECT * FROM post WHERE rowid=(SELECT MIN(rowid) FROM post WHERE pronoun='bro')",
+])
+def test_rewrite_below_mark_reloads(database_file, service, statement):
+    ask(service)
+    write(database_file, statement)
+    (count,) = service.connection.execute("SELECT COUNT(*) FROM post WHERE pronoun='bro'").fetchone()
+
+    assert service.pronouns["bro"].refresh() == count
+    assert ask(service) == ask_fresh(database_file)
+
+
+def test_client_sees_appended_posts(database_file, tmp_path):
+    address = f"unix:{tmp_path / 'serve.sock'}"
+    servers = []
+    ready = threading.Event()
+
+    # the service's connection can only be used in the thread that opened it
+    def serve():
+        service = QueryService(database_file, ["bro"])
+        servers.append(make_server(service, address))
+        ready.set()
+        servers[0].serve_forever()
+        servers[0].server_close()
+        service.close()
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    ready.wait()
+
+    try:
+        client = ServiceClient(address)
+        before = len(RemoteCollection("bro", client).get_category_rows("profanity"))
+        append(database_file)
+        remote = RemoteCollection("bro", client)
+
+        assert len(remote.get_category_rows("profanity")) == before + 1
+        assert remote.get_category_frequencies("profanity") == ask_fresh(database_file)["profanity"][0]["frequencies"]
+    finally:
+        servers[0].shutdown()
+        thread.join()
@@ -0,0 +1,123 @@
+import os
+import sqlite3
+
+import pytest
+
+import src.cache
+import summarize
+from benchmarks.generate import generate
+from src.cache import ResultCache
+from src.database import connect_read_only
+from src.incremental import IncrementalStore
+from src.pronoun import PronounCollection
+from src.shards import ShardedCollection, shard_tally
+
+CATEGORIES = ["profanity", "negation", "affirmation", "emoji"]
+SHARD_COUNT = 3
+
+
+@pytest.fixture(scope="module")
+def database_files(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("shards")
+    database_file = str(directory / "posts.sqlite")
+    generate(database_file, 3000, seed=3)
+
+    connection = sqlite3.connect(database_file)
+    (schema,) = connection.execute("SELECT sql FROM sqlite_master WHERE name='post'").fetchone()
+    high_water = connection.execute("SELECT MAX(rowid) FROM post").fetchone()[0]
+    connection.close()
+
+    # each shard keeps its posts' rowids, so the rows read from the shards are the rows of the whole database
+    shard_files = []
+    for index in range(SHARD_COUNT):
+        shard_file = str(directory / f"shard-{index}.sqlite")
+        shard = sqlite3.connect(shard_file)
+        shard.execute(schema)
+        shard.execute("ATTACH DATABASE ? AS whole", (database_file,))
+        shard.execute(
+            "INSERT INTO post (rowid, uri, cid, indexedAt, text, pronoun) SELECT rowid, * FROM whole.post WHERE rowid > ? AND rowid <= ?",
+            (high_water * index // SHARD_COUNT, high_water * (index + 1) // SHARD_COUNT),
+        )
+        shard.commit()
+        shard.close()
+        shard_files.append(shard_file)
+
+    return database_file, shard_files
+
+
+def scan_whole(database_file, pronoun):
+    connection = connect_read_only(database_file)
+    scanners = PronounCollection(pronoun, connection).scan(CATEGORIES)
+    results = {category: (list(scanner.get_frequencies(category).items()), scanner.get_rows(category)) for category, scanner in scanners.items()}
+    connection.close()
+
+    return results
+
+
+def scan_shards(shard_files, pronoun, cache=None):
+    connections = {shard_file: connect_read_only(shard_file) for shard_file in shard_files}
+    scanners = ShardedCollection(pronoun, connections, cache=cache).scan(CATEGORIES)
+    results = {category: (list(scanner.get_frequencies(category).items()), scanner.get_rows(category)) for category, scanner in scanners.items()}
+
+    for connection in connections.values():
+        connection.close()
+
+    return results
+
+
+@pytest.mark.parametrize("pronoun", ["bro", "sis"])
+def test_sharded_scan_same_as_whole(database_files, pronoun):
+    database_file, shard_files = database_files
+
+    # frequencies are compared in order, so ties have to be merged the way one database orders them
+    assert scan_shards(shard_files, pronoun) == scan_whole(database_file, pronoun)
+
+
+def test_sharded_scan_with_evicting_cache(database_files, tmp_path):
+    database_file, shard_files = database_files
+    # small enough that every worker evicts what the others just stored
+    cache = ResultCache(str(tmp_path / "results"), max_bytes=1)
+    expected = scan_whole(database_file, "bro")
+
+    assert scan_shards(shard_files, "bro", cache) == expected
+    assert scan_shards(shard_files, "bro", cache) == expected
+
+
+def test_shard_tally_same_as_whole(database_files, tmp_path):
+    database_file, shard_files = database_files
+    pronouns = ["bro", "sis", "dude"]
+    tallies = shard_tally(shard_files, pronouns, summarize.preposition_and_conjunction_list, summarize.personal_pronoun_list, store=IncrementalStore(str(tmp_path / "incremental")))
+    connection = connect_read_only(database_file)
+
+    for pronoun in pronouns:
+        whole = summarize.get_discourse_tally(pronoun, connection)
+
+        assert tallies[pronoun].total == whole.total
+        assert tallies[pronoun].preposition_counts == whole.preposition_counts
+        assert tallies[pronoun].personal_pronoun_counts == whole.personal_pronoun_counts
+        assert tallies[pronoun].position_counts == whole.position_counts
+
+    connection.close()
+
+
+def test_evict_skips_entries_removed_by_another_process(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path / "results"), max_bytes=10 ** 6)
+    for index in range(3):
+        cache.put(f"key{index}", {"index": index})
+
+    listdir = os.listdir
+    remove = os.remove
+
+    def listdir_with_gone_entry(path):
+        return listdir(path) + ["gone.json"]
+
+    def remove_after_another_process(path):
+        remove(path)
+        remove(path)
+
+    monkeypatch.setattr(src.cache.os, "listdir", listdir_with_gone_entry)
+    monkeypatch.setattr(src.cache.os, "remove", remove_after_another_process)
+    cache.max_bytes = 0
+    cache.evict()
+
+    assert listdir(cache.directory) == []
@@ -0,0 +1,115 @@
+import sqlite3
+
+import pytest
+
+from benchmarks.generate import generate
+from src.cache import get_database_fingerprint
+from src.database import connect_read_only
+from src.indexes import create_indexes
+from src.pronoun import PronounCollection
+from src.rows import get_rows_query
+from src.snapshot import Snapshot, export_snapshot, load_snapshot
+
+CATEGORIES = ["profanity", "negation", "affirmation", "emoji"]
+# dates the snapshot has to give back exactly as the database holds them
+ODD_DATES = ["2024-11-01T12:00:00Z", "2024-11-01T12:00:00.123456Z", "2024-11-01 12:00:00", "yesterday", ""]
+
+
+def add_posts(database_file, dates):
+    connection = sqlite3.connect(database_file)
+    start = connection.execute("SELECT MAX(rowid) FROM post").fetchone()[0] or 0
+    connection.executemany(
+        "INSERT INTO post VALUES (?, 'cid', ?, 'fuck no bro 😂', 'bro')",
+        [(f"at://did:plc:snapshot/app.bsky.feed.post/{start + index}", date) for index, date in enumerate(dates)],
+    )
+    connection.commit()
+    connection.close()
+
+
+@pytest.fixture
+def database_file(tmp_path):
+    database_file = str(tmp_path / "posts.sqlite")
+    generate(database_file, 2000, seed=6)
+    add_posts(database_file, ODD_DATES)
+
+    return database_file
+
+
+@pytest.fixture
+def snapshot(database_file, tmp_path):
+    connection = connect_read_only(database_file)
+    export_snapshot(connection, "bro", str(tmp_path / "bro.snapshot"))
+    snapshot = Snapshot(str(tmp_path / "bro.snapshot"))
+    yield snapshot
+    snapshot.close()
+    connection.close()
+
+
+@pytest.fixture
+def connection(database_file):
+    connection = connect_read_only(database_file)
+    yield connection
+    connection.close()
+
+
+def test_rows_same_as_database(snapshot, connection):
+    rows = connection.execute(get_rows_query(connection), ("bro",)).fetchall()
+
+    assert list(snapshot) == rows
+    assert [snapshot[index] for index in (0, 7, -1)] == [rows[index] for index in (0, 7, -1)]
+    assert snapshot.get_rows_by_rowid([row[-1] for row in rows[::3]]) == rows[::3]
+    assert list(snapshot.select("uri", "text")) == [(row[0], row[3]) for row in rows]
+
+    with pytest.raises(KeyError):
+        snapshot.get_rows_by_rowid([rows[-1][-1] + 1])
+
+
+@pytest.mark.parametrize("keep_rows", [True, False])
+def test_collection_same_as_database(snapshot, connection, keep_rows):
+    from_snapshot = PronounCollection("bro", connection, snapshot=snapshot)
+    from_database = PronounCollection("bro", connection)
+    scanned = from_snapshot.scan(CATEGORIES, keep_rows=keep_rows)
+    expected = from_database.scan(CATEGORIES, keep_rows=keep_rows)
+
+    for category in CATEGORIES:
+        assert list(scanned[category].get_frequencies(category).items()) == list(expected[category].get_frequencies(category).items())
+        assert scanned[category].rowids[category] == expected[category].rowids[category]
+        assert scanned[category].get_rows(category) == expected[category].get_rows(category)
+
+    assert from_snapshot.get_frequency_dict(r"\b(bro|fuck)\b") == from_database.get_frequency_dict(r"\b(bro|fuck)\b")
+
+
+def test_unscanned_category_rows_same_as_database(snapshot, connection):
+    from_snapshot = PronounCollection("bro", connection, snapshot=snapshot)
+    from_database = PronounCollection("bro", connection)
+
+    assert list(from_snapshot.iter_category_rows("negation")) == list(from_database.iter_category_rows("negation"))
+
+
+@pytest.mark.parametrize("indexed", [False, True])
+def test_append_makes_snapshot_stale(database_file, tmp_path, indexed):
+    if indexed:
+        writer = sqlite3.connect(database_file)
+        create_indexes(writer)
+        writer.close()
+
+    connection = connect_read_only(database_file)
+    export_snapshot(connection, "bro", str(tmp_path / "bro.snapshot"))
+    fingerprint = get_database_fingerprint(connection, "bro")
+    connection.close()
+
+    # without an index on the pronoun, counting its posts would read the whole table
+    assert ("rows" in fingerprint) == indexed
+
+    connection = connect_read_only(database_file)
+    snapshot = load_snapshot(connection, "bro", str(tmp_path))
+    assert snapshot is not None
+    snapshot.close()
+    connection.close()
+
+    add_posts(database_file, ["2024-12-01T00:00:00.000Z"])
+    connection = connect_read_only(database_file)
+
+    assert load_snapshot(connection, "bro", str(tmp_path)) is None
+
+    connection.close()